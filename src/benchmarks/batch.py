@@ -0,0 +1,57 @@
+import os
+import json
+import time
+import asyncio
+from argparse import ArgumentParser
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Measure the searches, not the query caches
+os.environ["QUERY_CACHE_SIZE"] = "0"
+
+from rag import RAGExtractor
+from scheme.config import PathConfig
+from scheme.graph import TaskConfig
+
+
+path_config = PathConfig().prepare()
+
+
+async def main():
+    parser = ArgumentParser(description="Retrieval throughput of per-query invocations against the batched API")
+    parser.add_argument("--repeat", type=int, default=10, help="number of repetitions of the evaluation questions")
+    args = parser.parse_args()
+
+    with open(path_config.eval_set_path) as f:
+        queries = [pair["question"] for pair in json.load(f)] * args.repeat
+
+    # Retrieval only, from the cached index
+    task_config = TaskConfig(
+        summarize=False,
+        expand_query=False,
+        speculative_expansion=False,
+        verbose=False,
+        build_index=False,
+        update_index=False,
+        profile=False,
+        shards=None,
+    )
+    rag = RAGExtractor([], path_config, task_config)
+
+    start_time = time.perf_counter()
+    single = [await rag.ainvoke(query) for query in queries]
+    single_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    batched = await rag.abatch(queries)
+    batch_time = time.perf_counter() - start_time
+
+    print(f"Queries: {len(queries)}")
+    print(f"ainvoke: {len(queries) / single_time:>10.1f} queries/s")
+    print(f"abatch:  {len(queries) / batch_time:>10.1f} queries/s ({single_time / batch_time:.1f}x)")
+    print(f"Identical results: {single == batched}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
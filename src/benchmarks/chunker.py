@@ -0,0 +1,89 @@
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+from langchain_core.documents import Document
+
+from rag.ast_chunker import default_parsers, chunk_document
+
+
+# Repeated units of generated code per language, every one holds a few (nested) terminal nodes
+UNITS = {
+    "js": """
+export function handler{i}(event) {{
+    const value = event.value * {i};
+    if (value > 0) {{
+        return {{ id: {i}, value }};
+    }}
+    return null;
+}}
+
+class Model{i} {{
+    constructor() {{ this.id = {i}; }}
+}}
+""",
+    "py": """
+def handler_{i}(event):
+    value = event["value"] * {i}
+    if value > 0:
+        return {{"id": {i}, "value": value}}
+    return None
+
+
+class Model{i}:
+    def __init__(self):
+        self.id = {i}
+""",
+    "go": """
+func Handler{i}(value int) int {{
+    if value > 0 {{
+        return value * {i}
+    }}
+    return 0
+}}
+
+type Model{i} struct {{ ID int }}
+""",
+}
+
+
+def main():
+    parser = ArgumentParser(description="Chunking time of the AST chunker against the size of generated files")
+    parser.add_argument("--units", type=int, nargs="+", default=[250, 500, 1000, 2000, 4000, 8000], help="file sizes (repeated units)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs per file (the best one is reported)")
+    args = parser.parse_args()
+
+    print(f"{'language':<10}{'units':>8}{'size (KB)':>11}{'chunks':>9}{'time (ms)':>11}{'us/KB':>9}")
+    for ext, unit in UNITS.items():
+        if ext not in default_parsers():
+            print(f"{ext:<10}grammar package is not installed")
+            continue
+
+        sizes, times = [], []
+        for units in args.units:
+            doc = Document(
+                page_content="".join(unit.format(i=i) for i in range(units)),
+                metadata={"source": f"generated.{ext}"},
+            )
+
+            best = float("inf")
+            for _ in range(args.repeat):
+                start_time = time.perf_counter()
+                chunks = chunk_document(doc)
+                best = min(best, time.perf_counter() - start_time)
+
+            size = len(doc.page_content.encode()) / 1024
+            sizes.append(size)
+            times.append(best)
+            print(f"{ext:<10}{units:>8}{size:>11.0f}{len(chunks):>9}{1000 * best:>11.1f}{1e6 * best / size:>9.1f}")
+
+        # A slope of 1 on the log-log scale means linear scaling
+        slope = np.polyfit(np.log(sizes), np.log(times), 1)[0]
+        print(f"{ext:<10}scaling exponent: {slope:.2f}\n")
+
+
+if __name__ == "__main__":
+    main()
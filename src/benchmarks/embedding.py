@@ -0,0 +1,79 @@
+import time
+import asyncio
+from argparse import ArgumentParser
+
+import numpy as np
+from aiohttp import web, ClientSession
+from dotenv import load_dotenv
+load_dotenv()
+
+from langchain_openai import OpenAIEmbeddings
+
+from rag.embedding_scheduler import EmbeddingScheduler
+from benchmarks.fake_embeddings import make_app, fake_vector
+
+
+async def main():
+    parser = ArgumentParser(description="Throughput and fault handling of the `EmbeddingScheduler` against the stand-in embeddings API")
+    parser.add_argument("--url", default=None, help="base URL of a running stand-in (by default, one is started in-process)")
+    parser.add_argument("--texts", type=int, default=5000, help="number of embedded texts")
+    parser.add_argument("--batch_size", type=int, default=100, help="texts per request")
+    parser.add_argument("--in_flight", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="compared limits of concurrent requests")
+    parser.add_argument("--rate", type=float, default=20, help="client rate limit (requests/s, 0 for none)")
+    parser.add_argument("--burst", type=int, default=4, help="client burst size")
+    # Limits and faults of the in-process stand-in
+    parser.add_argument("--server_rate", type=float, default=20, help="requests accepted by the stand-in per second")
+    parser.add_argument("--server_in_flight", type=int, default=8, help="concurrent requests accepted by the stand-in")
+    parser.add_argument("--error_rate", type=float, default=0.05, help="probability of a 503 failure")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per request")
+    parser.add_argument("--dim", type=int, default=256, help="dimension of the vectors")
+    args = parser.parse_args()
+
+    runner = None
+    url = args.url
+    if url is None:
+        app = make_app(args.dim, args.latency, 0.001, args.server_rate, args.server_in_flight, args.error_rate, args.batch_size)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        url = f"http://127.0.0.1:{runner.addresses[0][1]}/v1"
+
+    texts = [f"def function_{i}(value):\n    return value * {i}\n" for i in range(args.texts)]
+    expected = np.vstack([fake_vector(text, args.dim) for text in texts])
+
+    print(f"{args.texts} texts in batches of {args.batch_size}, client rate {args.rate:g}/s (burst {args.burst})")
+    print(f"{'in flight':>9}{'texts/s':>10}{'requests':>10}{'retries':>9}{'throttled':>11}{'correct':>9}")
+    for in_flight in args.in_flight:
+        backend = OpenAIEmbeddings(
+            model="fake",
+            openai_api_base=url,
+            openai_api_key="none",
+            check_embedding_ctx_length=False,
+            max_retries=0,
+        )
+        scheduler = EmbeddingScheduler(
+            backend,
+            batch_size=args.batch_size,
+            max_in_flight=in_flight,
+            rate=args.rate,
+            burst=args.burst,
+            max_retries=10,
+        )
+
+        start_time = time.perf_counter()
+        vectors = np.asarray(await scheduler.aembed_documents(texts), dtype=np.float32)
+        wall_time = time.perf_counter() - start_time
+
+        correct = vectors.shape == expected.shape and np.allclose(vectors, expected, atol=1e-5)
+        print(f"{in_flight:>9}{args.texts / wall_time:>10.0f}{scheduler.requests:>10}{scheduler.retries:>9}{scheduler.throttled:>11}{str(correct):>9}")
+
+    async with ClientSession() as session:
+        async with session.get(url.removesuffix("/v1") + "/stats") as response:
+            print(f"Server: {await response.json()}")
+
+    if runner is not None:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+import time
+from argparse import ArgumentParser
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import torch
+import numpy as np
+from transformers import AutoModel, AutoTokenizer
+
+from rag.encoder import PretrainedEmbeddings
+from scheme.config import PathConfig, RAGConfig
+from utils.data import load_docs
+
+
+path_config, rag_config = PathConfig(), RAGConfig()
+
+
+def _per_document(tokenizer, model, device: torch.device, texts: list[str]) -> np.ndarray:
+    """
+    Reference path: the encoding before batching, one forward pass per document
+    and the mean of the last hidden state (a single text has no padding to mask).
+    """
+
+    vectors = []
+    for text in texts:
+        tokens = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
+        tokens = {key: val.to(device) for key, val in tokens.items()}
+        with torch.no_grad():
+            output = model(**tokens)
+        vectors.append(output.last_hidden_state.mean(dim=1).squeeze().cpu().numpy())
+
+    return np.vstack(vectors)
+
+
+def _measure(encode, texts: list[str]) -> tuple[float, np.ndarray]:
+    start_time = time.perf_counter()
+    vectors = encode(texts)
+    return len(texts) / (time.perf_counter() - start_time), vectors
+
+
+def main():
+    parser = ArgumentParser(description="Throughput of the local encoder (docs/sec)")
+    parser.add_argument("--model", default=rag_config.encoder, help="HuggingFace model to benchmark")
+    parser.add_argument("--batch_size", type=int, default=rag_config.encoder_batch_size)
+    parser.add_argument("--limit", type=int, default=512, help="number of repository documents to encode")
+    args = parser.parse_args()
+
+    texts = [d.page_content for d in load_docs(path_config)][:args.limit]
+    embeddings = PretrainedEmbeddings(args.model, batch_size=args.batch_size)
+    embeddings.encode(texts[:args.batch_size])  # warm-up
+
+    # The reference runs on its own copy of the model, on the same device
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    tokenizer, model = AutoTokenizer.from_pretrained(args.model), AutoModel.from_pretrained(args.model).to(device).eval()
+    _per_document(tokenizer, model, device, texts[:1])  # warm-up
+
+    baseline, expected = _measure(lambda t: _per_document(tokenizer, model, device, t), texts)
+    batched, vectors = _measure(embeddings.encode, texts)
+
+    print(f"Documents: {len(texts)} | model: {args.model} | batch size: {args.batch_size}")
+    print(f"Per-document: {baseline:.1f} docs/sec")
+    print(f"Batched:      {batched:.1f} docs/sec ({batched / baseline:.2f}x)")
+    print(f"Max abs. difference: {np.abs(vectors - expected).max():.2e}")
+
+
+if __name__ == "__main__":
+    main()
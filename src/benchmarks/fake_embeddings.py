@@ -0,0 +1,136 @@
+import time
+import base64
+import random
+import asyncio
+import hashlib
+from collections import Counter
+from argparse import ArgumentParser
+
+import numpy as np
+from aiohttp import web
+
+
+# Stand-in for the OpenAI-compatible embeddings API, point the RAG system at it with
+# `EMBEDDING_BASE_URL=http://127.0.0.1:<port>/v1`, so index builds can be tested against
+# rate limits and failures without costs or quotas of the provider
+
+
+def fake_vector(text: str, dim: int) -> np.ndarray:
+    # Deterministic unit vector of the text, so clients can verify the order of the results
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def make_app(
+    dim: int,
+    latency: float,
+    text_latency: float,
+    rate: float,
+    max_in_flight: int,
+    error_rate: float,
+    max_batch: int,
+    seed: int = 0,
+) -> web.Application:
+    """
+    Creates the stand-in embeddings endpoint. Requests above the rate or the concurrency limit are
+    rejected with `429` (and a `Retry-After` header), a share of the others fails with `503`.
+
+    Args:
+        dim (int): Dimension of the vectors.
+        latency (float): Seconds per request.
+        text_latency (float): Additional seconds per embedded text.
+        rate (float): Requests accepted per second (0 disables the limit).
+        max_in_flight (int): Number of concurrently processed requests (0 disables the limit).
+        error_rate (float): Probability of a `503` failure of an accepted request.
+        max_batch (int): Maximum number of texts per request, larger requests are rejected with `400`.
+        seed (int): Seed of the failures.
+
+    Returns:
+        web.Application: The application serving `POST /v1/embeddings` and `GET /stats`.
+    """
+
+    rng = random.Random(seed)
+    stats = Counter()
+    state = {"in_flight": 0, "tokens": float(max(rate, 1)), "updated": time.monotonic()}
+
+    def throttled() -> bool:
+        now = time.monotonic()
+        state["tokens"] = min(max(rate, 1), state["tokens"] + (now - state["updated"]) * rate)
+        state["updated"] = now
+
+        if max_in_flight and state["in_flight"] >= max_in_flight:
+            return True
+        if rate > 0:
+            if state["tokens"] < 1:
+                return True
+            state["tokens"] -= 1
+
+        return False
+
+    async def embeddings(request: web.Request) -> web.Response:
+        body = await request.json()
+        texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+        stats["requests"] += 1
+
+        if len(texts) > max_batch:
+            stats["400"] += 1
+            return web.json_response({"error": {"message": f"At most {max_batch} inputs per request"}}, status=400)
+
+        if throttled():
+            stats["429"] += 1
+            retry_after = 1 / rate if rate > 0 else latency
+            return web.json_response(
+                {"error": {"message": "Rate limit exceeded", "type": "rate_limit_exceeded"}},
+                status=429,
+                headers={"Retry-After": f"{retry_after:.3f}"},
+            )
+
+        state["in_flight"] += 1
+        try:
+            await asyncio.sleep(latency + text_latency * len(texts))
+        finally:
+            state["in_flight"] -= 1
+
+        if rng.random() < error_rate:
+            stats["503"] += 1
+            return web.json_response({"error": {"message": "Service unavailable"}}, status=503)
+
+        stats["200"] += 1
+        stats["texts"] += len(texts)
+
+        vectors = [fake_vector(text, dim) for text in texts]
+        if body.get("encoding_format") == "base64":
+            data = [base64.b64encode(vector.tobytes()).decode() for vector in vectors]
+        else:
+            data = [vector.tolist() for vector in vectors]
+
+        return web.json_response({
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": embedding} for i, embedding in enumerate(data)],
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": sum(len(t) // 4 for t in texts), "total_tokens": sum(len(t) // 4 for t in texts)},
+        })
+
+    async def get_stats(_: web.Request) -> web.Response:
+        return web.json_response(dict(stats))
+
+    app = web.Application()
+    app.add_routes([web.post("/v1/embeddings", embeddings), web.get("/stats", get_stats)])
+    return app
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Local stand-in for the OpenAI-compatible embeddings API")
+    parser.add_argument("--port", type=int, default=8002, help="port to listen on")
+    parser.add_argument("--dim", type=int, default=768, help="dimension of the vectors")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per request")
+    parser.add_argument("--text_latency", type=float, default=0.001, help="additional seconds per embedded text")
+    parser.add_argument("--rate", type=float, default=20, help="requests accepted per second, others get 429 (0 for no limit)")
+    parser.add_argument("--max_in_flight", type=int, default=8, help="concurrently processed requests, others get 429 (0 for no limit)")
+    parser.add_argument("--error_rate", type=float, default=0.02, help="probability of a 503 failure")
+    parser.add_argument("--max_batch", type=int, default=100, help="maximum number of texts per request")
+    args = parser.parse_args()
+
+    app = make_app(args.dim, args.latency, args.text_latency, args.rate, args.max_in_flight, args.error_rate, args.max_batch)
+    web.run_app(app, host="127.0.0.1", port=args.port)
@@ -0,0 +1,70 @@
+import json
+import time
+import asyncio
+from argparse import ArgumentParser
+
+from aiohttp import web
+
+
+# Stand-in for the OpenAI-compatible chat completions API, point the RAG system at it with
+# `LLM_BASE_URL=http://127.0.0.1:<port>/v1`, so load tests neither cost nor depend on the provider
+
+
+def make_app(latency: float, token_latency: float, tokens: int) -> web.Application:
+    """
+    Creates the stand-in LLM endpoint.
+
+    Args:
+        latency (float): Seconds before the first token.
+        token_latency (float): Seconds per generated token.
+        tokens (int): Number of generated tokens.
+
+    Returns:
+        web.Application: The application serving `POST /v1/chat/completions`.
+    """
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = "".join(str(message.get("content", "")) for message in body["messages"])
+        words = [f"token{i} " for i in range(tokens)]
+        header = {"id": "fake", "created": int(time.time()), "model": body.get("model", "fake")}
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": tokens, "total_tokens": len(prompt) // 4 + tokens}
+
+        await asyncio.sleep(latency)
+        if not body.get("stream"):
+            await asyncio.sleep(token_latency * tokens)
+            return web.json_response(header | {
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i, word in enumerate(words):
+            chunk = header | {
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(token_latency)
+
+        chunk = header | {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.add_routes([web.post("/v1/chat/completions", completions)])
+    return app
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Local stand-in for the OpenAI-compatible LLM API")
+    parser.add_argument("--port", type=int, default=8001, help="port to listen on")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--token_latency", type=float, default=0.01, help="seconds per generated token")
+    parser.add_argument("--tokens", type=int, default=64, help="number of generated tokens")
+    args = parser.parse_args()
+
+    web.run_app(make_app(args.latency, args.token_latency, args.tokens), host="127.0.0.1", port=args.port)
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+from argparse import ArgumentParser
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import faiss
+import numpy as np
+
+from rag._rag import make_embeddings
+from rag.index_factory import make_index
+from rag.ingest import ingest
+from scheme.config import PathConfig, RAGConfig
+
+
+path_config, rag_config = PathConfig().prepare(), RAGConfig()
+
+# Benchmarked index configurations (overrides of RAGConfig)
+CONFIGURATIONS = {
+    "flat":         {"index_type": "flat"},
+    "hnsw16":       {"index_type": "hnsw", "hnsw_m": 16},
+    "hnsw32":       {"index_type": "hnsw", "hnsw_m": 32},
+    "hnsw32_ef64":  {"index_type": "hnsw", "hnsw_m": 32, "hnsw_ef_construction": 80, "hnsw_ef_search": 64},
+    "hnsw32_sq8":   {"index_type": "hnsw_sq8", "hnsw_m": 32},
+    "hnsw32_pq":    {"index_type": "hnsw_pq", "hnsw_m": 32},
+    "ivf_flat":     {"index_type": "ivf_flat"},
+    "ivf_pq":       {"index_type": "ivf_pq"},
+}
+
+
+def _recall(relevant: list[str], retrieved: list[str]) -> float:
+    return sum(1 for e in relevant if e in retrieved) / len(relevant)
+
+
+def _top_sources(labels: np.ndarray, sources: list[str], k: int) -> list[str]:
+    # Deduplicate by source file, as the retriever does
+    return list(dict.fromkeys(sources[i] for i in labels if i != -1))[:k]
+
+
+def main():
+    parser = ArgumentParser(description="Build time, size, latency and Recall@10 of the FAISS index types")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGURATIONS), choices=list(CONFIGURATIONS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default=None, help="optional path of a JSON report")
+    args = parser.parse_args()
+
+    # Document vectors come from the embedding cache of the last index build
+    embeddings = make_embeddings(path_config)
+    documents = list(ingest(path_config, workers=args.workers))
+    vectors = np.asarray(embeddings.embed_documents([d.page_content for d in documents]), dtype=np.float32)
+    sources = [d.metadata["source"] for d in documents]
+    ids = np.arange(len(vectors), dtype=np.int64)
+
+    with open(path_config.eval_set_path) as f:
+        test_data = [(pair["files"], pair["question"]) for pair in json.load(f)]
+    queries = np.asarray([embeddings.embed_query(q) for _, q in test_data], dtype=np.float32)
+
+    print(f"Documents: {len(documents)} | queries: {len(queries)} | embedding cache misses: {embeddings.misses}\n")
+
+    exact, report = None, {}
+    for name in args.configs:
+        config = rag_config.model_copy(update=CONFIGURATIONS[name])
+
+        start_time = time.perf_counter()
+        index = make_index(vectors.shape[1], config, vectors)
+        index.add_with_ids(vectors, ids)
+        build_time = time.perf_counter() - start_time
+
+        latencies, labels = [], []
+        for query in queries:
+            start_time = time.perf_counter()
+            _, found = index.search(query[None], config.dense_k)
+            latencies.append(time.perf_counter() - start_time)
+            labels.append(found[0])
+
+        if exact is None:
+            exact = faiss.IndexFlatL2(vectors.shape[1])
+            exact.add(vectors)
+        _, exact_labels = exact.search(queries, config.dense_k)
+
+        report[name] = {
+            "build_s": build_time,
+            "index_bytes": int(faiss.serialize_index(index).nbytes),
+            "latency_ms_mean": 1000 * float(np.mean(latencies)),
+            "latency_ms_p95": 1000 * float(np.percentile(latencies, 95)),
+            "recall_at_10": float(np.mean([
+                _recall(relevant, _top_sources(found, sources, 10))
+                for (relevant, _), found in zip(test_data, labels)
+            ])),
+            "ann_recall": float(np.mean([
+                len(set(found) & set(truth)) / len(truth)
+                for found, truth in zip(labels, exact_labels)
+            ])),
+        }
+
+    print(f"{'config':<14}{'build (s)':>10}{'size (MB)':>11}{'mean (ms)':>11}{'p95 (ms)':>10}{'R@10':>7}{'ANN recall':>12}")
+    for name, r in report.items():
+        print(
+            f"{name:<14}{r['build_s']:>10.2f}{r['index_bytes'] / 2**20:>11.1f}"
+            f"{r['latency_ms_mean']:>11.3f}{r['latency_ms_p95']:>10.3f}"
+            f"{r['recall_at_10']:>7.3f}{r['ann_recall']:>12.3f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
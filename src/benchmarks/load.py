@@ -0,0 +1,65 @@
+import json
+import time
+import random
+import asyncio
+from collections import Counter
+from argparse import ArgumentParser
+
+import numpy as np
+from aiohttp import ClientSession
+
+from scheme.config import PathConfig
+
+
+path_config = PathConfig()
+
+
+async def main():
+    parser = ArgumentParser(description="Throughput and tail latency of the RAG server (`main.py --mode serve`)")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="address of the RAG server")
+    parser.add_argument("--endpoint", default="qa", choices=["qa", "retrieve"], help="queried endpoint")
+    parser.add_argument("--requests", type=int, default=500, help="total number of requests")
+    parser.add_argument("--concurrency", type=int, default=32, help="number of concurrent clients")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the question sampling")
+    args = parser.parse_args()
+
+    # Questions are sampled with repetition, so concurrent clients also send identical queries
+    with open(path_config.eval_set_path) as f:
+        questions = [pair["question"] for pair in json.load(f)]
+    rng = random.Random(args.seed)
+    queue = [rng.choice(questions) for _ in range(args.requests)]
+
+    latencies, statuses = [], Counter()
+
+    async def client(session: ClientSession):
+        while queue:
+            question = queue.pop()
+            start_time = time.perf_counter()
+            try:
+                async with session.post(f"{args.url}/{args.endpoint}", json={"question": question}) as response:
+                    await response.read()
+                    statuses[response.status] += 1
+            except Exception:
+                statuses["error"] += 1
+                continue
+
+            if response.status == 200:
+                latencies.append(time.perf_counter() - start_time)
+
+    async with ClientSession() as session:
+        start_time = time.perf_counter()
+        await asyncio.gather(*[client(session) for _ in range(args.concurrency)])
+        wall_time = time.perf_counter() - start_time
+
+        async with session.get(f"{args.url}/stats") as response:
+            stats = await response.json()
+
+    d = np.asarray(latencies or [0.0]) * 1000
+    print(f"Requests: {args.requests} ({args.concurrency} concurrent), statuses: {dict(statuses)}")
+    print(f"Throughput: {len(latencies) / wall_time:.1f} answered/s")
+    print(f"Latency (ms): mean {d.mean():.1f}, p50 {np.percentile(d, 50):.1f}, p95 {np.percentile(d, 95):.1f}, p99 {np.percentile(d, 99):.1f}")
+    print(f"Server: {stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import subprocess
+from pathlib import Path
+from argparse import ArgumentParser
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+SRC_ROOT = Path(__file__).resolve().parents[1]
+
+# Measured commands: the CLI help and the modules imported by the single modes
+TARGETS = {
+    "main.py --help": [(SRC_ROOT / "main.py").as_posix(), "--help"],
+    "retrieval (rag._rag)": ["-c", "import rag._rag"],
+    "ingestion (rag.ingest)": ["-c", "import rag.ingest"],
+    "evaluation": ["-c", "import evaluation"],
+    "server": ["-c", "import server"],
+}
+
+# Heavy packages, which must not be imported before the arguments are parsed
+HELP_FORBIDDEN = ["langchain_core", "langgraph", "langchain_openai", "faiss", "tree_sitter", "git", "matplotlib", "torch", "scipy"]
+
+
+def measure(args: list[str]) -> tuple[float, float, dict[str, tuple[int, int]]]:
+    """
+    Runs a command in a fresh interpreter with `-X importtime`.
+
+    Args:
+        args (list[str]): Interpreter arguments (script or `-c` command).
+
+    Returns:
+        tuple[float, float, dict[str, tuple[int, int]]]: Wall time and total import time in seconds
+            and the self and cumulative import time (us) of every imported module.
+    """
+
+    env = os.environ | {"PYTHONPATH": os.pathsep.join(filter(None, [SRC_ROOT.as_posix(), os.environ.get("PYTHONPATH")]))}
+
+    start_time = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], env=env, capture_output=True, text=True, check=True)
+    wall_time = time.perf_counter() - start_time
+
+    # Lines have the form "import time: <self us> | <cumulative us> | <indented module name>"
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        modules[name[1:].rstrip()] = (int(self_us), int(cumulative_us))
+
+    return wall_time, sum(s for s, _ in modules.values()) / 1e6, modules
+
+
+def main():
+    parser = ArgumentParser(description="Import time of the CLI and of the modules of the single modes")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs per command (the fastest one is reported)")
+    parser.add_argument("--top", type=int, default=8, help="number of listed (direct) imports per command")
+    parser.add_argument("--max_help_ms", type=float, default=150, help="regression threshold of the `--help` import time")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'command':<26}{'wall (ms)':>11}{'imports (ms)':>14}{'modules':>9}")
+    for target, command in TARGETS.items():
+        wall_time, import_time, modules = min((measure(command) for _ in range(args.repeat)), key=lambda run: run[1])
+        print(f"{target:<26}{1000 * wall_time:>11.0f}{1000 * import_time:>14.0f}{len(modules):>9}")
+
+        # Modules imported by the command and their direct imports (nesting is indented by two spaces), by cumulative time
+        direct = sorted(((c, name) for name, (_, c) in modules.items() if not name.startswith("    ")), reverse=True)
+        for cumulative_us, name in direct[:args.top]:
+            print(f"{'':<4}{name:<40}{cumulative_us / 1000:>8.1f} ms")
+
+        if command[-1] == "--help":
+            imported = {name.strip() for name in modules}
+            if forbidden := [p for p in HELP_FORBIDDEN if p in imported]:
+                failures.append(f"{target} imports {', '.join(forbidden)}")
+            if 1000 * import_time > args.max_help_ms:
+                failures.append(f"{target} imports take {1000 * import_time:.0f} ms (threshold {args.max_help_ms:g} ms)")
+
+    if failures:
+        print("\nREGRESSION: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
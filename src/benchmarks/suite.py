@@ -0,0 +1,334 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from importlib.metadata import version, PackageNotFoundError
+from argparse import ArgumentParser
+from typing import Any, Awaitable, Callable
+
+import numpy as np
+from aiohttp import web
+from dotenv import load_dotenv
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# The RAG system reads its configuration on import, it is pointed at a temporary workspace (synthetic
+# repository and fresh caches) and at the stand-in LLM, served in-process; caches of the results are disabled
+WORKSPACE = Path(tempfile.mkdtemp(prefix="coderag-suite-"))
+LLM_PORT = _free_port()
+os.environ.update({
+    "CODE_REPO_ROOT": (WORKSPACE / "repo").as_posix(),
+    "CACHE_ROOT": (WORKSPACE / "cache").as_posix(),
+    "EMBEDDINGS_ROOT": (WORKSPACE / "embeddings").as_posix(),
+    "LLM_CACHE_PATH": (WORKSPACE / "llm_cache.sqlite").as_posix(),
+    "LOGS_PATH": (WORKSPACE / "runs.jsonl").as_posix(),
+    "LLM_BASE_URL": f"http://127.0.0.1:{LLM_PORT}/v1",
+    "QUERY_CACHE_SIZE": "0",
+    "LLM_CACHE_SIZE": "0",
+})
+os.environ.setdefault("OPENROUTER_API_KEY", "offline")
+load_dotenv()
+
+from rag import RAGExtractor
+from rag.caches import LRUCache
+from rag.embedding_cache import CachedEmbeddings
+from rag.ast_chunker import get_chunks
+from rag.ingest import ingest
+from utils.data import load_docs
+from scheme.config import PathConfig, RAGConfig
+from scheme.graph import TaskConfig
+from benchmarks.fake_llm import make_app
+from benchmarks.synthetic import Query, HashEmbeddings, make_repository, parse_mix
+
+
+path_config, rag_config = PathConfig().prepare(), RAGConfig()
+
+# Timings, which differ from the baseline by less, are noise (seconds)
+MIN_DELTA = 0.02
+
+# Packages, whose versions change the timings or the recall (e.g. the HNSW graph of another faiss build)
+PACKAGES = ("faiss-cpu", "numpy", "langchain-community")
+
+
+def task_config(**overrides: Any) -> TaskConfig:
+    return TaskConfig(**{
+        "summarize": False,
+        "expand_query": False,
+        "speculative_expansion": False,
+        "verbose": False,
+        "build_index": False,
+        "update_index": False,
+        "profile": False,
+        "shards": None,
+    } | overrides)
+
+
+def make_embeddings(encoder: HashEmbeddings) -> CachedEmbeddings:
+    # A fresh (empty) cache, so every build embeds all documents
+    shutil.rmtree(path_config.embeddings_root, ignore_errors=True)
+    return CachedEmbeddings(
+        encoder,
+        model_id="hash",
+        cache_root=path_config.embeddings_root,
+        capacity=rag_config.embedding_cache_size,
+        query_cache=LRUCache(0, 0),
+        embed_queries=encoder.embed_documents,
+    )
+
+
+async def measure(stage: Callable[[], Any | Awaitable[Any]], repeat: int) -> tuple[list[float], Any]:
+    """
+    Times repeated runs of a benchmark stage.
+
+    Args:
+        stage (Callable[[], Any | Awaitable[Any]]): The stage, a function or a coroutine function.
+        repeat (int): Number of runs.
+
+    Returns:
+        tuple[list[float], Any]: Wall times of the runs in seconds and the result of the last run.
+    """
+
+    times, result = [], None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = stage()
+        if asyncio.iscoroutine(result):
+            result = await result
+        times.append(time.perf_counter() - start_time)
+
+    return times, result
+
+
+def summarize(times: list[float], items: int, unit: str, latencies: list[float] | None = None) -> dict[str, Any]:
+    result = {
+        "seconds": float(np.median(times)),
+        "min_seconds": min(times),
+        "max_seconds": max(times),
+        "items": items,
+        "unit": unit,
+        "per_second": items / float(np.median(times)),
+    }
+    if latencies:
+        result["p50_ms"] = float(np.percentile(latencies, 50) * 1000)
+        result["p95_ms"] = float(np.percentile(latencies, 95) * 1000)
+
+    return result
+
+
+def recall(queries: list[Query], retrieved: list[list[str]]) -> float:
+    return sum(q.source in files for q, files in zip(queries, retrieved)) / len(queries)
+
+
+async def run(args, queries: list[Query]) -> dict[str, dict[str, Any]]:
+    """
+    Measures the stages of the RAG system on the synthetic repository.
+
+    Args:
+        args (Namespace): Parsed command-line arguments.
+        queries (list[Query]): Questions about the repository.
+
+    Returns:
+        dict[str, dict[str, Any]]: Timings of every stage and the retrieval quality.
+    """
+
+    results = {}
+    questions = [q.question for q in queries]
+
+    times, documents = await measure(lambda: load_docs(path_config), args.repeat)
+    results["load_docs"] = summarize(times, len(documents), "files")
+
+    times, chunks = await measure(lambda: get_chunks(documents), args.repeat)
+    results["get_chunks"] = summarize(times, len(chunks), "chunks")
+
+    encoder = HashEmbeddings(args.dim, corpus=(doc.page_content for doc in documents))
+
+    def build() -> RAGExtractor:
+        shutil.rmtree(path_config.cache_root, ignore_errors=True)
+        path_config.cache_root.mkdir(parents=True)
+        docs_pool = ingest(path_config, workers=args.workers, chunk=True, symbols=True)
+        return RAGExtractor(docs_pool, path_config, task_config(build_index=True), embeddings=make_embeddings(encoder))
+
+    times, _ = await measure(build, args.repeat)
+    results["index_build"] = summarize(times, len(documents), "files")
+
+    embeddings = make_embeddings(encoder)
+    times, rag = await measure(lambda: RAGExtractor([], path_config, task_config(), embeddings=embeddings), args.repeat)
+    results["index_load"] = summarize(times, len(documents), "files")
+
+    latencies = []
+
+    def search_single() -> list[list[str]]:
+        retrieved = []
+        for question in questions:
+            start_time = time.perf_counter()
+            retrieved.append([d.metadata["source"] for d in rag.retriever.invoke(question)])
+            latencies.append(time.perf_counter() - start_time)
+        return retrieved
+
+    times, retrieved = await measure(search_single, args.repeat)
+    results["search_single"] = summarize(times, len(questions), "queries", latencies)
+    results["search_single"]["recall"] = recall(queries, retrieved)
+
+    times, batched = await measure(lambda: rag.retriever.batch_search(questions), args.repeat)
+    results["search_batch"] = summarize(times, len(questions), "queries")
+    results["search_batch"]["recall"] = recall(queries, [[d.metadata["source"] for d in docs] for docs in batched])
+
+    latencies = []
+
+    # Symbol lookup, search, context assembly and the summarization by the stand-in LLM
+    async def invoke() -> list[list[str]]:
+        retrieved = []
+        for question in questions:
+            start_time = time.perf_counter()
+            retrieved.append((await rag.ainvoke(question, task_config(summarize=True)))[1])
+            latencies.append(time.perf_counter() - start_time)
+        return retrieved
+
+    times, retrieved = await measure(invoke, args.repeat)
+    results["ainvoke"] = summarize(times, len(questions), "queries", latencies)
+    results["ainvoke"]["recall"] = recall(queries, retrieved)
+
+    return results
+
+
+def compare(results: dict[str, dict[str, Any]], baseline: dict[str, dict[str, Any]], tolerance: float) -> list[str]:
+    """
+    Prints the stages against the baseline and lists the regressions: stages slower by more than
+    the tolerance and stages with a lower recall. The fastest runs are compared, as they are the least
+    disturbed by other load on the machine; a slowdown within the spread of the baseline runs is noise.
+
+    Args:
+        results (dict[str, dict[str, Any]]): Current results.
+        baseline (dict[str, dict[str, Any]]): Baseline results.
+        tolerance (float): Accepted relative slowdown.
+
+    Returns:
+        list[str]: Descriptions of the regressions.
+    """
+
+    regressions = []
+    print(f"\n{'stage':<16}{'baseline (s)':>14}{'current (s)':>13}{'change':>9}")
+    for stage, result in results.items():
+        if stage not in baseline:
+            continue
+
+        before, after = baseline[stage]["min_seconds"], result["min_seconds"]
+        change = after / before - 1
+        slower = change > tolerance and after - before > MIN_DELTA and after > baseline[stage]["max_seconds"]
+        print(f"{stage:<16}{before:>14.3f}{after:>13.3f}{change:>+9.0%}{'  REGRESSION' if slower else ''}")
+
+        if slower:
+            regressions.append(f"{stage} is {change:.0%} slower")
+        if result.get("recall", 1.0) < baseline[stage].get("recall", 0.0) - 1e-9:
+            regressions.append(f"{stage} recall dropped from {baseline[stage]['recall']:.3f} to {result['recall']:.3f}")
+
+    return regressions
+
+
+def environment() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    packages = {}
+    for package in PACKAGES:
+        try:
+            packages[package] = version(package)
+        except PackageNotFoundError:
+            packages[package] = None
+
+    return {
+        "command": " ".join(["python -m benchmarks.suite", *sys.argv[1:]]),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        "packages": packages,
+        "config": rag_config.model_dump(mode="json", exclude={"api_key", "llm_base_url"}),
+    }
+
+
+async def main():
+    parser = ArgumentParser(description="End-to-end benchmark of the RAG system on a synthetic repository, offline")
+    parser.add_argument("--files", type=int, default=400, help="number of files of the synthetic repository")
+    parser.add_argument("--mix", default="py=0.4,js=0.3,go=0.2,md=0.1", help="shares of the file extensions (py, js, go, md)")
+    parser.add_argument("--units", type=int, nargs=2, default=[5, 40], help="minimum and maximum number of code units per file")
+    parser.add_argument("--queries", type=int, default=100, help="number of questions")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the repository and the questions")
+    parser.add_argument("--dim", type=int, default=768, help="dimension of the stand-in embeddings")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of ingestion processes")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs per stage (the median is reported)")
+    parser.add_argument("--output", default="data/benchmarks/latest.json", help="path of the JSON report")
+    parser.add_argument("--baseline", default="data/benchmarks/baseline.json", help="path of the baseline report")
+    parser.add_argument("--update_baseline", action="store_true", help="stores the report as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="accepted relative slowdown against the baseline")
+    args = parser.parse_args()
+
+    workload = {"files": args.files, "mix": args.mix, "units": args.units, "queries": args.queries, "seed": args.seed, "dim": args.dim}
+    queries = make_repository(path_config.code_repo_root, args.files, parse_mix(args.mix), tuple(args.units), args.queries, args.seed)
+
+    # Answers are returned immediately, the LLM stage measures the client and the prompt assembly
+    runner = web.AppRunner(make_app(latency=0.0, token_latency=0.0, tokens=16))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", LLM_PORT).start()
+    try:
+        results = await run(args, queries)
+    finally:
+        await runner.cleanup()
+        shutil.rmtree(WORKSPACE, ignore_errors=True)
+
+    print(f"{'stage':<16}{'seconds':>9}{'items':>8}{'':<8}{'per sec':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'recall':>8}")
+    for stage, result in results.items():
+        print(
+            f"{stage:<16}{result['seconds']:>9.3f}{result['items']:>8} {result['unit']:<7}{result['per_second']:>10.1f}"
+            f"{result.get('p50_ms', float('nan')):>10.2f}{result.get('p95_ms', float('nan')):>10.2f}{result.get('recall', float('nan')):>8.3f}"
+        )
+
+    report = {"environment": environment(), "workload": workload, "results": results}
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2))
+        print(f"\nStored the baseline: {baseline_path}")
+        return
+
+    if not baseline_path.exists():
+        print(f"\nNo baseline at {baseline_path}, store one with --update_baseline")
+        return
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline["workload"] != workload:
+        print(f"\nThe baseline was measured with another workload ({baseline['workload']}), it is not compared")
+        return
+    if baseline["environment"]["config"] != report["environment"]["config"]:
+        changed = sorted(k for k, v in report["environment"]["config"].items() if baseline["environment"]["config"].get(k) != v)
+        print(f"\nThe baseline was measured with another configuration ({', '.join(changed)}), it is not compared")
+        return
+    if baseline["environment"]["machine"] != report["environment"]["machine"]:
+        print(f"\nNOTE: the baseline was measured on another machine ({baseline['environment']['machine']})")
+    if baseline["environment"].get("packages") != report["environment"]["packages"]:
+        print(f"\nNOTE: the baseline was measured with other packages ({baseline['environment'].get('packages')})")
+
+    if regressions := compare(results, baseline["results"], args.tolerance):
+        print("\nREGRESSION: " + "; ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
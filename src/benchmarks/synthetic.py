@@ -0,0 +1,143 @@
+import math
+import random
+import hashlib
+from pathlib import Path
+from typing import Iterable, NamedTuple
+from collections import Counter
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils.text import tokenize
+from benchmarks.chunker import UNITS
+
+
+# Names of the handler defined by every unit of generated code
+HANDLER_NAMES = {"py": "handler_{i}", "js": "handler{i}", "go": "Handler{i}"}
+
+# Documentation files are noise to the questions, they share only their common words
+DOC_UNIT = """
+## Release {i}
+
+The release {i} of the package revised the scaling rules of the handlers and the defaults of the models.
+"""
+
+
+class Query(NamedTuple):
+    question: str
+    source: str
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """
+    Parses a language mix, e.g. "py=0.5,js=0.3,md=0.2" (the shares are normalized).
+
+    Args:
+        mix (str): Comma separated shares of the file extensions.
+
+    Returns:
+        dict[str, float]: Share of every extension.
+    """
+
+    shares = {ext.strip(): float(share) for ext, share in (part.split("=") for part in mix.split(","))}
+    if unknown := shares.keys() - HANDLER_NAMES.keys() - {"md"}:
+        raise ValueError(f"Unsupported extensions: {', '.join(sorted(unknown))}")
+
+    total = sum(shares.values())
+    return {ext: share / total for ext, share in shares.items()}
+
+
+def make_repository(
+    root: Path,
+    files: int,
+    mix: dict[str, float],
+    units: tuple[int, int] = (5, 40),
+    queries: int = 100,
+    seed: int = 0,
+) -> list[Query]:
+    """
+    Writes a synthetic repository of generated source files and samples questions about it.
+    Every code unit defines a handler with a unique number, half of the questions name the handler
+    (`code span`), the other half describe it in prose; the defining file is the expected answer.
+
+    Args:
+        root (Path): Directory of the repository (created).
+        files (int): Number of files.
+        mix (dict[str, float]): Share of every file extension (see `parse_mix`).
+        units (tuple[int, int]): Minimum and maximum number of units per file.
+        queries (int): Number of sampled questions.
+        seed (int): Seed of the generator.
+
+    Returns:
+        list[Query]: Questions with the file defining the asked handler.
+    """
+
+    rng = random.Random(seed)
+    extensions = rng.choices(list(mix), weights=list(mix.values()), k=files)
+    packages = max(files // 50, 1)
+
+    handlers = []
+    for f, ext in enumerate(extensions, start=1):
+        # Unit numbers are unique (and longer than a single digit, so they are searchable terms)
+        numbers = [1000 * f + u for u in range(rng.randint(*units))]
+        rel_path = f"src/pkg{f % packages}/sub{f % 7}/module{f}.{ext}"
+        template = DOC_UNIT if ext == "md" else UNITS[ext]
+
+        f_path = root / rel_path
+        f_path.parent.mkdir(parents=True, exist_ok=True)
+        f_path.write_text("".join(template.format(i=i) for i in numbers))
+
+        if ext != "md":
+            handlers.extend((HANDLER_NAMES[ext].format(i=i), i, rel_path) for i in numbers)
+
+    sampled = rng.sample(handlers, min(queries, len(handlers)))
+    return [
+        Query(f"Where is `{name}` defined?", source) if k % 2 == 0
+        else Query(f"Which handler multiplies event values by {i}?", source)
+        for k, (name, i, source) in enumerate(sampled)
+    ]
+
+
+class HashEmbeddings(Embeddings):
+    """
+    HashEmbeddings is a deterministic offline stand-in for the embeddings API, a hashing TF-IDF vectorizer.
+    The terms of a text (see `tokenize`) are hashed into the dimensions of a signed vector and weighted
+    by their inverse document frequency in a corpus (e.g. the synthetic repository), so texts sharing
+    rare terms get similar vectors and the retrieval results are meaningful. Without a corpus, all terms weigh the same.
+    """
+
+    def __init__(self, dim: int = 256, corpus: Iterable[str] = ()):
+        """
+        Initializes the stand-in.
+
+        Args:
+            dim (int): Dimension of the vectors.
+            corpus (Iterable[str]): Texts the document frequencies of the terms are counted in.
+        """
+
+        self._dim = dim
+        self._frequencies = Counter()
+        self._documents = 0
+        for text in corpus:
+            self._frequencies.update(set(tokenize(text)))
+            self._documents += 1
+
+    def _vector(self, text: str) -> list[float]:
+        vector = np.zeros(self._dim, dtype=np.float32)
+        for term, count in Counter(tokenize(text)).items():
+            # Terms outside of the corpus (e.g. words of a question) carry no information
+            if self._documents and term not in self._frequencies:
+                continue
+
+            idf = math.log((1 + self._documents) / (1 + self._frequencies[term])) + 1
+            h = int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "little")
+            vector[h % self._dim] += (1 if h >> 63 else -1) * (1 + math.log(count)) * idf
+
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._vector(text)
@@ -1,8 +1,9 @@
 import json
 import time
+import asyncio
+from datetime import datetime, timezone
 
-import matplotlib.pyplot as plt
-from matplotlib.patches import Patch
+import numpy as np
 
 from scheme.config import PathConfig
 from scheme.ranker import Ranker
@@ -51,9 +52,15 @@ class Evaluator:
         Generates a tradeoff plot based on cached run logs.
         """
 
+        # Plotting is the only use of matplotlib, which is slow to import
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Patch
+
         with open(self._config.logs_path) as f:
-            logs = [line.strip().split(", ") for line in f.readlines()]
-            slugs, quality, time = zip(*logs)
+            runs = [json.loads(line) for line in f if line.strip()]
+            slugs = [run["note"] for run in runs]
+            quality = [run["recall"] for run in runs]
+            time = [run["latency"]["mean"] for run in runs]
 
         labels = sorted(set(slugs))
         colors = plt.cm.tab20.colors
@@ -85,40 +92,135 @@ class Evaluator:
         plt.savefig(self._config.plot_path)
 
 
-    async def test(self, ranker: Ranker, *, note: str = "RAG run", verbose: bool = False):
+    async def _run_query(
+        self,
+        ranker: Ranker,
+        relevant: list[str],
+        query: str,
+        semaphore: asyncio.Semaphore,
+    ) -> dict:
+        """
+        Runs a single evaluation query, once the semaphore admits it.
+
+        Args:
+            ranker (Ranker): The ranker used for retrieving relevant files.
+            relevant (list[str]): List of relevant file paths.
+            query (str): The evaluation question.
+            semaphore (asyncio.Semaphore): Semaphore bounding the number of concurrent queries.
+
+        Returns:
+            dict: Record of the query with its recall and latency.
+        """
+
+        async with semaphore:
+            start_time = time.perf_counter()
+            _, retrieved = await ranker.ainvoke(query)
+            latency = time.perf_counter() - start_time
+
+        return {
+            "question": query,
+            "relevant": relevant,
+            "retrieved": retrieved[:10],
+            "recall": self._quality_metric(relevant, retrieved[:10]),
+            "latency": latency,
+        }
+
+    async def test(
+        self,
+        ranker: Ranker,
+        *,
+        note: str = "RAG run",
+        concurrency: int = 1,
+        verbose: bool = False,
+    ) -> dict:
         """
         Tests the RAG system using the evaluation dataset and calculates metrics.
+        At most `concurrency` queries are in flight at once.
 
         Args:
             ranker (Ranker): The ranker used for retrieving relevant files.
             note (str): A note to include in the log file for this test run.
+            concurrency (int): Maximum number of concurrently evaluated queries.
             verbose (bool): If True, prints detailed metrics for each query.
 
+        Returns:
+            dict: The run record.
+
         Logs:
-            Prints & writes the average quality and time metrics to the log file.
+            Prints & appends the run record (metrics, latency percentiles, throughput
+            and per-query records) as a JSON line to the log file.
         """
-        quality_sum, time_sum = 0.0, 0.0
-
-        # TODO: progress
-        for relevant, query in self._test_data:
-            start_time = time.perf_counter()
-            _, retrieved = await ranker.ainvoke(query)
 
-            time_sum += time.perf_counter() - start_time
-            quality_sum += self._quality_metric(relevant, retrieved[:10])
+        from tqdm import tqdm
 
-            if verbose:
-                print(f"Recall: {self._quality_metric(relevant, retrieved[:10])}")
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = [
+            asyncio.ensure_future(self._run_query(ranker, relevant, query, semaphore))
+            for relevant, query in self._test_data
+        ]
 
-        quality_avg = quality_sum / len(self._test_data)
-        time_avg = time_sum / len(self._test_data)
+        start_time = time.perf_counter()
+        try:
+            with tqdm(total=len(tasks), desc=note, unit="query") as progress:
+                for task in asyncio.as_completed(tasks):
+                    record = await task
+                    progress.update()
+
+                    if verbose:
+                        progress.write(f"Recall: {record['recall']} | Time: {record['latency']:.3f}")
+        finally:
+            # A failed (or cancelled) run must not leave the other queries running
+            unfinished = [task for task in tasks if not task.done()]
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+        wall_time = time.perf_counter() - start_time
+
+        # Records are kept in the order of the evaluation set
+        records = [task.result() for task in tasks]
+        latencies = np.asarray([r["latency"] for r in records])
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+
+        run = {
+            "note": note,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "concurrency": concurrency,
+            "recall": float(np.mean([r["recall"] for r in records])),
+            "latency": {
+                "mean": float(latencies.mean()),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+            },
+            "wall_time": wall_time,
+            "throughput": len(records) / wall_time,
+            "queries": records,
+        }
 
         # Log the results to the specified log file
         with open(self._config.logs_path, "a") as f:
-            f.write(f"{note}, {quality_avg}, {time_avg}\n")
+            f.write(json.dumps(run) + "\n")
+
+        print(f"\nMeasured metrics (query averaged, concurrency {concurrency})")
+        print(f"Retrieval quality: {run['recall']} | Time: {run['latency']['mean']}")
+        print(f"Latency p50/p95/p99: {p50:.3f} / {p95:.3f} / {p99:.3f} s | Throughput: {run['throughput']:.2f} queries/s\n")
+
+        return run
+
+    @staticmethod
+    def tradeoff(runs: list[dict]):
+        """
+        Prints the quality and latency of a series of runs (e.g. of different reranking budgets) side by side.
+
+        Args:
+            runs (list[dict]): Run records, as returned by `test`.
+        """
 
-        print(f"\nMeasured metrics (query averaged)")
-        print(f"Retrieval quality: {quality_avg} | Time: {time_avg}\n")
+        print(f"{'run':<32}{'recall':>8}{'mean (s)':>10}{'p50 (s)':>9}{'p95 (s)':>9}")
+        for run in runs:
+            latency = run["latency"]
+            print(f"{run['note']:<32}{run['recall']:>8.3f}{latency['mean']:>10.3f}{latency['p50']:>9.3f}{latency['p95']:>9.3f}")
 
 
 if __name__ == "__main__":
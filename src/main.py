@@ -1,58 +1,140 @@
+import os
+import cProfile
 from asyncio import get_event_loop
 from argparse import ArgumentParser, Namespace
 
-from git import Repo
 from dotenv import load_dotenv
 load_dotenv()
 
-from rag import RAGExtractor
-from rag.ast_chunker import get_chunks
-from utils.data import load_docs
-from evaluation import Evaluator
-from scheme.config import PathConfig, RAGConfig
-from scheme.graph import TaskConfig
-
-
-path_config, rag_config = PathConfig(), RAGConfig()
 
 parser = ArgumentParser()
-parser.add_argument("--mode", default="qa", help="determine RAG inference mode", choices=["qa", "evaluate"])
+parser.add_argument("--mode", default="qa", help="determine RAG inference mode", choices=["qa", "evaluate", "serve"])
+parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes for reading and chunking the documents")
+parser.add_argument("--concurrency", type=int, default=4, help="number of concurrently evaluated queries")
+parser.add_argument("--port", type=int, default=8080, help="port of the HTTP endpoint in serve mode")
 parser.add_argument("--verbose", action="store_true", help="sets verbosity for RAG interactions")
 parser.add_argument("--expand_query", action="store_true", help="enables query expansion by LLM")
+parser.add_argument("--speculative_expansion", action="store_true", help="retrieves on the raw question while the query is expanded by LLM")
 parser.add_argument("--build_index", action="store_true", help="builds (new) vectore store index for the documents pool")
+parser.add_argument("--update_index", action="store_true", help="incrementally updates the cached index with the changed documents")
+parser.add_argument("--shards", nargs="+", default=None, help="restricts the queries and (re-)indexing to the given repositories of GIT_REPOS")
+parser.add_argument("--rerank_budgets", type=float, nargs="+", default=None, help="evaluates every given reranking budget (seconds per query, RERANK=true)")
+parser.add_argument("--profile", action="store_true", help="prints per-stage timings of the answered queries")
+parser.add_argument("--profile_dump", default=None, help="writes a cProfile dump of the run to the given path")
 args = parser.parse_args()
 
+# The arguments are parsed first, so `--help` does not wait for the imports; modules of a single mode are imported on use
+from rag import RAGExtractor
+from rag.ingest import ingest
+from rag.tracing import format_report
+from scheme.config import PathConfig, RAGConfig
+from scheme.graph import TaskConfig
+
+
+path_config, rag_config = PathConfig().prepare(), RAGConfig()
+
 
 async def main(args: Namespace):
-    if not path_config.code_repo_root.exists():
+    # Every repository of GIT_REPOS is cloned and indexed separately, as a shard
+    shards = rag_config.shards
+    for name, url in shards.items():
+        if not path_config.shard(name).code_repo_root.exists():
+            from git import Repo
+
+            print(f"Cloning {name} for the RAG system...")
+            Repo.clone_from(url, path_config.shard(name).code_repo_root)
+
+    if not shards and not path_config.code_repo_root.exists():
+        from git import Repo
+
         print(f"Cloning the codebase for the RAG system...")
         Repo.clone_from(rag_config.target_repo, path_config.code_repo_root)
 
     mode = args.__dict__.pop("mode")
+    workers = args.__dict__.pop("workers")
+    concurrency = args.__dict__.pop("concurrency")
+    port = args.__dict__.pop("port")
+    rerank_budgets = args.__dict__.pop("rerank_budgets")
     task_config = TaskConfig(**args.__dict__, summarize=(mode == "qa"))
-    documents = load_docs(path_config, args.verbose)
-    # NOTE: uncomment the following line to chunk the documents with AST strategy
-    # documents = await get_chunks(documents)
+
+    # NOTE: set chunk=True to chunk the documents with AST strategy
+    # Documents are streamed lazily, they are only read if the index is (re-)built
+    # Symbols are always extracted, so the symbol routing can be enabled without rebuilding the index
+    if shards:
+        documents = {
+            name: ingest(
+                path_config.shard(name),
+                workers=workers,
+                chunk=False,
+                symbols=True,
+                verbose=args.verbose,
+            )
+            for name in shards
+        }
+    else:
+        documents = ingest(path_config, workers=workers, chunk=False, symbols=True, verbose=args.verbose)
 
     rag = RAGExtractor(documents, path_config, task_config)
+    if rerank_budgets and rag.reranker is None:
+        raise ValueError("Reranking budgets can only be evaluated with reranking enabled (RERANK=true)")
     match mode:
         case "qa":
             try:
                 while True:
                     query = input("[ Q ]: ")
-                    response, retrived = await rag.ainvoke(query)
 
-                    print(f"\nRETRIEVED ITEMS: {retrived}\n")
-                    print(f"[ A ]:\n{response}\n")
+                    # Sources arrive after the retrieval, the answer is printed as it is generated
+                    async for kind, value in rag.astream(query):
+                        if kind == "sources":
+                            print(f"\nRETRIEVED ITEMS: {value}\n")
+                            print(f"[ A ]:")
+                        else:
+                            print(value, end="", flush=True)
+
+                    print("\n")
+
+                    if task_config.profile:
+                        print(f"{format_report([rag.traces[-1]])}\n")
             except:
                 pass
         case "evaluate":
+            from evaluation import Evaluator
+
             eval = Evaluator(path_config)
-            await eval.test(rag, note="test run", verbose=args.verbose)
+            if not rerank_budgets:
+                await eval.test(rag, note="test run", concurrency=concurrency, verbose=args.verbose)
+            else:
+                from rag.graph_builder import llm_cache
+
+                # The same queries are answered with every budget (in the given order), each run starts with cold
+                # query caches and bypasses the LLM response cache, so the runs differ only in the reranking
+                runs = []
+                with llm_cache.bypassed():
+                    for budget in rerank_budgets:
+                        rag.clear_caches()
+                        rag.reranker.budget = budget
+                        runs.append(await eval.test(rag, note=f"rerank budget {budget:g}s", concurrency=concurrency, verbose=args.verbose))
+
+                Evaluator.tradeoff(runs)
+
+            if task_config.profile:
+                print(format_report(rag.traces))
+        case "serve":
+            from server import serve
+
+            await serve(rag, task_config, port=port)
         case _:
             raise ValueError("Invalid mode argument.")
 
 
 if __name__ == "__main__":
+    profile_dump = args.__dict__.pop("profile_dump")
+
     loop = get_event_loop()
-    loop.run_until_complete( main(args) )
+    if profile_dump is None:
+        loop.run_until_complete( main(args) )
+    else:
+        # NOTE: inspect the dump with `snakeviz` or render a flamegraph with `flameprof`
+        with cProfile.Profile() as profiler:
+            loop.run_until_complete( main(args) )
+        profiler.dump_stats(profile_dump)
@@ -1 +1,8 @@
-from ._rag import RAGExtractor
\ No newline at end of file
+# The extractor (and with it FAISS, LangChain and LangGraph) is imported on first access,
+# so the lighter modules of the package (e.g. the ingestion workers) start quickly
+def __getattr__(name: str):
+    if name == "RAGExtractor":
+        from ._rag import RAGExtractor
+        return RAGExtractor
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,122 +1,765 @@
+import time
+import asyncio
+from functools import partial
+from collections import deque
+from typing import AsyncIterator, Iterable, Iterator, Literal
+
 import faiss
-from langchain.retrievers import EnsembleRetriever
-from langchain_community.retrievers import BM25Retriever
+import numpy as np
 from langchain_community.vectorstores import FAISS
-from langchain_community.docstore import InMemoryDocstore
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
-from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
 
 from scheme.config import PathConfig, RAGConfig
 from scheme.graph import TaskConfig
-from .graph_builder import build_graph
+from utils.prompts import clear_region_cache
+from .graph_builder import build_graph, expand_queries, answer_questions, search_kwargs, match_symbols, seed_sources, speculative_search
+from .embedding_cache import CachedEmbeddings
+from .embedding_scheduler import EmbeddingScheduler
+from .sparse import SparseIndex, SparseIndexBuilder
+from .hybrid import HybridRetriever
+from .shards import ShardedRetriever
+from .hierarchy import FileIndex, FileIndexBuilder
+from .symbols import SymbolIndex, SymbolIndexBuilder
+from .index_factory import make_index, configure_index, needs_training
+from .manifest import IndexManifest, hash_sources, current_commit, changed_paths
+from .caches import LRUCache
+from .tracing import Span, collect, span, record
+from .dense_store import create_dense_store, load_dense_store, save_dense_store, dense_store_exists, index_version, IndexCheckpoint
 
 
 # Load global configuration for the RAG system
 config = RAGConfig()
 
+# Number of kept traces, a long-running server must not collect them without bound
+MAX_TRACES = 10_000
+
+# Settings the stored vectors and the index structure depend on, checkpoints of other settings are not resumed
+_INDEX_SETTINGS = {"encoder", "embedding_model", "embedding_base_url", "index_type", "hnsw_m", "hnsw_ef_construction", "ivf_nlist", "pq_m"}
+
+
+def make_embeddings(path_config: PathConfig) -> CachedEmbeddings:
+    """
+    Creates the (cached) embedding model used for indexing and retrieval.
+
+    Args:
+        path_config (PathConfig): Configuration for file paths and cache locations.
+
+    Returns:
+        CachedEmbeddings: The embedding model.
+    """
+
+    # NOTE: uncomment lines below for alternative pretrained embeddings
+    # encoder = PretrainedEmbeddings(config.encoder)
+    # return CachedEmbeddings(
+    #     encoder,
+    #     model_id=config.encoder,
+    #     cache_root=path_config.embeddings_root,
+    #     capacity=config.embedding_cache_size,
+    #     query_cache=LRUCache(config.query_cache_size, config.query_cache_ttl),
+    #     embed_queries=encoder.embed_documents,
+    # )
+
+    if config.embedding_base_url:
+        # OpenAI-compatible embeddings API, e.g. the local stand-in `benchmarks.fake_embeddings`;
+        # failed requests are retried by the scheduler, not by the client
+        from langchain_openai import OpenAIEmbeddings
+
+        encoder = OpenAIEmbeddings(
+            model=config.embedding_model,
+            openai_api_base=config.embedding_base_url,
+            openai_api_key=config.api_key,
+            check_embedding_ctx_length=False,
+            max_retries=0,
+        )
+        embed_queries = encoder.embed_documents
+    else:
+        # The Google client (gRPC) is imported only when the embeddings are needed
+        from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
+
+        encoder = GoogleGenerativeAIEmbeddings(model=config.embedding_model)
+        # Queries are embedded with the query task type, as `embed_query` does
+        embed_queries = partial(encoder.embed_documents, task_type="RETRIEVAL_QUERY")
+
+    # Documents missing in the cache are embedded with concurrent, rate-limited batch requests
+    scheduler = EmbeddingScheduler(
+        encoder,
+        batch_size=config.embed_batch_size,
+        max_in_flight=config.embed_max_in_flight,
+        rate=config.embed_rate,
+        burst=config.embed_burst,
+        max_retries=config.embed_max_retries,
+        backoff=config.embed_backoff,
+    )
+
+    return CachedEmbeddings(
+        scheduler,
+        model_id=config.embedding_model,
+        cache_root=path_config.embeddings_root,
+        capacity=config.embedding_cache_size,
+        query_cache=LRUCache(config.query_cache_size, config.query_cache_ttl),
+        embed_queries=embed_queries,
+    )
+
 
 class RAGExtractor:
     """
     RAGExtractor is responsible for performing hybrid retrieval and query answering.
-    It combines dense vector search and BM25-based keyword search using an ensemble retriever.
+    It combines dense vector search and BM25-based keyword search using a hybrid retriever.
     """
 
     def __init__(
         self,
-        docs_pool: list[Document],
+        docs_pool: Iterable[Document] | dict[str, Iterable[Document]],
         path_config: PathConfig,
         task_config: TaskConfig,
+        embeddings: CachedEmbeddings | None = None,
     ):
         """
         Initializes the RAGExtractor.
 
         Args:
-            docs_pool (list[Document]): Pool of documents to be indexed and retrieved.
+            docs_pool (Iterable[Document] | dict[str, Iterable[Document]]): Pool of documents to be indexed
+                and retrieved, or the pools of multiple repositories keyed by their shard names.
+                It is consumed lazily, only when the index is (re-)built.
             path_config (PathConfig): Configuration for file paths and cache locations.
             task_config (TaskConfig): Configuration for retrieval tasks and indexing.
+            embeddings (CachedEmbeddings | None): Embedding model (see `make_embeddings`, if None),
+                e.g. an offline stand-in for benchmarks.
         """
 
         self._config = path_config
         self._task_config = task_config
 
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-        # NOTE: uncomment lines below for alternative pretrained embeddings
-        # embeddings = PretrainedEmbeddings(config.encoder)
+        # Spans of the (most recently) answered queries, collected only if profiling is enabled
+        self.traces: deque[list[Span]] = deque(maxlen=MAX_TRACES)
 
-        bm25_retriever = BM25Retriever.from_texts(
-            [d.page_content for d in docs_pool],
-            metadatas=[d.metadata for d in docs_pool],
-        )
-        bm25_retriever.k = 10
+        if embeddings is None:
+            embeddings = make_embeddings(path_config)
+        self._embeddings = embeddings
 
-        if not self._task_config.build_index:
-            assert \
-                (path_config.cache_root / "index.faiss").exists(),\
-                "Dense vectorS store cache does not exist. Build the index first."
+        if isinstance(docs_pool, dict):
+            # Every repository is indexed in its own shard, (re-)indexing is limited to the selected ones
+            if unknown := set(task_config.shards or ()) - docs_pool.keys():
+                raise ValueError(f"Unknown shards: {', '.join(sorted(unknown))}")
 
-            dense_store = FAISS.load_local(
-                path_config.cache_root.as_posix(),
-                embeddings,
-                allow_dangerous_deserialization=True,
+            shards = {
+                name: self._open_retriever(
+                    pool,
+                    path_config.shard(name),
+                    embeddings,
+                    indexing=not task_config.shards or name in task_config.shards,
+                )
+                for name, pool in docs_pool.items()
+            }
+            self._retriever = ShardedRetriever(
+                shards=shards,
+                k=config.candidate_k,
+                dense_k=max(config.dense_k, config.candidate_k),
+                sparse_k=config.sparse_k,
+                dense_weight=config.dense_weight,
+                sparse_weight=config.sparse_weight,
+                fusion=config.fusion,
+                cache=LRUCache(config.query_cache_size, config.query_cache_ttl),
+                index_version=",".join(f"{name}:{shard.index_version}" for name, shard in shards.items()),
             )
+        elif task_config.shards:
+            raise ValueError("Shards can only be selected for multiple repositories (GIT_REPOS)")
         else:
-            dense_store = self._build_dense_store(docs_pool, embeddings)
-
-        # NOTE: uncomment lines below for hybrid retrieval
-        self._retriever = EnsembleRetriever(
-            retrievers=[
-                dense_store.as_retriever(search_kwargs={"k": 10}),
-                # bm25_retriever,
-            ],
-            # weights=[0.5, 0.5],
-        )
+            self._retriever = self._open_retriever(docs_pool, path_config, embeddings)
+
+        if self._task_config.verbose:
+            print(f"Embedding cache: {embeddings.hits} hits, {embeddings.misses} misses")
+
+        # NOTE: set RERANK=true to rescore a wider candidate set with a cross-encoder (imports torch)
+        self.reranker = None
+        if config.rerank:
+            from .rerank import CrossEncoderReranker
+
+            self.reranker = CrossEncoderReranker(
+                config.rerank_model,
+                path_config.code_repo_root,
+                batch_size=config.rerank_batch_size,
+                budget=config.rerank_budget,
+            )
+
+        self._graph = build_graph(self._retriever, self.reranker)
 
-        self._graph = build_graph(self._retriever)
+    @property
+    def retriever(self) -> HybridRetriever | ShardedRetriever:
+        return self._retriever
 
-    def _build_dense_store(self, docs_pool: list[Document], embeddings: Embeddings):
+    def clear_caches(self):
         """
-        Builds a dense vector store using FAISS for semantic search.
+        Drops the in-memory caches of the answered queries (retrieval results, query vectors, features
+        of the reranker and the read files), so repeated measurements of the same queries start cold.
+        The persistent caches of the document vectors and the LLM responses are kept.
+        """
+
+        retrievers = [self._retriever]
+        if isinstance(self._retriever, ShardedRetriever):
+            retrievers.extend(self._retriever.shards.values())
+
+        for retriever in retrievers:
+            if retriever.cache is not None:
+                retriever.cache.clear()
+
+        self._embeddings.clear_queries()
+        if self.reranker is not None:
+            self.reranker.clear_cache()
+        clear_region_cache()
+
+    def _open_retriever(
+        self,
+        docs_pool: Iterable[Document],
+        path_config: PathConfig,
+        embeddings: CachedEmbeddings,
+        indexing: bool = True,
+    ) -> HybridRetriever:
+        """
+        Builds, updates or loads the index of a repository and creates its retriever.
 
         Args:
-            docs_pool (list[Document]): Pool of documents to be indexed.
+            docs_pool (Iterable[Document]): Pool of documents of the repository.
+            path_config (PathConfig): Configuration for file paths and cache locations of the repository.
+            embeddings (CachedEmbeddings): Embedding model for generating vector representations.
+            indexing (bool): If False, the cached index is loaded regardless of the indexing flags.
+
+        Returns:
+            HybridRetriever: Retriever over the index of the repository.
+        """
+
+        build_index = indexing and self._task_config.build_index
+        update_index = indexing and self._task_config.update_index
+
+        # The sparse and symbol indexes are (re-)built from the same documents stream as the dense one
+        sparse_builder = symbol_builder = None
+        if build_index or update_index:
+            sparse_builder = SparseIndexBuilder(path_config.cache_root)
+            symbol_builder = SymbolIndexBuilder(path_config.cache_root)
+            docs_pool = sparse_builder.consume(symbol_builder.consume(docs_pool))
+
+        if build_index:
+            dense_store = self._build_dense_store(docs_pool, path_config, embeddings)
+        elif update_index:
+            dense_store = self._update_dense_store(docs_pool, path_config, embeddings)
+        else:
+            if not (dense_store_exists(path_config.cache_root) and SparseIndex.exists(path_config.cache_root)):
+                raise FileNotFoundError("Dense vector store cache does not exist. Build the index first.")
+
+            dense_store = load_dense_store(path_config.cache_root, embeddings)
+
+        configure_index(dense_store.index, config)
+
+        if sparse_builder is not None and sparse_builder.exhausted:
+            sparse_index = sparse_builder.build()
+        else:
+            sparse_index = SparseIndex(path_config.cache_root)
+
+        # Caches built before the symbol index are searched without it
+        symbol_index = None
+        if symbol_builder is not None and symbol_builder.exhausted:
+            symbol_index = symbol_builder.build()
+        elif SymbolIndex.exists(path_config.cache_root):
+            symbol_index = SymbolIndex(path_config.cache_root)
+
+        # NOTE: set HIERARCHICAL=true to search the files first and score only their chunks
+        file_index = None
+        if config.hierarchical:
+            if not FileIndex.exists(path_config.cache_root):
+                raise FileNotFoundError("File index does not exist. Rebuild or update the index first.")
+            file_index = FileIndex(path_config.cache_root)
+
+        # NOTE: set SPARSE_WEIGHT > 0 for hybrid retrieval
+        return HybridRetriever(
+            dense=dense_store,
+            sparse=sparse_index,
+            k=config.candidate_k,
+            dense_k=max(config.dense_k, config.candidate_k),
+            sparse_k=config.sparse_k,
+            dense_weight=config.dense_weight,
+            sparse_weight=config.sparse_weight,
+            fusion=config.fusion,
+            cache=LRUCache(config.query_cache_size, config.query_cache_ttl),
+            index_version=index_version(path_config.cache_root),
+            files=file_index,
+            file_k=config.file_k,
+            symbols=symbol_index,
+        )
+
+    def _build_dense_store(self, docs_pool: Iterable[Document], path_config: PathConfig, embeddings: Embeddings):
+        """
+        Builds a dense vector store using FAISS for semantic search. The store is checkpointed periodically,
+        a build interrupted after a checkpoint is resumed from it.
+
+        Args:
+            docs_pool (Iterable[Document]): Pool of documents to be indexed.
+            path_config (PathConfig): Configuration for file paths and cache locations of the repository.
             embeddings (Embeddings): Embedding model for generating vector representations.
 
         Returns:
             FAISS: A dense vector store for document retrieval.
         """
 
-        index = faiss.IndexHNSWFlat(len(embeddings.embed_query("hello world")), 32)
-        vector_store = FAISS(
-            embedding_function=embeddings,
-            index=index,
-            docstore=InMemoryDocstore(),
-            index_to_docstore_id={},
+        checkpoint = IndexCheckpoint(
+            path_config.cache_root,
+            fingerprint=config.model_dump_json(include=_INDEX_SETTINGS),
+            interval=config.index_checkpoint_interval,
         )
+        commit = current_commit(path_config.code_repo_root)
+
+        # The checkpointed sources are skipped like the unchanged ones of an update
+        if checkpoint.exists():
+            vector_store, manifest = checkpoint.load(embeddings)
+            if self._task_config.verbose:
+                print(f"Resuming the index build from its checkpoint ({len(manifest.documents)} sources indexed)")
+
+            files = FileIndexBuilder(path_config.cache_root, previous=False)
+            return self._sync_dense_store(docs_pool, path_config, embeddings, vector_store, manifest, files, commit, checkpoint=checkpoint)
+
+        checkpoint.clear()
+        manifest = IndexManifest(path_config.cache_root)
+        manifest.clear(commit)
+        files = FileIndexBuilder(path_config.cache_root)
+
+        # Indexes requiring training are created once enough vectors are embedded
+        vector_store, pending = None, []
+        for batch in self._batch_sources(hash_sources(docs_pool)):
+            vectors = self._embed_sources(batch, embeddings)
+            if vector_store is not None:
+                self._add_sources(vector_store, manifest, files, batch, vectors)
+                if checkpoint.due():
+                    checkpoint.save(vector_store, manifest)
+                continue
+
+            pending.append((batch, vectors))
+            if not needs_training(config) or sum(len(v) for _, v in pending) >= config.index_train_size:
+                vector_store = self._create_dense_store(path_config, embeddings, pending)
+                for b, v in pending:
+                    self._add_sources(vector_store, manifest, files, b, v)
+                pending = []
+
+        if vector_store is None:
+            vector_store = self._create_dense_store(path_config, embeddings, pending)
+            for b, v in pending:
+                self._add_sources(vector_store, manifest, files, b, v)
+
+        save_dense_store(path_config.cache_root, vector_store)
+        files.build(manifest, vector_store.index)
+        manifest.save()
+        checkpoint.clear()
+
+        return vector_store
+
+    def _create_dense_store(
+        self,
+        path_config: PathConfig,
+        embeddings: Embeddings,
+        sample: list[tuple[list, np.ndarray]],
+    ) -> FAISS:
+        """
+        Creates an empty vector store backed by an ID-mapped index of the configured type.
+
+        Args:
+            path_config (PathConfig): Configuration for file paths and cache locations of the repository.
+            embeddings (Embeddings): Embedding model for generating vector representations.
+            sample (list[tuple[list, np.ndarray]]): Embedded batches used to train the index.
+
+        Returns:
+            FAISS: The empty vector store.
+        """
+
+        vectors = np.vstack([v for _, v in sample]) if sample else None
+        if vectors is not None and len(vectors):
+            dim = vectors.shape[1]
+        else:
+            # NOTE: probing the dimension with a document keeps it cacheable
+            dim = len(embeddings.embed_documents(["hello world"])[0])
+
+        # ID-mapped index, so that the vectors of a document can be replaced later on
+        return create_dense_store(path_config.cache_root, embeddings, make_index(dim, config, vectors))
+
+    def _update_dense_store(self, docs_pool: Iterable[Document], path_config: PathConfig, embeddings: Embeddings):
+        """
+        Incrementally updates the cached dense vector store. Only the documents, whose
+        content changed since the last indexing, are (re-)embedded; vectors of the
+        changed and deleted documents are removed from the index.
+
+        Args:
+            docs_pool (Iterable[Document]): Current pool of documents to be indexed.
+            path_config (PathConfig): Configuration for file paths and cache locations of the repository.
+            embeddings (Embeddings): Embedding model for generating vector representations.
+
+        Returns:
+            FAISS: The updated dense vector store.
+        """
+
+        manifest = IndexManifest(path_config.cache_root)
+        if not manifest.exists() or not dense_store_exists(path_config.cache_root):
+            if self._task_config.verbose: print("No index manifest found, building the index from scratch")
+            return self._build_dense_store(docs_pool, path_config, embeddings)
+
+        vector_store = load_dense_store(path_config.cache_root, embeddings, writable=True)
+
+        commit = current_commit(path_config.code_repo_root)
+        if commit is not None and commit == manifest.commit and SparseIndex.exists(path_config.cache_root) \
+                and FileIndex.exists(path_config.cache_root) and SymbolIndex.exists(path_config.cache_root):
+            return vector_store
+
+        candidates = None
+        if commit is not None and manifest.commit is not None:
+            candidates = changed_paths(path_config.code_repo_root, manifest.commit, commit)
+
+        files = FileIndexBuilder(path_config.cache_root)
+        return self._sync_dense_store(docs_pool, path_config, embeddings, vector_store, manifest, files, commit, candidates)
+
+    def _sync_dense_store(
+        self,
+        docs_pool: Iterable[Document],
+        path_config: PathConfig,
+        embeddings: Embeddings,
+        vector_store: FAISS,
+        manifest: IndexManifest,
+        files: FileIndexBuilder,
+        commit: str | None,
+        candidates: set[str] | None = None,
+        checkpoint: IndexCheckpoint | None = None,
+    ) -> FAISS:
+        """
+        Brings a vector store in line with the pool of documents: the new and changed sources are
+        (re-)embedded, vectors of the changed and deleted sources are removed. The store is saved.
 
-        vector_store.add_documents(docs_pool)
-        vector_store.save_local(self._config.cache_root.as_posix())
+        Args:
+            docs_pool (Iterable[Document]): Current pool of documents to be indexed.
+            path_config (PathConfig): Configuration for file paths and cache locations of the repository.
+            embeddings (Embeddings): Embedding model for generating vector representations.
+            vector_store (FAISS): Writable vector store backed by an ID-mapped index.
+            manifest (IndexManifest): Manifest of the sources in the vector store.
+            files (FileIndexBuilder): File index builder to pool the vectors of the (re-)embedded sources in.
+            commit (str | None): Commit the documents are read from.
+            candidates (set[str] | None): If given, only these sources are compared by hash (see `changed_paths`).
+            checkpoint (IndexCheckpoint | None): Checkpoint of a resumed build, saved periodically and cleared at the end.
+
+        Returns:
+            FAISS: The updated dense vector store.
+        """
+
+        seen, removed_ids = set(), []
+
+        def changed_sources() -> Iterator[tuple[str, str, list[Document]]]:
+            for source, digest, group in hash_sources(docs_pool):
+                seen.add(source)
+                if manifest.is_changed(source, digest, candidates):
+                    if source in manifest.documents:
+                        removed_ids.extend(manifest.documents.pop(source)["ids"])
+                    yield source, digest, group
+
+        added = 0
+        for batch in self._batch_sources(changed_sources()):
+            self._add_sources(vector_store, manifest, files, batch, self._embed_sources(batch, embeddings))
+            added += len(batch)
+
+            # A checkpoint must not keep the vectors of the sources, which are no longer in the manifest
+            if checkpoint is not None and checkpoint.due():
+                if removed_ids:
+                    self._remove_vectors(vector_store, removed_ids, embeddings)
+                    removed_ids.clear()
+                checkpoint.save(vector_store, manifest)
+
+        deleted = [source for source in manifest.documents if source not in seen]
+        for source in deleted:
+            removed_ids.extend(manifest.documents.pop(source)["ids"])
+
+        if removed_ids:
+            self._remove_vectors(vector_store, removed_ids, embeddings)
+
+        manifest.commit = commit
+
+        if self._task_config.verbose:
+            print(f"Index update: {added} sources embedded, {len(deleted)} sources removed")
+
+        save_dense_store(path_config.cache_root, vector_store)
+        files.build(manifest, vector_store.index)
+        manifest.save()
+        if checkpoint is not None:
+            checkpoint.clear()
 
         return vector_store
 
-    async def ainvoke(self, query: str) -> tuple[str, list[str]]:
+    @staticmethod
+    def _batch_sources(
+        sources: Iterable[tuple[str, str, list[Document]]],
+    ) -> Iterator[list[tuple[str, str, list[Document]]]]:
+        """
+        Groups hashed sources into batches of roughly `index_batch_size` documents.
+
+        Args:
+            sources (Iterable[tuple[str, str, list[Document]]]): Output of `hash_sources`.
+
+        Yields:
+            list[tuple[str, str, list[Document]]]: Batches of whole sources.
+        """
+
+        batch, size = [], 0
+        for entry in sources:
+            batch.append(entry)
+            size += len(entry[2])
+
+            if size >= config.index_batch_size:
+                yield batch
+                batch, size = [], 0
+
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _embed_sources(sources: list[tuple[str, str, list[Document]]], embeddings: Embeddings) -> np.ndarray:
+        """
+        Embeds the documents of the given sources.
+
+        Args:
+            sources (list[tuple[str, str, list[Document]]]): Sources to be embedded (see `hash_sources`).
+            embeddings (Embeddings): Embedding model for generating vector representations.
+
+        Returns:
+            np.ndarray: Vectors of the documents, in the order of the sources.
+        """
+
+        texts = [doc.page_content for _, _, group in sources for doc in group]
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        return np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+    def _add_sources(
+        self,
+        vector_store: FAISS,
+        manifest: IndexManifest,
+        files: FileIndexBuilder,
+        sources: list[tuple[str, str, list[Document]]],
+        vectors: np.ndarray,
+    ):
+        """
+        Adds the embedded documents of the given sources to the vector store.
+
+        Args:
+            vector_store (FAISS): Vector store backed by an ID-mapped index.
+            manifest (IndexManifest): Manifest to register the new vectors in.
+            files (FileIndexBuilder): File index builder to pool the vectors of the sources in.
+            sources (list[tuple[str, str, list[Document]]]): Sources to be added (see `hash_sources`).
+            vectors (np.ndarray): Vectors of the documents (see `_embed_sources`).
+        """
+
+        docs = [doc for _, _, group in sources for doc in group]
+        ids = manifest.allocate_ids(len(docs))
+
+        if docs:
+            vector_store.index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+            vector_store.docstore.add({str(idx): doc for idx, doc in zip(ids, docs)})
+
+        offset = 0
+        for source, digest, group in sources:
+            manifest.documents[source] = {
+                "hash": digest,
+                "ids": ids[offset:offset + len(group)],
+            }
+            files.add(source, vectors[offset:offset + len(group)])
+            offset += len(group)
+
+    @staticmethod
+    def _remove_vectors(vector_store: FAISS, ids: list[int], embeddings: Embeddings):
+        """
+        Removes vectors (and their documents) from the vector store.
+
+        Args:
+            vector_store (FAISS): Vector store backed by an ID-mapped index.
+            ids (list[int]): Ids of the vectors to be removed.
+            embeddings (Embeddings): Embedding model, re-embeds the remaining documents of quantized HNSW indexes.
+        """
+
+        index, ids = vector_store.index, np.asarray(ids, dtype=np.int64)
+        try:
+            index.remove_ids(ids)
+        except RuntimeError:
+            # HNSW graphs do not support removal - the graph is rebuilt from the remaining vectors
+            inner = faiss.downcast_index(index.index)
+            labels = faiss.vector_to_array(index.id_map)
+            keep = ~np.isin(labels, ids)
+
+            if isinstance(faiss.downcast_index(inner.storage), faiss.IndexFlat):
+                # Stored exactly, which is far cheaper than re-embedding the documents
+                vectors = inner.reconstruct_n(0, inner.ntotal)[keep]
+            else:
+                # Reconstructed SQ/PQ codes would be quantized once more with every removal,
+                # the documents are re-embedded instead (hits of the embedding cache)
+                texts = [vector_store.docstore.search(str(idx)).page_content for idx in labels[keep]]
+                vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32).reshape(-1, inner.d)
+
+            index.reset()
+            index.add_with_ids(vectors, labels[keep])
+
+        vector_store.docstore.delete([str(idx) for idx in ids])
+
+    async def ainvoke(self, query: str, task_config: TaskConfig | None = None) -> tuple[str, list[str]]:
         """
         Asynchronously invokes the retrieval graph to answer a query.
 
         Args:
             query (str): The input query string.
+            task_config (TaskConfig | None): Configuration overriding the one of the extractor for this query.
 
         Returns:
             tuple[str, list[str]]: A tuple containing the answer and a list of retrieved documents.
         """
 
-        search_result = await self._graph.ainvoke({
-            "question": query,
-            "task_config": self._task_config,
-        })
+        task_config = task_config or self._task_config
+        if not task_config.profile:
+            search_result = await self._graph.ainvoke({
+                "question": query,
+                "task_config": task_config,
+            })
+
+            return search_result["answer"], search_result["retrieved"]
+
+        with collect() as spans, span("invoke"):
+            search_result = await self._graph.ainvoke({
+                "question": query,
+                "task_config": task_config,
+            })
 
+        self.traces.append(spans)
         return search_result["answer"], search_result["retrieved"]
 
+    async def abatch(self, queries: list[str], concurrency: int = 8) -> list[tuple[str | None, list[str]]]:
+        """
+        Answers a batch of queries. All queries are embedded in one call and searched with one
+        matrix search, the LLM stages (expansion and summarization) run with bounded concurrency.
+
+        Args:
+            queries (list[str]): The input query strings.
+            concurrency (int): Maximum number of concurrent LLM calls.
+
+        Returns:
+            list[tuple[str | None, list[str]]]: Answers and retrieved documents, in the order of the queries.
+        """
+
+        if not self._task_config.profile:
+            return await self._batch(queries, concurrency)
+
+        with collect() as spans, span("batch", queries=len(queries)):
+            results = await self._batch(queries, concurrency)
+
+        self.traces.append(spans)
+        return results
+
+    async def _batch(self, queries: list[str], concurrency: int) -> list[tuple[str | None, list[str]]]:
+        # Queries answered by the symbol index are neither expanded nor searched
+        matches = [
+            match_symbols(self._retriever, query, self._task_config) if config.symbol_routing else ([], False)
+            for query in queries
+        ]
+        retrieved = [sources for sources, _ in matches]
+        pending = [i for i, (_, confident) in enumerate(matches) if not confident]
+
+        queries = list(queries)
+        if pending and self._task_config.speculative_expansion:
+            with span("speculate", queries=len(pending)):
+                searched, sources = await speculative_search(
+                    self._retriever,
+                    [queries[i] for i in pending],
+                    [retrieved[i] for i in pending],
+                    self._task_config,
+                    concurrency,
+                )
+
+            for i, query, found in zip(pending, searched, sources):
+                queries[i], retrieved[i] = query, found
+        elif pending:
+            searched = [queries[i] for i in pending]
+            if self._task_config.expand_query:
+                with span("expand", queries=len(pending)):
+                    searched = await expand_queries(searched, concurrency)
+
+            with span("retrieve", queries=len(pending)):
+                results = await self._retriever.abatch_search(searched, **search_kwargs(self._task_config))
+
+            for i, query, documents in zip(pending, searched, results):
+                queries[i] = query
+                retrieved[i] = seed_sources([d.metadata["source"] for d in documents], retrieved[i])
+
+        if pending and self.reranker is not None:
+            reranked = await asyncio.gather(*[
+                asyncio.to_thread(self.reranker.rerank, queries[i], retrieved[i]) for i in pending
+            ])
+            for i, sources in zip(pending, reranked):
+                retrieved[i] = sources[:config.top_k]
+
+        if not self._task_config.summarize:
+            return [(None, sources) for sources in retrieved]
+
+        with span("llm_answer", queries=len(queries)):
+            answers = await answer_questions(queries, retrieved, concurrency)
+
+        return list(zip(answers, retrieved))
+
+    async def _stream(self, query: str) -> AsyncIterator[tuple[Literal["sources", "token"], list[str] | str]]:
+        start_time, first_token = time.perf_counter(), True
+
+        # The sources are final after the reranking, if any
+        final = ("symbols", "rerank") if self.reranker is not None else ("symbols", "retrieve", "speculate")
+
+        async for mode, chunk in self._graph.astream(
+            {
+                "question": query,
+                "task_config": self._task_config,
+            },
+            stream_mode=["updates", "messages"],
+        ):
+            if mode == "updates":
+                for node, update in chunk.items():
+                    if node in final and update and update.get("retrieved") is not None:
+                        record("sources", start_time)
+                        yield "sources", update["retrieved"]
+
+                    # Answers served from the LLM response cache are not streamed, they arrive whole
+                    if node == "llm_answer" and first_token and update and update.get("answer"):
+                        record("first_token", start_time)
+                        first_token = False
+                        yield "token", update["answer"]
+
+            # Tokens of the other LLM calls (e.g. the query expansion) are not part of the answer
+            elif chunk[1].get("langgraph_node") == "llm_answer" and chunk[0].content:
+                if first_token:
+                    record("first_token", start_time)
+                    first_token = False
+
+                yield "token", chunk[0].content
+
+    async def astream(self, query: str) -> AsyncIterator[tuple[Literal["sources", "token"], list[str] | str]]:
+        """
+        Asynchronously invokes the retrieval graph and streams the answer to a query.
+        The retrieved sources are emitted as soon as the retrieval finishes, the answer
+        is emitted token by token as the LLM generates it (or at once, if it is cached).
+
+        Args:
+            query (str): The input query string.
+
+        Yields:
+            tuple[Literal["sources", "token"], list[str] | str]: Either the list of retrieved
+                documents or the next chunk of the answer.
+        """
+
+        if not self._task_config.profile:
+            async for event in self._stream(query):
+                yield event
+            return
+
+        with collect() as spans, span("invoke"):
+            async for event in self._stream(query):
+                yield event
+
+        self.traces.append(spans)
+
 
 if __name__ == "__main__":
     pass
@@ -1,9 +1,10 @@
 import json
 import asyncio
+import importlib
+from typing import Iterator, NamedTuple
 from collections import defaultdict
-from functools import partial
+from functools import cache, partial
 
-import tree_sitter_javascript as ts_js
 from tree_sitter import Language as TS_Lang, Parser, Node, Tree
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter, Language
@@ -11,8 +12,6 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter, Language
 from scheme.config import PathConfig
 
 
-JS = TS_Lang(ts_js.language())
-parser = Parser(JS)
 config = PathConfig()
 
 # Default LangChain code splitters
@@ -22,77 +21,278 @@ splitter_factory = partial(
     chunk_overlap=50,
 )
 
-SPLITTERS = defaultdict(splitter_factory)
-with open(config.lang_map_path) as f:
-    for ext, lang in json.load(f).items():
-        SPLITTERS[ext] = RecursiveCharacterTextSplitter.from_language(
-            language=Language._value2member_map_[lang],  # pylint: disable=protected-access
-            chunk_size=100,
-            chunk_overlap=20,
-        )
-
-# Constants for AST parsing
-IGNORE = ["\n"]
-TERMINAL = [
+# Node types, whose subtrees become chunks, per language
+JS_TERMINAL = frozenset([
     "export_statement",
     "function_declaration",
     "variable_declaration",
     "lexical_declaration",
-    "class_declaration"
-]
-
+    "class_declaration",
+])
+TS_TERMINAL = JS_TERMINAL | {
+    "abstract_class_declaration",
+    "interface_declaration",
+    "type_alias_declaration",
+    "enum_declaration",
+    "internal_module",
+}
+PY_TERMINAL = frozenset([
+    "function_definition",
+    "class_definition",
+    "decorated_definition",
+])
+GO_TERMINAL = frozenset([
+    "function_declaration",
+    "method_declaration",
+    "type_declaration",
+    "const_declaration",
+    "var_declaration",
+])
+JAVA_TERMINAL = frozenset([
+    "class_declaration",
+    "interface_declaration",
+    "enum_declaration",
+    "record_declaration",
+    "constructor_declaration",
+    "method_declaration",
+    "field_declaration",
+])
+
+# Node types, which define a symbol under their "name" field, per language
+JS_DEFINITIONS = frozenset([
+    "function_declaration",
+    "generator_function_declaration",
+    "class_declaration",
+    "method_definition",
+    "variable_declarator",
+])
+TS_DEFINITIONS = JS_DEFINITIONS | {
+    "abstract_class_declaration",
+    "interface_declaration",
+    "type_alias_declaration",
+    "enum_declaration",
+}
+PY_DEFINITIONS = frozenset([
+    "function_definition",
+    "class_definition",
+])
+GO_DEFINITIONS = frozenset([
+    "function_declaration",
+    "method_declaration",
+    "type_spec",
+    "const_spec",
+    "var_spec",
+])
+JAVA_DEFINITIONS = frozenset([
+    "class_declaration",
+    "interface_declaration",
+    "enum_declaration",
+    "record_declaration",
+    "constructor_declaration",
+    "method_declaration",
+    "variable_declarator",
+])
+
+# Leaf node types of identifiers (in all grammars), every occurrence outside of a definition name is a reference
+IDENTIFIERS = frozenset([
+    "identifier",
+    "type_identifier",
+    "property_identifier",
+    "field_identifier",
+    "shorthand_property_identifier",
+])
+
+# Tree-sitter grammars keyed by file extension:
+# (grammar package, language function, terminal node types, definition node types)
+GRAMMARS = {
+    "js": ("tree_sitter_javascript", "language", JS_TERMINAL, JS_DEFINITIONS),
+    "jsx": ("tree_sitter_javascript", "language", JS_TERMINAL, JS_DEFINITIONS),
+    "mjs": ("tree_sitter_javascript", "language", JS_TERMINAL, JS_DEFINITIONS),
+    "cjs": ("tree_sitter_javascript", "language", JS_TERMINAL, JS_DEFINITIONS),
+    "ts": ("tree_sitter_typescript", "language_typescript", TS_TERMINAL, TS_DEFINITIONS),
+    "tsx": ("tree_sitter_typescript", "language_tsx", TS_TERMINAL, TS_DEFINITIONS),
+    "py": ("tree_sitter_python", "language", PY_TERMINAL, PY_DEFINITIONS),
+    "go": ("tree_sitter_go", "language", GO_TERMINAL, GO_DEFINITIONS),
+    "java": ("tree_sitter_java", "language", JAVA_TERMINAL, JAVA_DEFINITIONS),
+}
+
+# Parser of a file extension with its terminal and definition node types
+ParserEntry = tuple[Parser, frozenset[str], frozenset[str]]
+
+
+class Symbol(NamedTuple):
+    name: str
+    definition: bool
+    start_line: int
+    end_line: int
+
+
+def make_parsers() -> dict[str, ParserEntry]:
+    """
+    Creates the tree-sitter parsers for the file extensions of the grammar registry.
+    Extensions, whose grammar package is not installed, are left to the text splitters.
 
-def _parse_subtree(root: Node) -> list[Node]:
+    Returns:
+        dict[str, ParserEntry]: Parsers with their terminal and definition node types, keyed by file extension.
     """
-    Parses a subtree of the AST starting from the given root node.
 
-    Args:
-        root (Node): The root node of the subtree.
+    parsers, languages = {}, {}
+    for ext, (package, function, terminal, definitions) in GRAMMARS.items():
+        if (package, function) not in languages:
+            try:
+                languages[package, function] = TS_Lang(getattr(importlib.import_module(package), function)())
+            except ImportError:
+                languages[package, function] = None
+
+        if languages[package, function] is not None:
+            parsers[ext] = (Parser(languages[package, function]), terminal, definitions)
+
+    return parsers
+
+
+def make_splitters() -> defaultdict[str, RecursiveCharacterTextSplitter]:
+    """
+    Creates the text splitters for the file extensions from the language map.
 
     Returns:
-        list[Node]: A list of terminal nodes found in the subtree.
+        defaultdict[str, RecursiveCharacterTextSplitter]: Splitters keyed by file extension.
     """
-    subtree_nodes = []
-    queue = [root]
 
-    while queue:
-        current_node = queue.pop(0)
-        for child in current_node.children:
-            child_type = str(child.type)
-            if child_type in IGNORE:
-                continue
+    splitters = defaultdict(splitter_factory)
+    with open(config.lang_map_path) as f:
+        for ext, lang in json.load(f).items():
+            splitters[ext] = RecursiveCharacterTextSplitter.from_language(
+                language=Language._value2member_map_[lang],  # pylint: disable=protected-access
+                chunk_size=100,
+                chunk_overlap=20,
+            )
 
-            if child_type in TERMINAL:
-                subtree_nodes.append(child)
+    return splitters
 
-            queue.append(child)
 
-    return subtree_nodes
+# Default parsers and splitters of the process, created on the first chunked document
+default_parsers = cache(make_parsers)
+default_splitters = cache(make_splitters)
 
 
-def _get_subtrees(tree: Tree) -> list[Node]:
+def _terminal_nodes(tree: Tree, terminal: frozenset[str]) -> Iterator[Node]:
     """
-    Extracts all terminal subtrees from the given AST.
+    Finds all terminal nodes of the AST (including the nested ones) with a single
+    pre-order traversal, every node is visited exactly once.
 
     Args:
         tree (Tree): The AST to process.
+        terminal (frozenset[str]): Types of the terminal nodes.
+
+    Yields:
+        Node: Terminal nodes, in the order of their position in the document.
+    """
+
+    cursor = tree.walk()
+    while True:
+        if cursor.node.type in terminal:
+            yield cursor.node
+
+        if cursor.goto_first_child():
+            continue
+
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return
+
+
+def chunk_document(
+    doc: Document,
+    parsers: dict[str, ParserEntry] | None = None,
+    splitters: defaultdict[str, RecursiveCharacterTextSplitter] | None = None,
+) -> list[Document]:
+    """
+    Splits a single document into smaller chunks using AST parsing or text splitting.
+
+    Args:
+        doc (Document): The document to process.
+        parsers (dict[str, ParserEntry] | None): Tree-sitter parsers with their node types, keyed by
+            file extension (parsers must not be shared between processes). Defaults to the process' parsers.
+        splitters (defaultdict[str, RecursiveCharacterTextSplitter] | None): Text splitters keyed by
+            file extension. Defaults to the process' splitters.
 
     Returns:
-        list[Node]: A list of terminal nodes representing subtrees.
+        list[Document]: List of chunks of the document.
+    """
+    parsers = default_parsers() if parsers is None else parsers
+    splitters = default_splitters() if splitters is None else splitters
+    ext = doc.metadata["source"].split(".")[-1]
+
+    if ext not in parsers:  # Use default text splitters for languages without a grammar
+        return splitters[ext].split_documents([doc])
+
+    # Node positions are byte offsets
+    parser, terminal, _ = parsers[ext]
+    source = doc.page_content.encode("utf-8")
+    tree = parser.parse(source)
+
+    # Ordered set of the chunks, identical subtrees are dropped by a hash lookup
+    chunks = {}
+    for t_node in _terminal_nodes(tree, terminal):
+        target = source[t_node.start_byte:t_node.end_byte].decode("utf-8", errors="replace")
+        chunks.setdefault(target, None)
+
+    if not chunks:
+        return [Document(page_content=doc.page_content, metadata=doc.metadata)]
+
+    return [
+        Document(page_content=c, metadata=doc.metadata)
+        for c in chunks
+    ]
+
+
+def extract_symbols(doc: Document, parsers: dict[str, ParserEntry] | None = None) -> list[Symbol] | None:
     """
-    all_subtrees = []
-    queue = [tree.root_node]
+    Extracts the symbol definitions (with the line range of the defining node) and the references
+    (identifier occurrences, one per name and line) of a document with a single pass over its AST.
 
-    while queue:
-        current_node = queue.pop(0)
-        if str(current_node.type) in TERMINAL:
-            all_subtrees.append(current_node)
-        else:
-            subtree = _parse_subtree(current_node)
-            all_subtrees.extend(subtree)
-            queue.extend([x for x in current_node.children])
+    Args:
+        doc (Document): The (whole file) document to process.
+        parsers (dict[str, ParserEntry] | None): Tree-sitter parsers with their node types, keyed by
+            file extension. Defaults to the process' parsers.
 
-    return all_subtrees
+    Returns:
+        list[Symbol] | None: Symbols of the document (1-based lines) or None, if its language has no grammar.
+    """
+    parsers = default_parsers() if parsers is None else parsers
+    ext = doc.metadata["source"].split(".")[-1]
+    if ext not in parsers:
+        return None
+
+    parser, _, definitions = parsers[ext]
+    source = doc.page_content.encode("utf-8")
+    cursor = parser.parse(source).walk()
+
+    symbols, names, seen = [], set(), set()
+    while True:
+        node = cursor.node
+        if node.type in definitions:
+            name = node.child_by_field_name("name")
+            if name is not None and name.type in IDENTIFIERS:
+                symbols.append(Symbol(
+                    source[name.start_byte:name.end_byte].decode("utf-8", errors="replace"),
+                    True, node.start_point[0] + 1, node.end_point[0] + 1,
+                ))
+                names.add(name.start_byte)
+
+        # Definitions are visited before their subtrees (pre-order), their names are known when reached
+        elif node.type in IDENTIFIERS and node.start_byte not in names and node.end_byte - node.start_byte > 1:
+            reference = (source[node.start_byte:node.end_byte].decode("utf-8", errors="replace"), node.start_point[0])
+            if reference not in seen:
+                seen.add(reference)
+                symbols.append(Symbol(reference[0], False, reference[1] + 1, reference[1] + 1))
+
+        if cursor.goto_first_child():
+            continue
+
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return symbols
 
 
 async def get_chunks(documents: list[Document]) -> list[Document]:
@@ -105,36 +305,7 @@ async def get_chunks(documents: list[Document]) -> list[Document]:
     Returns:
         list[Document]: List of chunked documents.
     """
-    result = []
-
-    for doc in documents:
-        ext = doc.metadata["source"].split(".")[-1]
-
-        if ext == "js":  # Use AST parsing for JavaScript files
-            tree = parser.parse(bytes(doc.page_content, "utf-8"))
-            subtrees = _get_subtrees(tree)
-
-            if subtrees:
-                chunks = []
-                for t_node in subtrees:
-                    target = doc.page_content[t_node.start_byte:t_node.end_byte]
-                    if target not in chunks:
-                        chunks.append(target)
-
-                result.extend([
-                    Document(page_content=c, metadata=doc.metadata)
-                    for c in chunks
-                ])
-            else:
-                result.append(
-                    Document(page_content=doc.page_content, metadata=doc.metadata)
-                )
-        else:  # Use default text splitters for other file types
-            splitter = SPLITTERS[ext]
-            subtrees = await splitter.atransform_documents([doc])
-            result.extend(subtrees)
-
-    return result
+    return [chunk for doc in documents for chunk in chunk_document(doc)]
 
 
 async def _main(text: str):
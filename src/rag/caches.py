@@ -0,0 +1,206 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Hashable, Iterator, Sequence
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from langchain_core.caches import BaseCache
+from langchain_core.outputs import Generation, ChatGeneration
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+
+class LRUCache:
+    """
+    LRUCache is a small in-memory cache with a size bound and a time-to-live of the entries.
+    The least recently used entries are evicted first, expired entries are dropped on access.
+    """
+
+    def __init__(self, capacity: int, ttl: float):
+        """
+        Initializes the cache.
+
+        Args:
+            capacity (int): Maximum number of entries (0 disables the cache).
+            ttl (float): Time-to-live of the entries in seconds (0 means no expiration).
+        """
+
+        self._capacity, self._ttl = capacity, ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits, self.misses = 0, 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        """
+        Looks up the key and marks it as recently used.
+
+        Args:
+            key (Hashable): Key of the entry.
+
+        Returns:
+            Any | None: The cached value or None, if it is missing or expired.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._ttl and time.monotonic() - entry[0] > self._ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        if not self._capacity:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LLMResponseCache(BaseCache):
+    """
+    LLMResponseCache persists LLM responses in SQLite, keyed by the hash of the prompt
+    and the hash of the model configuration (model slug and invocation parameters).
+    The cache is size-bounded (least recently used responses are evicted first) and
+    the responses expire after the time-to-live.
+    """
+
+    def __init__(self, path: Path, capacity: int, ttl: float):
+        """
+        Initializes the cache, the database is opened (or created) on its first use.
+
+        Args:
+            path (Path): Path of the SQLite database.
+            capacity (int): Maximum number of cached responses (0 disables the cache).
+            ttl (float): Time-to-live of the responses in seconds (0 means no expiration).
+        """
+
+        self._capacity, self._ttl = capacity, ttl
+        self._lock = threading.Lock()
+        self._bypassed = False
+
+        self.hits, self.misses = 0, 0
+
+        self._path = path
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Accessed under the lock only
+        if self._connection is not None:
+            return self._connection
+
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                prompt BLOB NOT NULL,
+                llm BLOB NOT NULL,
+                generations TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (prompt, llm)
+            );
+            CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used);
+        """)
+
+        return self._connection
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> tuple[bytes, bytes]:
+        return hashlib.sha256(prompt.encode()).digest(), hashlib.sha256(llm_string.encode()).digest()
+
+    @staticmethod
+    def _dumps(generations: Sequence[Generation]) -> str:
+        return json.dumps([
+            {"text": g.text, "message": message_to_dict(g.message) if isinstance(g, ChatGeneration) else None}
+            for g in generations
+        ])
+
+    @staticmethod
+    def _loads(blob: str) -> list[Generation]:
+        return [
+            ChatGeneration(message=messages_from_dict([g["message"]])[0]) if g["message"] else Generation(text=g["text"])
+            for g in json.loads(blob)
+        ]
+
+    @contextmanager
+    def bypassed(self) -> Iterator[None]:
+        """
+        Bypasses the cache (lookups miss, responses are not stored) without dropping the stored responses,
+        e.g. while latencies are measured.
+        """
+
+        self._bypassed = True
+        try:
+            yield
+        finally:
+            self._bypassed = False
+
+    def lookup(self, prompt: str, llm_string: str) -> list[Generation] | None:
+        if self._bypassed:
+            return None
+
+        key, now = self._key(prompt, llm_string), time.time()
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT generations, created FROM responses WHERE prompt = ? AND llm = ?", key
+            ).fetchone()
+
+            if row is not None and self._ttl and now - row[1] > self._ttl:
+                self._db.execute("DELETE FROM responses WHERE prompt = ? AND llm = ?", key)
+                row = None
+
+            if row is None:
+                self._db.commit()
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE responses SET last_used = ? WHERE prompt = ? AND llm = ?", (now, *key))
+            self._db.commit()
+            self.hits += 1
+
+        return self._loads(row[0])
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]):
+        if not self._capacity or self._bypassed:
+            return
+
+        key, now, blob = self._key(prompt, llm_string), time.time(), self._dumps(return_val)
+
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (*key, blob, now, now))
+            self._db.execute(
+                """
+                DELETE FROM responses WHERE rowid IN (
+                    SELECT rowid FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self._capacity,),
+            )
+            self._db.commit()
+
+    def clear(self, **kwargs: Any):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
@@ -0,0 +1,305 @@
+import json
+import time
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterator
+from collections.abc import Mapping
+
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from .manifest import IndexManifest
+
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+
+# Pickled docstore of the former (LangChain `save_local`) cache format
+_LEGACY_DOCSTORE_FILE = "index.pkl"
+
+# Maps the index file into memory instead of reading it (the pages are loaded on demand)
+# NOTE: `IO_FLAG_MMAP_IFC` is newer than the pinned faiss-cpu, which only maps the inverted lists
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class SQLiteDocstore(Docstore):
+    """
+    SQLiteDocstore keeps the indexed documents in a SQLite table keyed by their FAISS label.
+    Unlike the pickled `InMemoryDocstore`, nothing is loaded upfront, documents are read per hit.
+    """
+
+    def __init__(self, path: Path, read_only: bool = False):
+        """
+        Opens (or creates) the docstore.
+
+        Args:
+            path (Path): Path of the SQLite database.
+            read_only (bool): If True, the database is opened in read-only mode.
+        """
+
+        self.path = path
+        self._lock = threading.Lock()
+
+        if read_only:
+            self._db = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            return
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def search(self, search: str) -> Document | str:
+        """
+        Looks up a document by its id.
+
+        Args:
+            search (str): Id of the document (its FAISS label).
+
+        Returns:
+            Document | str: The document or an error message, if it is not found.
+        """
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT page_content, metadata FROM documents WHERE id = ?",
+                (int(search),),
+            ).fetchone()
+
+        if row is None:
+            return f"ID {search} not found."
+
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: dict[str, Document]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?)",
+                [(int(idx), doc.page_content, json.dumps(doc.metadata)) for idx, doc in texts.items()],
+            )
+
+    def delete(self, ids: list):
+        with self._lock:
+            self._db.executemany("DELETE FROM documents WHERE id = ?", [(int(idx),) for idx in ids])
+
+    def save(self, path: Path):
+        """
+        Commits the pending changes and moves the database to the given path.
+
+        Args:
+            path (Path): Target path of the database.
+        """
+
+        with self._lock:
+            self._db.commit()
+            if path == self.path:
+                return
+
+            self._db.close()
+            self.path.replace(path)
+            self.path = path
+            self._db = sqlite3.connect(path, check_same_thread=False)
+
+
+class LabelMap(Mapping):
+    """
+    Identity mapping from the FAISS labels to the docstore ids (their string form).
+    It replaces the `index_to_docstore_id` dict, which would otherwise hold an entry per vector.
+    """
+
+    def __init__(self, index: faiss.IndexIDMap2):
+        self._index = index
+
+    def __getitem__(self, label: int) -> str:
+        return str(label)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(faiss.vector_to_array(self._index.id_map).tolist())
+
+    def __len__(self) -> int:
+        return self._index.ntotal
+
+
+def dense_store_exists(root: Path) -> bool:
+    return (root / INDEX_FILE).exists() and (root / DOCSTORE_FILE).exists()
+
+
+def index_version(root: Path) -> str:
+    """
+    Identifies the saved version of the index. The index file is replaced on every save,
+    so its modification time and size change whenever the index is built or updated.
+
+    Args:
+        root (Path): Directory of the index cache.
+
+    Returns:
+        str: Version of the cached index.
+    """
+
+    stat = (root / INDEX_FILE).stat()
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def create_dense_store(root: Path, embeddings: Embeddings, index: faiss.IndexIDMap2) -> FAISS:
+    """
+    Creates an empty vector store, its docstore is written next to the cached one
+    and replaces it only once the store is saved.
+
+    Args:
+        root (Path): Directory of the index cache.
+        embeddings (Embeddings): Embedding model for generating vector representations.
+        index (faiss.IndexIDMap2): Empty ID-mapped index.
+
+    Returns:
+        FAISS: The empty vector store.
+    """
+
+    path = root / f"{DOCSTORE_FILE}.tmp"
+    path.unlink(missing_ok=True)
+
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=SQLiteDocstore(path),
+        index_to_docstore_id=LabelMap(index),
+    )
+
+
+def load_dense_store(root: Path, embeddings: Embeddings, writable: bool = False) -> FAISS:
+    """
+    Loads the cached vector store. Unless it is going to be modified, the index is memory-mapped
+    and the docstore opened read-only, so loading does not depend on the size of the index.
+
+    Args:
+        root (Path): Directory of the index cache.
+        embeddings (Embeddings): Embedding model for generating vector representations.
+        writable (bool): If True, the index is read into memory, so that it can be updated.
+
+    Returns:
+        FAISS: The cached vector store.
+    """
+
+    index = faiss.read_index((root / INDEX_FILE).as_posix(), 0 if writable else MMAP_FLAGS)
+
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=SQLiteDocstore(root / DOCSTORE_FILE, read_only=not writable),
+        index_to_docstore_id=LabelMap(index),
+    )
+
+
+def save_dense_store(root: Path, vector_store: FAISS):
+    """
+    Writes the vector store to the cache. The files are replaced atomically,
+    so processes that have the previous index mapped keep working.
+
+    Args:
+        root (Path): Directory of the index cache.
+        vector_store (FAISS): Vector store backed by an ID-mapped index and a `SQLiteDocstore`.
+    """
+
+    tmp_path = root / f"{INDEX_FILE}.tmp"
+    faiss.write_index(vector_store.index, tmp_path.as_posix())
+    tmp_path.replace(root / INDEX_FILE)
+
+    vector_store.docstore.save(root / DOCSTORE_FILE)
+    (root / _LEGACY_DOCSTORE_FILE).unlink(missing_ok=True)
+
+
+class IndexCheckpoint:
+    """
+    IndexCheckpoint periodically saves a vector store being built (see `create_dense_store`) together
+    with its manifest, so an interrupted build resumes from the last checkpoint. The docstore is built
+    in place and only committed, the index and the manifest are copied into the checkpoint directory.
+    Checkpoints of a different index configuration (fingerprint) are not resumed.
+    """
+
+    DIR_NAME = "checkpoint"
+
+    def __init__(self, root: Path, fingerprint: str, interval: float):
+        """
+        Initializes the checkpoint of an index cache.
+
+        Args:
+            root (Path): Directory of the index cache.
+            fingerprint (str): Identifies the configuration the index is built with.
+            interval (float): Minimum number of seconds between two checkpoints.
+        """
+
+        self._root = root
+        self._path = root / self.DIR_NAME
+        self._fingerprint = fingerprint
+        self._interval = interval
+        self._saved = time.monotonic()
+
+    def exists(self) -> bool:
+        # The manifest is written last, the docstore is gone once the build was completed
+        return (self._path / IndexManifest.FILE_NAME).exists() \
+            and (self._root / f"{DOCSTORE_FILE}.tmp").exists() \
+            and (self._path / "fingerprint").read_text() == self._fingerprint
+
+    def load(self, embeddings: Embeddings) -> tuple[FAISS, IndexManifest]:
+        """
+        Loads the checkpointed vector store, so that the build can be continued.
+
+        Args:
+            embeddings (Embeddings): Embedding model for generating vector representations.
+
+        Returns:
+            tuple[FAISS, IndexManifest]: The vector store and the manifest of its sources (saved to the cache directory).
+        """
+
+        index = faiss.read_index((self._path / INDEX_FILE).as_posix())
+        vector_store = FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=SQLiteDocstore(self._root / f"{DOCSTORE_FILE}.tmp"),
+            index_to_docstore_id=LabelMap(index),
+        )
+
+        manifest = IndexManifest(self._root)
+        manifest.load(self._path)
+
+        return vector_store, manifest
+
+    def due(self) -> bool:
+        return time.monotonic() - self._saved >= self._interval
+
+    def save(self, vector_store: FAISS, manifest: IndexManifest):
+        """
+        Writes a checkpoint. The manifest has to list exactly the sources in the vector store.
+
+        Args:
+            vector_store (FAISS): The vector store being built.
+            manifest (IndexManifest): Manifest of the sources in the vector store.
+        """
+
+        self._path.mkdir(exist_ok=True)
+        (self._path / "fingerprint").write_text(self._fingerprint)
+
+        # Documents beyond the manifest's ids (added after the checkpoint) are overwritten on resume
+        vector_store.docstore.save(vector_store.docstore.path)
+
+        tmp_path = self._path / f"{INDEX_FILE}.tmp"
+        faiss.write_index(vector_store.index, tmp_path.as_posix())
+        tmp_path.replace(self._path / INDEX_FILE)
+
+        manifest.save(self._path)
+        self._saved = time.monotonic()
+
+    def clear(self):
+        shutil.rmtree(self._path, ignore_errors=True)
@@ -0,0 +1,384 @@
+import re
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Callable
+from itertools import islice
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .caches import LRUCache
+from .tracing import span
+
+
+# SQLite limits the number of host parameters in a single statement
+_SQL_BATCH = 500
+
+
+def _batched(items: list, size: int):
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    CachedEmbeddings is a caching wrapper around any embeddings backend.
+    Document vectors are stored in a memory-mapped matrix on disk, keyed by the model id
+    and the hash of the embedded text, so identical texts are never embedded twice.
+    The cache is size-bounded, the least recently used vectors are evicted first.
+    Query vectors are kept in a separate in-memory LRU cache.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_id: str,
+        cache_root: Path,
+        capacity: int,
+        query_cache: LRUCache | None = None,
+        embed_queries: Callable[[list[str]], list[list[float]]] | None = None,
+    ):
+        """
+        Initializes the cache for the given embeddings backend.
+
+        Args:
+            embeddings (Embeddings): The underlying embeddings backend.
+            model_id (str): Identifier of the embedding model (vectors of different models never mix).
+            cache_root (Path): Directory to store the caches of all models in.
+            capacity (int): Maximum number of vectors kept in the cache (0 disables the cache).
+            query_cache (LRUCache | None): In-memory cache of the query vectors (None disables it).
+            embed_queries (Callable | None): Encodes a batch of queries with a single backend call
+                (if None, the queries of a batch are encoded one by one).
+        """
+
+        self._embeddings = embeddings
+        self._query_cache = query_cache or LRUCache(0, 0)
+        self._embed_queries = embed_queries
+        self._capacity = capacity
+        self._lock = threading.Lock()
+
+        self.hits, self.misses = 0, 0
+
+        self._root = cache_root / re.sub(r"[^\w.-]", "_", model_id)
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self._root / "vectors.f32"
+
+        self._db = sqlite3.connect(self._root / "index.sqlite", check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key BLOB PRIMARY KEY,
+                row INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+
+        meta = dict(self._db.execute("SELECT name, value FROM meta").fetchall())
+        self._dim: int | None = meta.get("dim")
+        self._size: int = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        self._clock: int = self._db.execute("SELECT COALESCE(MAX(last_used), 0) FROM entries").fetchone()[0]
+
+        self._vectors: np.memmap | None = None
+        if self._dim is not None and self._vectors_path.exists():
+            rows = self._vectors_path.stat().st_size // (4 * self._dim)
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(rows, self._dim))
+
+        if 0 < self._capacity < self._size:
+            self._shrink()
+
+    def _shrink(self):
+        """
+        Evicts the least recently used vectors of a cache reopened with a smaller capacity.
+        The kept vectors are compacted into the first rows, as the rows are allocated in order.
+        """
+
+        kept = self._db.execute(
+            "SELECT key, row, last_used FROM entries ORDER BY last_used DESC LIMIT ?",
+            (self._capacity,),
+        ).fetchall()
+
+        self._db.execute("DELETE FROM entries")
+        self._db.executemany(
+            "INSERT INTO entries VALUES (?, ?, ?)",
+            [(key, row, last_used) for row, (key, _, last_used) in enumerate(kept)],
+        )
+
+        if self._vectors is not None:
+            vectors = np.array(self._vectors[[row for _, row, _ in kept]])
+            self._vectors = None
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(len(kept) * self._dim * 4)
+            if len(kept):
+                self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=vectors.shape)
+                self._vectors[:] = vectors
+                self._vectors.flush()
+
+        self._db.commit()
+        self._size = len(kept)
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).digest()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _lookup(self, keys: list[bytes]) -> dict[bytes, np.ndarray]:
+        """
+        Reads the cached vectors and marks them as recently used.
+
+        Args:
+            keys (list[bytes]): Unique text keys to look up.
+
+        Returns:
+            dict[bytes, np.ndarray]: Mapping from the found keys to (copies of) their vectors.
+        """
+
+        # A size of 0 disables the cache
+        if self._capacity <= 0:
+            return {}
+
+        found = {}
+        for batch in _batched(keys, _SQL_BATCH):
+            found.update(self._db.execute(
+                f"SELECT key, row FROM entries WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchall())
+
+        if not found:
+            return {}
+
+        self._clock += 1
+        self._db.executemany(
+            "UPDATE entries SET last_used = ? WHERE key = ?",
+            [(self._clock, key) for key in found],
+        )
+
+        vectors = np.array(self._vectors[list(found.values())])
+        return dict(zip(found, vectors))
+
+    def _allocate_rows(self, count: int) -> list[int]:
+        """
+        Reserves rows for new vectors, evicting the least recently used ones if the cache is full.
+
+        Args:
+            count (int): Number of rows to reserve (at most the cache capacity).
+
+        Returns:
+            list[int]: The reserved rows.
+        """
+
+        fresh = max(0, min(count, self._capacity - self._size))
+        rows = list(range(self._size, self._size + fresh))
+
+        if fresh < count:
+            evicted = self._db.execute(
+                "SELECT key, row FROM entries ORDER BY last_used LIMIT ?",
+                (count - fresh,),
+            ).fetchall()
+            self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+            rows.extend(row for _, row in evicted)
+
+        self._size += fresh
+        self._ensure_rows(self._size)
+
+        return rows
+
+    def _ensure_rows(self, count: int):
+        """
+        Grows the memory-mapped vectors file (geometrically, up to the capacity).
+
+        Args:
+            count (int): Number of rows the file has to hold.
+        """
+
+        allocated = 0 if self._vectors is None else self._vectors.shape[0]
+        if count <= allocated:
+            return
+
+        rows = min(self._capacity, max(count, 2 * allocated, 1024))
+        if self._vectors is not None:
+            self._vectors.flush()
+
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(rows * self._dim * 4)
+
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(rows, self._dim))
+
+    def _store(self, keys: list[bytes], vectors: np.ndarray):
+        """
+        Writes freshly computed vectors into the cache.
+
+        Args:
+            keys (list[bytes]): Unique keys of the embedded texts.
+            vectors (np.ndarray): The respective vectors.
+        """
+
+        if self._capacity <= 0:
+            return
+
+        if self._dim is None:
+            self._dim = vectors.shape[1]
+            self._db.execute("INSERT INTO meta VALUES ('dim', ?)", (self._dim,))
+
+        # Batches larger than the cache can only keep their tail
+        keys, vectors = keys[-self._capacity:], vectors[-self._capacity:]
+
+        rows = self._allocate_rows(len(keys))
+        self._vectors[rows] = vectors
+        self._vectors.flush()
+
+        self._clock += 1
+        self._db.executemany(
+            "INSERT INTO entries VALUES (?, ?, ?)",
+            [(key, row, self._clock) for key, row in zip(keys, rows)],
+        )
+
+    def _split(self, texts: list[str]) -> tuple[list[bytes], dict[bytes, np.ndarray], dict[bytes, str]]:
+        """
+        Splits the texts into the cached ones and the ones to be embedded.
+
+        Args:
+            texts (list[str]): Texts to be encoded.
+
+        Returns:
+            tuple[list[bytes], dict[bytes, np.ndarray], dict[bytes, str]]: Keys of all texts,
+                the cached vectors and the (unique) texts missing in the cache.
+        """
+
+        keys = [self._key(t) for t in texts]
+        cached = self._lookup(list(dict.fromkeys(keys)))
+        self._db.commit()
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        hits = sum(1 for key in keys if key in cached)
+        self.hits, self.misses = self.hits + hits, self.misses + len(keys) - hits
+
+        return keys, cached, missing
+
+    def _merge(
+        self,
+        keys: list[bytes],
+        cached: dict[bytes, np.ndarray],
+        missing: list[bytes],
+        computed: np.ndarray,
+    ) -> list[list[float]]:
+        """
+        Stores the computed vectors and assembles the result in the order of the input texts.
+
+        Args:
+            keys (list[bytes]): Keys of all encoded texts.
+            cached (dict[bytes, np.ndarray]): Vectors found in the cache.
+            missing (list[bytes]): Keys of the embedded texts.
+            computed (np.ndarray): Vectors computed by the underlying backend (float32 matrix,
+                lists or arrays of the backends are normalised by the callers).
+
+        Returns:
+            list[list[float]]: List of dense vector representations for each text.
+        """
+
+        if missing:
+            cached = cached | dict(zip(missing, computed))
+
+            # Another thread might have cached some of the texts in the meantime
+            known = self._lookup(missing)
+            new = [i for i, key in enumerate(missing) if key not in known]
+            if new:
+                self._store([missing[i] for i in new], computed[new])
+
+            self._db.commit()
+
+        return [cached[key].tolist() for key in keys]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Encodes a list of documents, computing only the vectors missing in the cache.
+
+        Args:
+            texts (list[str]): List of document strings to encode.
+
+        Returns:
+            list[list[float]]: List of dense vector representations for each document.
+        """
+
+        with self._lock:
+            keys, cached, missing = self._split(texts)
+
+        computed = self._embeddings.embed_documents(list(missing.values())) if missing else []
+        computed = np.asarray(computed, dtype=np.float32)
+
+        with self._lock:
+            return self._merge(keys, cached, list(missing), computed)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            keys, cached, missing = self._split(texts)
+
+        computed = await self._embeddings.aembed_documents(list(missing.values())) if missing else []
+        computed = np.asarray(computed, dtype=np.float32)
+
+        with self._lock:
+            return self._merge(keys, cached, list(missing), computed)
+
+    def embed_query(self, text: str) -> list[float]:
+        with span("embed_query", query_bytes=len(text.encode())) as attributes:
+            vector = self._query_cache.get(text)
+            attributes["cached"] = vector is not None
+            if vector is None:
+                vector = self._embeddings.embed_query(text)
+                self._query_cache.put(text, vector)
+
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        with span("embed_query", query_bytes=len(text.encode())) as attributes:
+            vector = self._query_cache.get(text)
+            attributes["cached"] = vector is not None
+            if vector is None:
+                vector = await self._embeddings.aembed_query(text)
+                self._query_cache.put(text, vector)
+
+        return vector
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """
+        Encodes a batch of queries, computing only the vectors missing in the query cache.
+
+        Args:
+            texts (list[str]): List of queries to encode.
+
+        Returns:
+            list[list[float]]: List of dense vector representations for each query.
+        """
+
+        with span("embed_queries", queries=len(texts)) as attributes:
+            vectors = {text: self._query_cache.get(text) for text in dict.fromkeys(texts)}
+            missing = [text for text, vector in vectors.items() if vector is None]
+            attributes["cached"] = len(vectors) - len(missing)
+
+            if missing:
+                if self._embed_queries is not None:
+                    computed = self._embed_queries(missing)
+                else:
+                    computed = [self._embeddings.embed_query(text) for text in missing]
+
+                for text, vector in zip(missing, computed):
+                    vectors[text] = list(vector)
+                    self._query_cache.put(text, vectors[text])
+
+        return [vectors[text] for text in texts]
+
+    async def aembed_queries(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self.embed_queries, texts)
+
+    def clear_queries(self):
+        # The document vectors are kept, only the in-memory query vectors are dropped
+        self._query_cache.clear()
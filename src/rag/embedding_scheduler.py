@@ -0,0 +1,234 @@
+import time
+import random
+import asyncio
+import threading
+from typing import Callable, Iterator
+
+from langchain_core.embeddings import Embeddings
+
+
+# HTTP statuses of throttled and transiently failing requests
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def _causes(error: BaseException) -> Iterator[BaseException]:
+    # Clients wrap the transport errors, e.g. `GoogleGenerativeAIError` from a `ResourceExhausted`
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def _status(error: BaseException) -> int | None:
+    # aiohttp names the HTTP status `status`, openai `status_code` and google-api-core `code`
+    for cause in _causes(error):
+        for name in ("status", "status_code", "code"):
+            if isinstance(value := getattr(cause, name, None), int):
+                return value
+
+    return None
+
+
+def _retry_after(error: BaseException) -> float | None:
+    for cause in _causes(error):
+        headers = getattr(cause, "headers", None) or getattr(getattr(cause, "response", None), "headers", None)
+        try:
+            if headers and "Retry-After" in headers:
+                return float(headers["Retry-After"])
+        except (TypeError, ValueError):  # HTTP-date values are not supported
+            return None
+
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Decides, whether a failed embedding request is worth retrying: throttled requests (429),
+    server errors and timeouts or connection failures are, client errors are not.
+
+    Args:
+        error (BaseException): Error raised by the embeddings backend.
+
+    Returns:
+        bool: True, if the request should be retried.
+    """
+
+    status = _status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+
+    return any(isinstance(cause, (TimeoutError, OSError)) for cause in _causes(error))
+
+
+class TokenBucket:
+    """
+    TokenBucket limits the rate of requests. Tokens are refilled at a constant rate and up to `burst`
+    of them are saved up; every request takes one. Waiting requests are served in their order of arrival.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        Initializes a full bucket.
+
+        Args:
+            rate (float): Tokens refilled per second (0 disables the limit).
+            burst (int): Capacity of the bucket.
+        """
+
+        self._rate = rate
+        self._burst = max(burst, 1)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if now > self._updated:
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+
+    async def acquire(self):
+        # The lock queues the waiting requests, the first one sleeps until its token is available
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = self._updated - time.monotonic()
+                if self._rate > 0:
+                    wait += max(1 - self._tokens, 0) / self._rate
+                if wait <= 0:
+                    break
+
+                await asyncio.sleep(wait)
+
+            if self._rate > 0:
+                self._tokens -= 1
+
+    def pause(self, seconds: float):
+        """
+        Empties the bucket and stops the refill for a while, e.g. once the server throttles the requests.
+
+        Args:
+            seconds (float): Duration of the pause.
+        """
+
+        self._refill()
+        self._tokens = min(self._tokens, 0)
+        self._updated = max(self._updated, time.monotonic() + seconds)
+
+
+class EmbeddingScheduler(Embeddings):
+    """
+    EmbeddingScheduler sends the documents to an embeddings backend as concurrent batch requests.
+    At most `max_in_flight` requests are pending at a time and they are started at the rate of a token
+    bucket. Throttled and transiently failed requests are retried with exponential backoff and full jitter
+    (or after the `Retry-After` of the response), throttling also pauses the bucket for all other requests.
+
+    The requests run on an event loop in a background thread, so the synchronous and asynchronous
+    callers (also from multiple threads) share the limits. Queries are passed through unscheduled.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = 100,
+        max_in_flight: int = 4,
+        rate: float = 10.0,
+        burst: int = 10,
+        max_retries: int = 6,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        retryable: Callable[[BaseException], bool] = is_retryable,
+    ):
+        """
+        Initializes the scheduler for the given embeddings backend.
+
+        Args:
+            embeddings (Embeddings): The underlying embeddings backend.
+            batch_size (int): Maximum number of documents per request.
+            max_in_flight (int): Maximum number of concurrent requests.
+            rate (float): Requests started per second (0 disables the limit).
+            burst (int): Number of requests, which can be started at once after an idle period.
+            max_retries (int): Number of retries of a request, before its error is raised.
+            backoff (float): Upper bound of the first retry delay in seconds, doubled with every retry.
+            max_backoff (float): Upper bound of the retry delay in seconds.
+            retryable (Callable[[BaseException], bool]): Decides, which errors are retried.
+        """
+
+        self._embeddings = embeddings
+        self._batch_size = batch_size
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._retryable = retryable
+
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="embedding-scheduler", daemon=True).start()
+
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._bucket = TokenBucket(rate, burst)
+
+        self.requests, self.retries, self.throttled = 0, 0, 0
+
+    async def _request(self, texts: list[str]) -> list[list[float]]:
+        """
+        Sends a single batch request, retrying it on transient errors.
+
+        Args:
+            texts (list[str]): Documents of the batch.
+
+        Returns:
+            list[list[float]]: Vectors of the documents.
+        """
+
+        for attempt in range(self._max_retries + 1):
+            async with self._in_flight:
+                await self._bucket.acquire()
+                self.requests += 1
+                try:
+                    return await self._embeddings.aembed_documents(texts)
+                except Exception as e:
+                    if attempt == self._max_retries or not self._retryable(e):
+                        raise
+                    error = e
+
+            # The slot is released while waiting, so other requests can proceed
+            delay = random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
+            if _status(error) == 429:
+                retry_after = _retry_after(error)
+                if retry_after is not None:
+                    delay += retry_after
+
+                self.throttled += 1
+                self._bucket.pause(delay)
+
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def _embed(self, texts: list[str]) -> list[list[float]]:
+        batches = [texts[i:i + self._batch_size] for i in range(0, len(texts), self._batch_size)]
+        results = await asyncio.gather(*map(self._request, batches))
+        return [vector for result in results for vector in result]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Encodes a list of documents with concurrent batch requests.
+
+        Args:
+            texts (list[str]): List of document strings to encode.
+
+        Returns:
+            list[list[float]]: List of dense vector representations for each document.
+        """
+
+        return asyncio.run_coroutine_threadsafe(self._embed(texts), self._loop).result()
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._embed(texts), self._loop))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self._embeddings.aembed_query(text)
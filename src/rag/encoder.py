@@ -14,46 +14,97 @@ class PretrainedEmbeddings(Embeddings):
     """
     PretrainedEmbeddings is a wrapper around transformer-based models for generating embeddings.
     It supports encoding text into dense vector representations for use in retrieval tasks.
+    Texts are encoded in batches of similar token length to keep the padding overhead low.
     """
 
-    def __init__(self, model: str):
+    def __init__(self, model: str, batch_size: int = config.encoder_batch_size, max_length: int = 512):
         """
         Initializes the PretrainedEmbeddings class with a specified transformer model.
 
         Args:
             model (str): The name or path of the pretrained transformer model.
+            batch_size (int): Number of texts encoded in a single forward pass.
+            max_length (int): Maximum number of tokens per text, longer texts are truncated.
         """
 
         self._tokenizer = AutoTokenizer.from_pretrained(model)
         self._device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self._model = AutoModel.from_pretrained(model).to(self._device)
+        self._model = AutoModel.from_pretrained(model).to(self._device).eval()
 
-    def _encode(self, text: str) -> np.ndarray:
+        self._batch_size = batch_size
+        self._max_length = max_length
+
+    def encode(self, texts: list[str]) -> np.ndarray:
         """
-        Encodes a single text string into a dense vector representation.
+        Encodes texts into dense vector representations.
+
+        The texts are tokenized once, sorted by their token length and split into batches,
+        so every batch is padded only up to its own longest text. The last hidden state is
+        mean-pooled over the non-padding tokens.
 
         Args:
-            text (str): The input text to encode.
+            texts (list[str]): The input texts to encode.
 
         Returns:
-            np.ndarray: The dense vector representation of the input text.
+            np.ndarray: Contiguous float32 matrix with one row per input text (in input order).
         """
 
-        tokens = self._tokenizer(
-            text,
-            return_tensors="pt",
-            padding=True,
+        result = np.empty((len(texts), self._model.config.hidden_size), dtype=np.float32)
+        if not texts:
+            return result
+
+        tokenized = self._tokenizer(
+            texts,
             truncation=True,
-            max_length=512,
+            max_length=self._max_length,
         )
+        encoded = [
+            {key: tokenized[key][i] for key in tokenized.keys()}
+            for i in range(len(texts))
+        ]
+
+        # Longest batches go first, so running out of memory happens early
+        lengths = np.fromiter((len(e["input_ids"]) for e in encoded), dtype=np.int64, count=len(texts))
+        order = np.argsort(-lengths, kind="stable")
+
+        for start in range(0, len(texts), self._batch_size):
+            batch_idx = order[start:start + self._batch_size]
+            tokens = self._pad([encoded[i] for i in batch_idx], lengths[batch_idx[0]])
+
+            tokens = {key: val.to(self._device) for key, val in tokens.items()}
+            with torch.inference_mode():
+                output = self._model(**tokens)
+
+            # Mean of the last hidden state over the attended (non-padding) tokens
+            mask = tokens["attention_mask"].unsqueeze(-1).to(output.last_hidden_state.dtype)
+            pooled = (output.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+
+            result[batch_idx] = pooled.float().cpu().numpy()
+
+        return result
+
+    def _pad(self, encoded: list[dict[str, list[int]]], width: int) -> dict[str, torch.Tensor]:
+        """
+        Right-pads tokenized texts into batch tensors.
+
+        Args:
+            encoded (list[dict[str, list[int]]]): Tokenizer outputs of the texts in the batch.
+            width (int): Token length of the longest text in the batch.
+
+        Returns:
+            dict[str, torch.Tensor]: Model inputs for the batch.
+        """
+
+        tokens = {}
+        for key in encoded[0]:
+            pad_value = self._tokenizer.pad_token_id if key == "input_ids" else 0
+            values = np.full((len(encoded), width), pad_value, dtype=np.int64)
+            for row, e in enumerate(encoded):
+                values[row, :len(e[key])] = e[key]
 
-        tokens = {key: val.to(self._device) for key, val in tokens.items()}
-        with torch.no_grad():
-            output = self._model(**tokens)
+            tokens[key] = torch.from_numpy(values)
 
-        # Compute the mean of the last hidden state to get the embedding
-        embedding = output.last_hidden_state.mean(dim=1).squeeze().cpu().numpy()
-        return embedding
+        return tokens
 
     def embed_documents(self, documents: list[str]) -> list[list[float]]:
         """
@@ -63,9 +114,10 @@ class PretrainedEmbeddings(Embeddings):
             documents (list[str]): List of document strings to encode.
 
         Returns:
-            list[list[float]]: List of dense vector representations for each document.
+            list[list[float]]: Dense vector representations for each document
+                (rows of a float32 matrix).
         """
-        return [self._encode(doc) for doc in documents]
+        return self.encode(documents)
 
     def embed_query(self, text: str) -> list[float]:
         """
@@ -77,7 +129,7 @@ class PretrainedEmbeddings(Embeddings):
         Returns:
             list[float]: The dense vector representation of the query.
         """
-        return self._encode(text)
+        return self.encode([text])[0]
 
 
 if __name__ == "__main__":
@@ -1,30 +1,33 @@
-from typing import Literal
+import asyncio
+from functools import cache
+from typing import Literal, TYPE_CHECKING
+from collections import defaultdict
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.state import CompiledStateGraph
-from langchain_openai import ChatOpenAI
 from langchain_core.runnables import Runnable
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
 from scheme.config import PathConfig, RAGConfig
-from scheme.graph import RAGState
-from utils.prompts import make_context_prompt
+from scheme.graph import RAGState, TaskConfig
+from utils.prompts import make_context_prompt, count_tokens
+from utils.text import identifiers
+from .caches import LLMResponseCache
+from .symbols import rank_symbol_files
+from .tracing import span, traced, UsageRecorder
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+    from .rerank import CrossEncoderReranker
 
 
 # Load global configurations for paths and RAG settings
 path_config, rag_config = PathConfig(), RAGConfig()
 
-llm = ChatOpenAI(
-    openai_api_key=rag_config.api_key,
-    openai_api_base="https://openrouter.ai/api/v1",
-    model_name=rag_config.llm_slug,
-)
-
-
-# Chain preparation for different LLM use-cases
-chains: dict[str, Runnable] = {}
+# Responses are cached by the prompt (including the retrieved context) and the model
+llm_cache = LLMResponseCache(path_config.llm_cache_path, rag_config.llm_cache_size, rag_config.llm_cache_ttl)
 
 # Define a chat prompt template with placeholders for system, context, and user messages
 chat_template = ChatPromptTemplate.from_messages([
@@ -33,51 +36,326 @@ chat_template = ChatPromptTemplate.from_messages([
     MessagesPlaceholder("user"),
 ])
 
-for f_name in path_config.prompts_root.glob("*.txt"):
-    with open(f_name) as f:
-        slug = f_name.name.split(".")[0]
-        chains[slug] = (
+
+# The LLM client and the chains are created on their first use, modes without LLM calls never import them
+@cache
+def get_llm() -> "ChatOpenAI":
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        openai_api_key=rag_config.api_key,
+        openai_api_base=rag_config.llm_base_url,
+        model_name=rag_config.llm_slug,
+        cache=llm_cache,
+        callbacks=[UsageRecorder()],
+    )
+
+
+@cache
+def get_chain(slug: str) -> Runnable:
+    """
+    Prepares the chain of an LLM use-case from its system prompt (`<prompts_root>/<slug>.txt`).
+
+    Args:
+        slug (str): Name of the use-case, e.g. "expand" or "summarize".
+
+    Returns:
+        Runnable: The chain, mapping the user and context messages to the response text.
+    """
+
+    with open(path_config.prompts_root / f"{slug}.txt") as f:
+        return (
             chat_template.partial(system=[f.read()])
-            | llm
+            | get_llm()
             | StrOutputParser()
         )
 
 
-# Graph nodes
-async def _expander(state: RAGState) -> RAGState:
-    query = state["question"]
-    extended = await chains["expand"].ainvoke({
+# Helpers
+async def _expand(query: str, verbose: bool) -> str:
+    extended = await get_chain("expand").ainvoke({
         "user": [query],
         "context": [""],
     })
 
-    if state["task_config"].verbose:
+    if verbose:
         print(f"Expanded query: {extended}")
 
+    return extended
+
+
+async def expand_queries(queries: list[str], concurrency: int, timeout: float | None = None) -> list[str | None]:
+    """
+    Expands a batch of queries by LLM.
+
+    Args:
+        queries (list[str]): The input query strings.
+        concurrency (int): Maximum number of concurrent LLM calls.
+        timeout (float | None): Seconds every expansion may take once it is started, slower ones are cancelled.
+
+    Returns:
+        list[str | None]: The expanded queries, in the order of the input (None for the timed out ones).
+    """
+
+    if timeout is None:
+        return await get_chain("expand").abatch(
+            [{"user": [query], "context": [""]} for query in queries],
+            config={"max_concurrency": concurrency},
+        )
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def expand(query: str) -> str | None:
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(_expand(query, False), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+
+    return await asyncio.gather(*map(expand, queries))
+
+
+async def _answer(question: str, retrieved: list[str]) -> str:
+    # Reranked files are precise enough to answer from the top few, which keeps the prompt small
+    if rag_config.rerank:
+        retrieved = retrieved[:rag_config.rerank_top]
+
+    with span("context", files=len(retrieved)) as attributes:
+        context = await make_context_prompt(retrieved, question)
+        attributes["context_bytes"] = len(context.encode())
+        attributes["context_tokens"] = count_tokens(context)
+
+    with span("llm"):
+        return await get_chain("summarize").ainvoke({
+            "user": [question],
+            "context": [context],
+        })
+
+
+async def answer_questions(questions: list[str], retrieved: list[list[str]], concurrency: int) -> list[str]:
+    """
+    Answers a batch of questions from their retrieved files.
+
+    Args:
+        questions (list[str]): The questions.
+        retrieved (list[list[str]]): Retrieved files of every question.
+        concurrency (int): Maximum number of concurrent LLM calls.
+
+    Returns:
+        list[str]: The answers, in the order of the questions.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(question: str, files: list[str]) -> str:
+        async with semaphore:
+            return await _answer(question, files)
+
+    return await asyncio.gather(*[answer(q, files) for q, files in zip(questions, retrieved)])
+
+
+def _fuse_sources(rankings: list[list[str]], k: int, c: int = 60) -> list[str]:
+    """
+    Fuses ranked lists of sources with reciprocal rank fusion.
+
+    Args:
+        rankings (list[list[str]]): Ranked lists of sources, ties are resolved in favour of the earlier lists.
+        k (int): Number of sources to return.
+        c (int): RRF constant.
+
+    Returns:
+        list[str]: Top `k` fused sources.
+    """
+
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, source in enumerate(ranking, start=1):
+            scores[source] += 1 / (c + rank)
+
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+def search_kwargs(task_config: TaskConfig) -> dict:
+    # Only the sharded retriever restricts the search to a subset of the repositories
+    return {"shards": task_config.shards} if task_config.shards else {}
+
+
+def match_symbols(retriever: BaseRetriever, question: str, task_config: TaskConfig) -> tuple[list[str], bool]:
+    """
+    Looks up the identifiers of a question in the symbol index of the retriever.
+
+    Args:
+        retriever (BaseRetriever): The retriever (with a `lookup_symbols` method).
+        question (str): The question.
+        task_config (TaskConfig): Configuration of the task (searched shards, verbosity).
+
+    Returns:
+        tuple[list[str], bool]: Files of the symbols (defining files first) and whether
+            they answer the question without a search.
+    """
+
+    names = identifiers(question)
+    if not names:
+        return [], False
+
+    with span("symbol_lookup", names=len(names)) as attributes:
+        hits = retriever.lookup_symbols(names, **search_kwargs(task_config))
+        sources, confident = rank_symbol_files(hits, rag_config.top_k, rag_config.symbol_max_definitions)
+        attributes["hits"], attributes["confident"] = len(hits), confident
+
+    if task_config.verbose:
+        for hit in hits:
+            if hit.definition:
+                print(f"Symbol definition: {hit.source}:{hit.start_line}-{hit.end_line}")
+
+    return sources, confident
+
+
+async def speculative_search(
+    retriever: BaseRetriever,
+    queries: list[str],
+    seeds: list[list[str]],
+    task_config: TaskConfig,
+    concurrency: int,
+) -> tuple[list[str], list[list[str]]]:
+    """
+    Batch counterpart of the speculative retrieval: the raw queries are searched while they are expanded,
+    the expansions finished within `EXPAND_TIMEOUT` are searched as well and fused with the raw results.
+
+    Args:
+        retriever (BaseRetriever): The retriever (with an `abatch_search` method).
+        queries (list[str]): The raw queries.
+        seeds (list[list[str]]): Files of the ambiguous symbols of every query (see `match_symbols`).
+        task_config (TaskConfig): Configuration of the retrieval.
+        concurrency (int): Maximum number of concurrent LLM calls.
+
+    Returns:
+        tuple[list[str], list[list[str]]]: The queries (expanded, where the expansion finished in time)
+            and their sources, in the order of the input.
+    """
+
+    kwargs = search_kwargs(task_config)
+
+    # Retrieval on the raw queries does not wait for the expansions
+    raw_search = asyncio.create_task(retriever.abatch_search(queries, **kwargs))
+    try:
+        with span("expand", queries=len(queries)):
+            expanded = await expand_queries(queries, concurrency, timeout=rag_config.expand_timeout)
+    except BaseException:
+        raw_search.cancel()
+        await asyncio.gather(raw_search, return_exceptions=True)
+        raise
+
+    sources = [seed_sources([d.metadata["source"] for d in docs], s) for docs, s in zip(await raw_search, seeds)]
+    finished = [i for i, query in enumerate(expanded) if query is not None]
+    if task_config.verbose and len(finished) < len(queries):
+        print(f"{len(queries) - len(finished)} query expansions timed out, using the raw query results")
+
+    queries = list(queries)
+    if finished:
+        results = await retriever.abatch_search([expanded[i] for i in finished], **kwargs)
+        for i, documents in zip(finished, results):
+            extended_sources = [d.metadata["source"] for d in documents]
+            queries[i] = expanded[i]
+            sources[i] = _fuse_sources([extended_sources, sources[i]], max(len(extended_sources), len(sources[i])))
+
+    return queries, sources
+
+
+def seed_sources(sources: list[str], seeds: list[str] | None) -> list[str]:
+    # Files of ambiguous symbols are fused into the searched ones, rather than replacing them
+    return _fuse_sources([sources, seeds], max(len(sources), len(seeds))) if seeds else sources
+
+
+# Graph nodes
+def _symbols(retriever: BaseRetriever):
+    async def helper(state: RAGState) -> RAGState:
+        sources, confident = match_symbols(retriever, state["question"], state["task_config"])
+        if confident:
+            return state | {
+                "retrieved": sources,
+                "answer": None,
+            }
+
+        return state | {
+            "seeds": sources,
+        }
+
+    return helper
+
+
+async def _expander(state: RAGState) -> RAGState:
     return state | {
-        "question": extended,
+        "question": await _expand(state["question"], state["task_config"].verbose),
     }
 
 
 def _retrieve(retriever: BaseRetriever):
     async def helper(state: RAGState) -> RAGState:
-        relevant_docs = await retriever.ainvoke(state["question"])
+        relevant_docs = await retriever.ainvoke(state["question"], **search_kwargs(state["task_config"]))
         return state | {
-            "retrieved": [d.metadata["source"] for d in relevant_docs],
+            "retrieved": seed_sources([d.metadata["source"] for d in relevant_docs], state.get("seeds")),
             "answer": None,
         }
     
     return helper
 
 
-async def _summary(state: RAGState) -> RAGState:
-    result = await chains["summarize"].ainvoke({
-        "user": [state["question"]],
-        "context": [make_context_prompt(state["retrieved"])],
-    })
+def _speculative_retrieve(retriever: BaseRetriever):
+    async def helper(state: RAGState) -> RAGState:
+        query, verbose = state["question"], state["task_config"].verbose
+        kwargs = search_kwargs(state["task_config"])
+
+        async def expand() -> str:
+            with span("expand"):
+                return await _expand(query, verbose)
+
+        # Retrieval on the raw question does not wait for the expansion
+        raw_search = asyncio.create_task(retriever.ainvoke(query, **kwargs))
+        expansion = asyncio.create_task(expand())
+
+        try:
+            extended = await asyncio.wait_for(expansion, timeout=rag_config.expand_timeout)
+        except asyncio.TimeoutError:
+            extended = None
+            if verbose: print("Query expansion timed out, using the raw query results")
+        except BaseException:
+            # The raw search must not outlive a failed (or cancelled) expansion
+            raw_search.cancel()
+            await asyncio.gather(raw_search, return_exceptions=True)
+            raise
+
+        raw_sources = seed_sources([d.metadata["source"] for d in await raw_search], state.get("seeds"))
+        if extended is None:
+            return state | {
+                "retrieved": raw_sources,
+                "answer": None,
+            }
+
+        extended_sources = [d.metadata["source"] for d in await retriever.ainvoke(extended, **kwargs)]
+        return state | {
+            "question": extended,
+            "retrieved": _fuse_sources([extended_sources, raw_sources], max(len(extended_sources), len(raw_sources))),
+            "answer": None,
+        }
+
+    return helper
+
+
+def _rerank(reranker: "CrossEncoderReranker"):
+    async def helper(state: RAGState) -> RAGState:
+        # Scoring is CPU-bound, it runs off the event loop
+        reranked = await asyncio.to_thread(reranker.rerank, state["question"], state["retrieved"])
+        return state | {
+            "retrieved": reranked[:rag_config.top_k],
+        }
+
+    return helper
 
+
+async def _summary(state: RAGState) -> RAGState:
     return state | {
-        "answer": result,
+        "answer": await _answer(state["question"], state["retrieved"]),
     }
 
 
@@ -95,39 +373,88 @@ def _reponse_routing(state: RAGState) -> Literal["summary", "end"]:
     return "summary" if state["task_config"].summarize else "end"
 
 
-def _query_init(state: RAGState) -> Literal["expand", "retrieve"]:
+def _symbol_routing(state: RAGState) -> Literal["summary", "end", "speculate", "expand", "retrieve"]:
+    """
+    Skips the retrieval, if the symbol index already found the files of the question.
+
+    Args:
+        state (RAGState): The current state of the retrieval process.
+
+    Returns:
+        Literal["summary", "end", "speculate", "expand", "retrieve"]: The next node to transition to.
+    """
+
+    if state.get("retrieved") is not None:
+        return _reponse_routing(state)
+
+    return _query_init(state)
+
+
+def _query_init(state: RAGState) -> Literal["speculate", "expand", "retrieve"]:
     """
-    Determines the initial step based on whether query expansion is enabled.
+    Determines the initial step based on whether (speculative) query expansion is enabled.
 
     Args:
         state (RAGState): The current state of the retrieval process.
 
     Returns:
-        Literal["expand", "retrieve"]: The next node to transition to.
+        Literal["speculate", "expand", "retrieve"]: The next node to transition to.
     """
+
+    if state["task_config"].speculative_expansion:
+        return "speculate"
+
     return "expand" if state["task_config"].expand_query else "retrieve"
 
 
 # Graph compilation
-def build_graph(rag_retriever: BaseRetriever) -> CompiledStateGraph:
+def build_graph(rag_retriever: BaseRetriever, reranker: "CrossEncoderReranker | None" = None) -> CompiledStateGraph:
     builder = StateGraph(RAGState)
 
-    builder.add_node("llm_answer", _summary)
+    builder.add_node("llm_answer", traced("llm_answer", _summary))
+    builder.add_node("speculate", traced("speculate", _speculative_retrieve(rag_retriever)))
     builder.add_sequence([
-        ("expand", _expander),
-        ("retrieve", _retrieve(rag_retriever)),
+        ("expand", traced("expand", _expander)),
+        ("retrieve", traced("retrieve", _retrieve(rag_retriever))),
     ])
 
     builder.add_edge("llm_answer", END)
-    builder.add_conditional_edges(START, _query_init)
-    builder.add_conditional_edges(
-        "retrieve",
-        _reponse_routing,
-        {
-            "summary": "llm_answer",
-            "end": END,
-        }
-    )
+
+    # NOTE: set SYMBOL_ROUTING=false to search all queries, identifiers are then only matched by BM25
+    if rag_config.symbol_routing:
+        builder.add_node("symbols", traced("symbols", _symbols(rag_retriever)))
+        builder.add_edge(START, "symbols")
+        builder.add_conditional_edges(
+            "symbols",
+            _symbol_routing,
+            {
+                "summary": "llm_answer",
+                "end": END,
+                "speculate": "speculate",
+                "expand": "expand",
+                "retrieve": "retrieve",
+            }
+        )
+    else:
+        builder.add_conditional_edges(START, _query_init)
+
+    # The retrieved candidates are reranked before the answer
+    last = ("retrieve", "speculate")
+    if reranker is not None:
+        builder.add_node("rerank", traced("rerank", _rerank(reranker)))
+        for node in last:
+            builder.add_edge(node, "rerank")
+        last = ("rerank",)
+
+    for node in last:
+        builder.add_conditional_edges(
+            node,
+            _reponse_routing,
+            {
+                "summary": "llm_answer",
+                "end": END,
+            }
+        )
 
     return builder.compile()
 
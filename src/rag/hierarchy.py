@@ -0,0 +1,210 @@
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from .dense_store import MMAP_FLAGS
+from .manifest import IndexManifest
+
+
+def reconstruct(index: faiss.IndexIDMap2, labels: np.ndarray) -> np.ndarray:
+    """
+    Reads the stored vectors of the given labels from an ID-mapped index.
+
+    Args:
+        index (faiss.IndexIDMap2): The dense index.
+        labels (np.ndarray): Labels of the vectors.
+
+    Returns:
+        np.ndarray: The (for quantized indexes approximate) vectors, in the order of the labels.
+    """
+
+    # IVF indexes need a direct map to locate the vectors in their lists
+    ivf = faiss.try_extract_index_ivf(faiss.downcast_index(index.index))
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+    return index.reconstruct_batch(np.asarray(labels, dtype=np.int64))
+
+
+class FileIndex:
+    """
+    FileIndex is the coarse level of the hierarchical retrieval. It holds one pooled (mean) vector per
+    source file and the labels of the file's chunks in the dense index (CSR arrays). A query selects
+    the nearest files first, only their chunk vectors are then scored exactly.
+    """
+
+    DIR_NAME = "files"
+
+    def __init__(self, root: Path):
+        """
+        Loads the index from the cache directory.
+
+        Args:
+            root (Path): Directory containing the FAISS index cache.
+        """
+
+        root = root / self.DIR_NAME
+
+        self._index = faiss.read_index((root / "index.faiss").as_posix(), MMAP_FLAGS)
+        self._sources = np.load(root / "sources.npy", mmap_mode="r")
+        self._offsets = np.load(root / "offsets.npy", mmap_mode="r")
+        self._labels = np.load(root / "labels.npy", mmap_mode="r")
+
+        self._positions: dict[str, int] | None = None
+
+    @classmethod
+    def exists(cls, root: Path) -> bool:
+        return (root / cls.DIR_NAME / "labels.npy").exists()
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def vector(self, source: str) -> np.ndarray | None:
+        """
+        Looks up the pooled vector of a file.
+
+        Args:
+            source (str): Path of the source file.
+
+        Returns:
+            np.ndarray | None: The pooled vector or None, if the file is not indexed.
+        """
+
+        if self._positions is None:
+            self._positions = {s.decode(): i for i, s in enumerate(self._sources)}
+
+        position = self._positions.get(source)
+        return None if position is None else self._index.reconstruct(position)
+
+    def search(
+        self,
+        dense_index: faiss.IndexIDMap2,
+        vectors: np.ndarray,
+        file_k: int,
+        k: int,
+    ) -> tuple[list[list[tuple[int, float]]], int]:
+        """
+        Searches the nearest files of every query and scores the chunks of these files exactly.
+        Files are ranked by their best chunk.
+
+        Args:
+            dense_index (faiss.IndexIDMap2): The chunk-level index the vectors are read from.
+            vectors (np.ndarray): Query vectors.
+            file_k (int): Number of candidate files per query.
+            k (int): Number of returned files per query.
+
+        Returns:
+            tuple[list[list[tuple[int, float]]], int]: Label and L2 distance of the best chunk of the
+                top files of every query and the number of scored chunks.
+        """
+
+        _, files = self._index.search(vectors, file_k)
+
+        results, scored = [], 0
+        for vector, row in zip(vectors, files):
+            row = row[row != -1]
+            starts, ends = self._offsets[row], self._offsets[row + 1]
+            if not len(row) or not (ends - starts).sum():
+                results.append([])
+                continue
+
+            labels = np.concatenate([self._labels[s:e] for s, e in zip(starts, ends)])
+            distances = ((reconstruct(dense_index, labels) - vector) ** 2).sum(axis=1)
+            scored += len(labels)
+
+            # Files without chunks are skipped, their segments would be empty
+            bounds = np.concatenate([[0], np.cumsum(ends - starts)])
+            nonempty = np.flatnonzero(ends > starts)
+            best = np.minimum.reduceat(distances, bounds[nonempty])
+
+            top = []
+            for f in nonempty[np.argsort(best, kind="stable")[:k]]:
+                i = bounds[f] + distances[bounds[f]:bounds[f + 1]].argmin()
+                top.append((int(labels[i]), float(distances[i])))
+
+            results.append(top)
+
+        return results, scored
+
+
+class FileIndexBuilder:
+    """
+    FileIndexBuilder pools the chunk vectors of the indexed files and writes a `FileIndex`.
+    Vectors of the files not (re-)embedded are taken over from the previous file index.
+    """
+
+    def __init__(self, root: Path, previous: bool = True):
+        """
+        Initializes the builder.
+
+        Args:
+            root (Path): Directory containing the FAISS index cache.
+            previous (bool): If False, the previous file index is ignored and the vectors of the files
+                not pooled are reconstructed from the dense index (e.g. of a resumed build).
+        """
+
+        self._root = root / FileIndex.DIR_NAME
+        self._root.mkdir(parents=True, exist_ok=True)
+
+        self._previous = FileIndex(root) if previous and FileIndex.exists(root) else None
+        self._pooled: dict[str, np.ndarray] = {}
+
+    def add(self, source: str, vectors: np.ndarray):
+        """
+        Pools the chunk vectors of a (re-)embedded file.
+
+        Args:
+            source (str): Path of the source file.
+            vectors (np.ndarray): Vectors of the file's chunks.
+        """
+
+        if len(vectors):
+            self._pooled[source] = vectors.mean(axis=0)
+
+    def build(self, manifest: IndexManifest, dense_index: faiss.IndexIDMap2) -> FileIndex:
+        """
+        Writes the file index of the sources in the manifest. The files are replaced atomically,
+        so processes that have the previous index mapped keep working.
+
+        Args:
+            manifest (IndexManifest): Manifest with the chunk labels of every source.
+            dense_index (faiss.IndexIDMap2): The chunk-level index, used for the files pooled by neither
+                the builder nor the previous file index (e.g. caches created before the file index).
+
+        Returns:
+            FileIndex: The built (memory-mapped) index.
+        """
+
+        sources = list(manifest.documents)
+        labels = [manifest.documents[source]["ids"] for source in sources]
+
+        pooled = []
+        for source, ids in zip(sources, labels):
+            vector = self._pooled.get(source)
+            if vector is None and self._previous is not None:
+                vector = self._previous.vector(source)
+            if vector is None and ids:
+                vector = reconstruct(dense_index, np.asarray(ids)).mean(axis=0)
+            pooled.append(vector if vector is not None else np.zeros(dense_index.d, dtype=np.float32))
+
+        index = faiss.IndexFlatL2(dense_index.d)
+        if pooled:
+            index.add(np.vstack(pooled).astype(np.float32))
+
+        arrays = {
+            "sources": np.array([source.encode() for source in sources], dtype=bytes),
+            "offsets": np.concatenate([[0], np.cumsum([len(ids) for ids in labels])]).astype(np.int64),
+            "labels": np.asarray([label for ids in labels for label in ids], dtype=np.int64),
+        }
+
+        faiss.write_index(index, (self._root / "index.faiss.tmp").as_posix())
+        for name, array in arrays.items():
+            with open(self._root / f"{name}.npy.tmp", "wb") as f:
+                np.save(f, array)
+
+        # The labels are the marker of a complete index (see `FileIndex.exists`), they are moved last
+        for name in ["index.faiss", "sources.npy", "offsets.npy", "labels.npy"]:
+            (self._root / f"{name}.tmp").replace(self._root / name)
+
+        return FileIndex(self._root.parent)
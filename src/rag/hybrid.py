@@ -0,0 +1,284 @@
+import asyncio
+from typing import Literal
+
+import numpy as np
+from pydantic import ConfigDict
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_community.vectorstores import FAISS
+
+from .sparse import SparseIndex
+from .hierarchy import FileIndex
+from .symbols import SymbolIndex, SymbolHit
+from .caches import LRUCache
+from .tracing import span
+
+
+# Ranked list of documents with their scores (higher is better)
+Ranking = tuple[list[Document], np.ndarray]
+
+
+class FusionRetriever(BaseRetriever):
+    """
+    FusionRetriever fuses dense and sparse rankings with weighted reciprocal rank fusion
+    (or a weighted sum of min-max normalised scores) and deduplicates the result by the
+    source file of the documents. Results are cached per normalised query and index version.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    k: int = 10
+    dense_k: int = 10
+    sparse_k: int = 10
+    dense_weight: float = 1.0
+    sparse_weight: float = 0.0
+    fusion: Literal["rrf", "score"] = "rrf"
+    rrf_c: int = 60
+
+    cache: LRUCache | None = None
+    index_version: str = ""
+
+    def _cache_key(self, query: str) -> tuple[str, str]:
+        # Whitespace differences do not change the result
+        return self.index_version, " ".join(query.split())
+
+    def _dense_ranking(self, results: list[tuple[Document, float]]) -> Ranking:
+        # FAISS returns L2 distances, negate them to get "higher is better" scores
+        return [d for d, _ in results], -np.asarray([s for _, s in results], dtype=np.float32)
+
+    def _contributions(self, scores: np.ndarray, weight: float) -> np.ndarray:
+        """
+        Computes the fused score contributions of a single ranking.
+
+        Args:
+            scores (np.ndarray): Scores of the ranked documents, in descending order.
+            weight (float): Weight of the ranking.
+
+        Returns:
+            np.ndarray: Weighted contributions of the documents.
+        """
+
+        if self.fusion == "rrf":
+            return weight / (self.rrf_c + np.arange(1, len(scores) + 1, dtype=np.float32))
+
+        spread = scores.max() - scores.min() if len(scores) else 0.0
+        normalised = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+        return weight * normalised
+
+    def _fuse(self, rankings: list[tuple[Ranking, float]]) -> list[Document]:
+        """
+        Fuses the rankings and deduplicates the documents by their source.
+
+        Args:
+            rankings (list[tuple[Ranking, float]]): Rankings with their weights.
+
+        Returns:
+            list[Document]: Top `k` documents, at most one per source file.
+        """
+
+        rankings = [(ranking, weight) for ranking, weight in rankings if ranking[0]]
+        if not rankings:
+            return []
+
+        documents = [d for (docs, _), _ in rankings for d in docs]
+        sources, codes = np.unique([d.metadata["source"] for d in documents], return_inverse=True)
+
+        # Within a ranking a source counts once (with its best chunk), contributions add up across rankings
+        fused, offset = np.zeros(len(sources), dtype=np.float32), 0
+        for (docs, scores), weight in rankings:
+            best = np.zeros(len(sources), dtype=np.float32)
+            np.maximum.at(best, codes[offset:offset + len(docs)], self._contributions(scores, weight))
+            fused += best
+            offset += len(docs)
+
+        # The first (i.e. best ranked) document of every source represents it
+        _, first = np.unique(codes, return_index=True)
+        top = np.argsort(-fused, kind="stable")[:self.k]
+
+        return [documents[first[code]] for code in top]
+
+
+class HybridRetriever(FusionRetriever):
+    """
+    HybridRetriever combines dense (FAISS) and sparse (BM25) search.
+    Both searches run concurrently with their own depth and their rankings are fused.
+    With a file index, the dense search is hierarchical and returns the best chunk of distinct files.
+    Identifiers are looked up in the symbol index (if any) without searching.
+    """
+
+    dense: FAISS
+    sparse: SparseIndex | None = None
+
+    files: FileIndex | None = None
+    file_k: int = 32
+
+    symbols: SymbolIndex | None = None
+
+    def lookup_symbols(self, names: list[str]) -> list[SymbolHit]:
+        """
+        Looks up the definitions and references of identifiers in the symbol index.
+
+        Args:
+            names (list[str]): The identifiers.
+
+        Returns:
+            list[SymbolHit]: Hits of all identifiers (none, if there is no symbol index).
+        """
+
+        if self.symbols is None:
+            return []
+
+        return [hit for name in names for hit in self.symbols.lookup(name)]
+
+    def _sparse_search(self, query: str) -> Ranking:
+        with span("bm25_search") as attributes:
+            positions, scores = self.sparse.search(query, self.sparse_k)
+            attributes["hits"] = len(positions)
+            return [self.sparse.document(i) for i in positions], scores
+
+    def _file_search(self, vectors: np.ndarray) -> list[list[tuple[Document, float]]]:
+        """
+        Searches the nearest files of every query in the file index and scores their chunks exactly.
+
+        Args:
+            vectors (np.ndarray): Query vectors.
+
+        Returns:
+            list[list[tuple[Document, float]]]: Best chunk of the top `dense_k` files of every query with its distance.
+        """
+
+        with span("file_search", queries=len(vectors)) as attributes:
+            results, attributes["scored_chunks"] = self.files.search(self.dense.index, vectors, self.file_k, self.dense_k)
+            dense = [
+                [(self.dense.docstore.search(self.dense.index_to_docstore_id[label]), distance) for label, distance in hits]
+                for hits in results
+            ]
+            attributes["hits"] = sum(len(hits) for hits in dense)
+
+        return dense
+
+    def _dense_search(self, vector: list[float]) -> list[tuple[Document, float]]:
+        if self.files is not None:
+            return self._file_search(np.asarray([vector], dtype=np.float32))[0]
+
+        with span("faiss_search") as attributes:
+            results = self.dense.similarity_search_with_score_by_vector(vector, k=self.dense_k)
+            attributes["hits"] = len(results)
+            attributes["document_bytes"] = sum(len(d.page_content.encode()) for d, _ in results)
+            return results
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        if self.cache is not None and (cached := self.cache.get(self._cache_key(query))) is not None:
+            return list(cached)
+
+        vector = self.dense.embeddings.embed_query(query)
+        rankings = [(self._dense_ranking(self._dense_search(vector)), self.dense_weight)]
+        if self.sparse is not None and self.sparse_weight > 0:
+            rankings.append((self._sparse_search(query), self.sparse_weight))
+
+        documents = self._fuse(rankings)
+        if self.cache is not None:
+            self.cache.put(self._cache_key(query), documents)
+
+        return list(documents)
+
+    def _embed_queries(self, texts: list[str]) -> np.ndarray:
+        embeddings = self.dense.embeddings
+        if hasattr(embeddings, "embed_queries"):
+            vectors = embeddings.embed_queries(texts)
+        else:
+            vectors = [embeddings.embed_query(text) for text in texts]
+
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _dense_batch_search(self, vectors: np.ndarray) -> list[list[tuple[Document, float]]]:
+        """
+        Searches the vectors with a single matrix search of the FAISS index.
+
+        Args:
+            vectors (np.ndarray): Query vectors.
+
+        Returns:
+            list[list[tuple[Document, float]]]: Hits of every query with their distances.
+        """
+
+        if self.files is not None:
+            return self._file_search(vectors)
+
+        with span("faiss_search", queries=len(vectors)) as attributes:
+            distances, labels = self.dense.index.search(vectors, self.dense_k)
+            dense = [
+                [
+                    (self.dense.docstore.search(self.dense.index_to_docstore_id[label]), distance)
+                    for label, distance in zip(row_labels, row_distances) if label != -1
+                ]
+                for row_labels, row_distances in zip(labels.tolist(), distances.tolist())
+            ]
+            attributes["hits"] = sum(len(hits) for hits in dense)
+
+        return dense
+
+    def batch_search(self, queries: list[str]) -> list[list[Document]]:
+        """
+        Searches a batch of queries at once. The queries missing in the result cache are embedded
+        with a single call and searched with a single matrix search of the FAISS index.
+
+        Args:
+            queries (list[str]): The input query strings.
+
+        Returns:
+            list[list[Document]]: Top documents of every query, in the order of the queries.
+        """
+
+        results = [self.cache.get(self._cache_key(q)) if self.cache is not None else None for q in queries]
+        missing = [i for i, documents in enumerate(results) if documents is None]
+        if not missing:
+            return [list(documents) for documents in results]
+
+        texts = [queries[i] for i in missing]
+        dense = self._dense_batch_search(self._embed_queries(texts))
+
+        for i, text, hits in zip(missing, texts, dense):
+            rankings = [(self._dense_ranking(hits), self.dense_weight)]
+            if self.sparse is not None and self.sparse_weight > 0:
+                rankings.append((self._sparse_search(text), self.sparse_weight))
+
+            results[i] = self._fuse(rankings)
+            if self.cache is not None:
+                self.cache.put(self._cache_key(text), results[i])
+
+        return [list(documents) for documents in results]
+
+    async def abatch_search(self, queries: list[str]) -> list[list[Document]]:
+        return await asyncio.to_thread(self.batch_search, queries)
+
+    async def _adense_search(self, query: str) -> list[tuple[Document, float]]:
+        vector = await self.dense.embeddings.aembed_query(query)
+        return await asyncio.to_thread(self._dense_search, vector)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        if self.cache is not None and (cached := self.cache.get(self._cache_key(query))) is not None:
+            return list(cached)
+
+        searches = [self._adense_search(query)]
+        if self.sparse is not None and self.sparse_weight > 0:
+            searches.append(asyncio.to_thread(self._sparse_search, query))
+
+        dense, *sparse = await asyncio.gather(*searches)
+
+        rankings = [(self._dense_ranking(dense), self.dense_weight)]
+        rankings.extend((ranking, self.sparse_weight) for ranking in sparse)
+
+        documents = self._fuse(rankings)
+        if self.cache is not None:
+            self.cache.put(self._cache_key(query), documents)
+
+        return list(documents)
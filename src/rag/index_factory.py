@@ -0,0 +1,105 @@
+import math
+
+import faiss
+import numpy as np
+
+from scheme.config import RAGConfig
+
+
+# k-means needs a few dozen training points per centroid
+_POINTS_PER_CENTROID = 39
+
+
+def needs_training(config: RAGConfig) -> bool:
+    return config.index_type not in ("flat", "hnsw")
+
+
+def _descriptor(config: RAGConfig, dim: int, n_train: int) -> str:
+    """
+    Translates the configured index type into a FAISS index factory string.
+    The number of IVF lists and PQ centroids are reduced, if the training sample is too small for them.
+
+    Args:
+        config (RAGConfig): Configuration with the index settings.
+        dim (int): Dimension of the vectors.
+        n_train (int): Number of available training vectors.
+
+    Returns:
+        str: The index factory descriptor.
+    """
+
+    nlist = max(1, min(config.ivf_nlist, n_train // _POINTS_PER_CENTROID))
+    pq_bits = max(1, min(8, int(math.log2(max(n_train // _POINTS_PER_CENTROID, 2)))))
+
+    if config.index_type in ("hnsw_pq", "ivf_pq") and dim % config.pq_m:
+        raise ValueError(f"PQ_M={config.pq_m} does not divide the vector dimension {dim}.")
+
+    match config.index_type:
+        case "flat":
+            return "Flat"
+        case "hnsw":
+            return f"HNSW{config.hnsw_m}"
+        case "hnsw_sq8":
+            return f"HNSW{config.hnsw_m}_SQ8"
+        case "hnsw_pq":
+            return f"HNSW{config.hnsw_m}_PQ{config.pq_m}x{pq_bits}"
+        case "ivf_flat":
+            return f"IVF{nlist},Flat"
+        case "ivf_pq":
+            return f"IVF{nlist},PQ{config.pq_m}x{pq_bits}"
+        case _:
+            raise ValueError(f"Unknown index type: {config.index_type}")
+
+
+def configure_index(index: faiss.Index, config: RAGConfig):
+    """
+    Applies the search-time parameters (HNSW efSearch, IVF nprobe) to the index.
+
+    Args:
+        index (faiss.Index): The (possibly ID-mapped) index.
+        config (RAGConfig): Configuration with the index settings.
+    """
+
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+
+    if hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = config.hnsw_ef_search
+
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        ivf.nprobe = min(config.ivf_nprobe, ivf.nlist)
+
+
+def make_index(dim: int, config: RAGConfig, sample: np.ndarray | None = None) -> faiss.IndexIDMap2:
+    """
+    Creates an empty ID-mapped index of the configured type, trained on the sample if needed.
+
+    Args:
+        dim (int): Dimension of the vectors.
+        config (RAGConfig): Configuration with the index settings.
+        sample (np.ndarray | None): Training vectors (at most `index_train_size` are used).
+
+    Returns:
+        faiss.IndexIDMap2: The ID-mapped index, ready for `add_with_ids`.
+    """
+
+    if sample is None:
+        sample = np.empty((0, dim), dtype=np.float32)
+
+    if len(sample) > config.index_train_size:
+        rng = np.random.default_rng(0)
+        sample = sample[rng.choice(len(sample), config.index_train_size, replace=False)]
+
+    inner = faiss.index_factory(dim, _descriptor(config, dim, len(sample)))
+    if hasattr(inner, "hnsw"):
+        inner.hnsw.efConstruction = config.hnsw_ef_construction
+
+    if not inner.is_trained:
+        if not len(sample):
+            raise ValueError(f"Index type {config.index_type} requires training vectors.")
+        inner.train(np.ascontiguousarray(sample, dtype=np.float32))
+
+    index = faiss.IndexIDMap2(inner)
+    configure_index(index, config)
+
+    return index
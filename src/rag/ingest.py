@@ -0,0 +1,104 @@
+from pathlib import Path
+from typing import Iterator
+from itertools import islice
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.documents import Document
+
+from scheme.config import PathConfig
+from utils.data import iter_files, read_doc
+from .ast_chunker import chunk_document, extract_symbols, make_parsers, make_splitters
+from .symbols import SYMBOLS_KEY
+
+
+# Number of files handed to a worker at once (amortizes the inter-process overhead)
+BATCH_SIZE = 32
+
+# Per-process chunking state, every worker owns its parser and splitters
+_worker_state = None
+
+
+def _init_worker():
+    global _worker_state
+    _worker_state = (make_parsers(), make_splitters())
+
+
+def _process_batch(f_paths: list[Path], repo_root: Path, chunk: bool, symbols: bool, verbose: bool) -> list[Document]:
+    """
+    Reads (and optionally chunks) a batch of repository files inside a worker.
+
+    Args:
+        f_paths (list[Path]): Paths of the files to process.
+        repo_root (Path): Root of the code repository.
+        chunk (bool): If True, the documents are split with the AST chunking strategy.
+        symbols (bool): If True, the symbols of every file are attached to its first document (see `SymbolIndexBuilder`).
+        verbose (bool): If True, logs skipped files.
+
+    Returns:
+        list[Document]: Documents (or chunks) of the files, in the order of the paths.
+    """
+
+    result = []
+    for f_path in f_paths:
+        doc = read_doc(f_path, repo_root, verbose)
+        if doc is None:
+            continue
+
+        parsers, splitters = _worker_state
+        documents = chunk_document(doc, parsers, splitters) if chunk else [doc]
+
+        # Chunks share the metadata of the file, the symbols are attached to a copy
+        if symbols and documents and (found := extract_symbols(doc, parsers)) is not None:
+            first = documents[0]
+            documents[0] = Document(page_content=first.page_content, metadata=first.metadata | {SYMBOLS_KEY: found})
+
+        result.extend(documents)
+
+    return result
+
+
+def ingest(
+    path_config: PathConfig,
+    *,
+    workers: int,
+    chunk: bool = False,
+    symbols: bool = False,
+    verbose: bool = False,
+) -> Iterator[Document]:
+    """
+    Reads and chunks the repository files in a pool of worker processes.
+
+    Files are dispatched in batches, while at most a few batches per worker are in flight.
+    The documents are streamed back in the deterministic order of the repository walk.
+
+    Args:
+        path_config (PathConfig): Configuration object containing repository paths.
+        workers (int): Number of worker processes (1 processes the files in-process).
+        chunk (bool): If True, the documents are split with the AST chunking strategy.
+        symbols (bool): If True, the symbol definitions and references of the files are extracted as well.
+        verbose (bool): If True, logs skipped files.
+
+    Yields:
+        Document: Loaded documents (or their chunks).
+    """
+
+    repo_root = path_config.code_repo_root
+    files = iter_files(path_config)
+    batches = iter(lambda: list(islice(files, BATCH_SIZE)), [])
+
+    if workers <= 1:
+        _init_worker()
+        for batch in batches:
+            yield from _process_batch(batch, repo_root, chunk, symbols, verbose)
+        return
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(_process_batch, batch, repo_root, chunk, symbols, verbose))
+            if len(pending) >= 4 * workers:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
@@ -0,0 +1,189 @@
+import json
+import hashlib
+from pathlib import Path
+from typing import Iterable, Iterator
+from itertools import groupby
+
+from langchain_core.documents import Document
+
+
+def hash_sources(documents: Iterable[Document]) -> Iterator[tuple[str, str, list[Document]]]:
+    """
+    Groups a stream of documents (or their chunks) by source file and hashes their contents.
+    Documents of the same source are expected to be contiguous, as produced by the ingestion.
+
+    Args:
+        documents (Iterable[Document]): Stream of documents to be hashed.
+
+    Yields:
+        tuple[str, str, list[Document]]: Source path, its content hash and its documents.
+    """
+
+    for source, group in groupby(documents, key=lambda d: d.metadata["source"]):
+        group = list(group)
+
+        digest = hashlib.sha1()
+        for doc in group:
+            digest.update(doc.page_content.encode("utf-8", errors="surrogatepass"))
+            digest.update(b"\0")
+
+        yield source, digest.hexdigest(), group
+
+
+def current_commit(repo_root: Path) -> str | None:
+    """
+    Returns the checked out commit of the repository, if the working tree is clean.
+
+    Args:
+        repo_root (Path): Root of the indexed code repository.
+
+    Returns:
+        str | None: Commit SHA or None, if the repository is dirty or not under git.
+    """
+
+    # GitPython is slow to import and only needed for (re-)indexing
+    from git import Repo, InvalidGitRepositoryError
+
+    try:
+        repo = Repo(repo_root)
+        if repo.is_dirty(untracked_files=True):
+            return None
+
+        return repo.head.commit.hexsha
+    except (InvalidGitRepositoryError, ValueError):
+        return None
+
+
+def changed_paths(repo_root: Path, since: str, until: str) -> set[str] | None:
+    """
+    Lists the files changed between two commits using `git diff`.
+
+    Args:
+        repo_root (Path): Root of the indexed code repository.
+        since (str): The last indexed commit.
+        until (str): The currently checked out commit.
+
+    Returns:
+        set[str] | None: Changed paths relative to the repository root, or None
+            if the diff could not be computed (e.g. history was rewritten).
+    """
+
+    from git import Repo, InvalidGitRepositoryError, GitCommandError
+
+    try:
+        output = Repo(repo_root).git.diff("--name-only", "--no-renames", since, until)
+    except (InvalidGitRepositoryError, GitCommandError):
+        return None
+
+    return set(output.splitlines())
+
+
+class IndexManifest:
+    """
+    IndexManifest keeps track of the indexed documents next to the FAISS cache.
+    For every source file it stores a content hash and the vector ids of its documents,
+    which allows to update only the changed part of the dense index.
+    """
+
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, cache_root: Path):
+        """
+        Initializes the manifest, loading its previous state if it exists.
+
+        Args:
+            cache_root (Path): Directory containing the FAISS index cache.
+        """
+
+        self._path = cache_root / self.FILE_NAME
+
+        self.commit: str | None = None
+        self.next_id = 0
+        self.documents: dict[str, dict] = {}
+
+        if self._path.exists():
+            self.load(cache_root)
+
+    def exists(self) -> bool:
+        return self._path.exists()
+
+    def load(self, root: Path):
+        """
+        Reads the state of the manifest saved in a directory (e.g. of an index checkpoint).
+
+        Args:
+            root (Path): Directory containing the manifest file.
+        """
+
+        with open(root / self.FILE_NAME) as f:
+            state = json.load(f)
+
+        self.commit = state["commit"]
+        self.next_id = state["next_id"]
+        self.documents = state["documents"]
+
+    def clear(self, commit: str | None):
+        """
+        Forgets all indexed documents, e.g. before the index is rebuilt from scratch.
+
+        Args:
+            commit (str | None): Commit the new index is built from.
+        """
+
+        self.commit = commit
+        self.next_id = 0
+        self.documents = {}
+
+    def allocate_ids(self, count: int) -> list[int]:
+        """
+        Reserves a contiguous range of fresh vector ids.
+
+        Args:
+            count (int): Number of ids to reserve.
+
+        Returns:
+            list[int]: The reserved ids.
+        """
+
+        ids = list(range(self.next_id, self.next_id + count))
+        self.next_id += count
+        return ids
+
+    def is_changed(self, source: str, digest: str, candidates: set[str] | None = None) -> bool:
+        """
+        Compares a source against its state in the manifest.
+
+        Args:
+            source (str): Path of the source file.
+            digest (str): Current content hash of the source.
+            candidates (set[str] | None): If given, only these sources are compared
+                by hash (e.g. the output of `changed_paths`); new sources are
+                detected regardless.
+
+        Returns:
+            bool: True, if the source is new or its content changed.
+        """
+
+        entry = self.documents.get(source)
+        if entry is None:
+            return True
+
+        return (candidates is None or source in candidates) and entry["hash"] != digest
+
+    def save(self, root: Path | None = None):
+        """
+        Writes the state of the manifest. The file is replaced atomically.
+
+        Args:
+            root (Path | None): Directory to write the manifest to (the cache directory, if None).
+        """
+
+        path = self._path if root is None else root / self.FILE_NAME
+        with open(path.with_suffix(".json.tmp"), "w") as f:
+            json.dump({
+                "commit": self.commit,
+                "next_id": self.next_id,
+                "documents": self.documents,
+            }, f)
+
+        path.with_suffix(".json.tmp").replace(path)
@@ -0,0 +1,167 @@
+import time
+from pathlib import Path
+
+import torch
+import numpy as np
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from utils.prompts import best_region
+from utils.text import tokenize
+from .caches import LRUCache
+from .tracing import span
+
+
+class CrossEncoderReranker:
+    """
+    CrossEncoderReranker is the second stage of the retrieval cascade. Every candidate file is represented
+    by its region sharing the most terms with the question, the (question, region) pairs are scored by a
+    cross-encoder on the CPU. Candidates are scored in batches in the order of the retrieval, until the
+    latency budget of the query is spent; the remaining candidates keep their order behind the scored ones.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        code_root: Path,
+        batch_size: int = 8,
+        budget: float = 0.2,
+        max_length: int = 256,
+        cache_size: int = 4096,
+    ):
+        """
+        Initializes the reranker with a pretrained cross-encoder (sequence classification) model.
+
+        Args:
+            model (str): The name or path of the pretrained cross-encoder.
+            code_root (Path): Root of the code repository, the candidate paths are relative to.
+            batch_size (int): Number of candidates scored in a single forward pass.
+            budget (float): Scoring time per query in seconds, after which no further batch is started.
+            max_length (int): Maximum number of tokens of a (question, region) pair.
+            cache_size (int): Number of cached candidate features (tokenized regions).
+        """
+
+        self._tokenizer = AutoTokenizer.from_pretrained(model)
+        self._model = AutoModelForSequenceClassification.from_pretrained(model).eval()
+
+        self._code_root = code_root
+        self._batch_size = batch_size
+        self._max_length = max_length
+
+        # Regions are query-independent, their token ids are reused across queries
+        self._features = LRUCache(cache_size, 0)
+
+        self.budget = budget
+
+    def clear_cache(self):
+        self._features.clear()
+
+    def _passage(self, source: str, terms: set[str]) -> tuple[list[int], bool] | None:
+        """
+        Selects the region of a candidate file and tokenizes it.
+
+        Args:
+            source (str): Path of the candidate file.
+            terms (set[str]): Terms of the question.
+
+        Returns:
+            tuple[list[int], bool] | None: Token ids of the file path and the region and whether they
+                were cached or None, if the file is empty or missing.
+        """
+
+        found = best_region(self._code_root / source, terms)
+        if found is None:
+            return None
+
+        key = (source, found[0], found[1].text)
+        if (ids := self._features.get(key)) is not None:
+            return ids, True
+
+        ids = self._tokenizer(
+            f"{source}\n{found[1].text}",
+            add_special_tokens=False,
+            truncation=True,
+            max_length=self._max_length,
+        )["input_ids"]
+        self._features.put(key, ids)
+
+        return ids, False
+
+    def _score(self, query: list[int], passages: list[list[int]]) -> np.ndarray:
+        """
+        Scores a batch of (question, passage) pairs with a single forward pass.
+
+        Args:
+            query (list[int]): Token ids of the question.
+            passages (list[list[int]]): Token ids of the passages.
+
+        Returns:
+            np.ndarray: Relevance logits of the passages.
+        """
+
+        # The passages are truncated, so the pairs (with their special tokens) fit into the model
+        room = max(self._max_length - len(query) - 3, 1)
+        pairs = [
+            (
+                self._tokenizer.build_inputs_with_special_tokens(query, passage[:room]),
+                self._tokenizer.create_token_type_ids_from_sequences(query, passage[:room]),
+            )
+            for passage in passages
+        ]
+
+        width = max(len(ids) for ids, _ in pairs)
+        input_ids = np.full((len(pairs), width), self._tokenizer.pad_token_id, dtype=np.int64)
+        token_type_ids = np.zeros((len(pairs), width), dtype=np.int64)
+        attention_mask = np.zeros((len(pairs), width), dtype=np.int64)
+        for row, (ids, types) in enumerate(pairs):
+            input_ids[row, :len(ids)] = ids
+            token_type_ids[row, :len(types)] = types
+            attention_mask[row, :len(ids)] = 1
+
+        inputs = {"input_ids": input_ids, "token_type_ids": token_type_ids, "attention_mask": attention_mask}
+        inputs = {key: torch.from_numpy(value) for key, value in inputs.items() if key in self._tokenizer.model_input_names}
+        with torch.inference_mode():
+            logits = self._model(**inputs).logits
+
+        # Single-logit models score relevance directly, two-class models by their "relevant" logit
+        return logits[:, -1].float().numpy()
+
+    def rerank(self, question: str, candidates: list[str], budget: float | None = None) -> list[str]:
+        """
+        Rescores the candidate files of a question within the latency budget.
+
+        Args:
+            question (str): The question.
+            candidates (list[str]): Candidate files, in the order of the retrieval.
+            budget (float | None): Scoring time in seconds (the reranker's budget, if None).
+
+        Returns:
+            list[str]: The scored candidates by descending score, followed by the unscored ones.
+        """
+
+        budget = self.budget if budget is None else budget
+        start_time = time.perf_counter()
+
+        with span("rerank", candidates=len(candidates)) as attributes:
+            terms = set(tokenize(question))
+            query = self._tokenizer(question, add_special_tokens=False, truncation=True, max_length=self._max_length // 2)["input_ids"]
+
+            scores = np.full(len(candidates), -np.inf, dtype=np.float32)
+            scored, feature_hits = 0, 0
+            while scored < len(candidates) and time.perf_counter() - start_time < budget:
+                batch = range(scored, min(scored + self._batch_size, len(candidates)))
+                passages = {}
+                for i in batch:
+                    if (found := self._passage(candidates[i], terms)) is not None:
+                        passages[i], cached = found
+                        feature_hits += cached
+
+                if passages:
+                    scores[list(passages)] = self._score(query, list(passages.values()))
+                scored = batch.stop
+
+            attributes["scored"] = scored
+            attributes["feature_hits"] = feature_hits
+
+        # Unscored candidates keep the order of the retrieval behind the scored ones
+        order = sorted(range(len(candidates)), key=lambda i: (i >= scored, -scores[i] if i < scored else i))
+        return [candidates[i] for i in order]
@@ -0,0 +1,228 @@
+import asyncio
+from contextvars import copy_context
+from typing import Callable, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pydantic import PrivateAttr
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+
+from scheme.config import RAGConfig
+from .hybrid import FusionRetriever, HybridRetriever, Ranking
+from .symbols import SymbolHit
+from .tracing import span
+
+
+# Load global configuration for the RAG system
+config = RAGConfig()
+
+T = TypeVar("T")
+
+
+class ShardedRetriever(FusionRetriever):
+    """
+    ShardedRetriever searches a set of per-repository indexes (shards). The query is embedded once,
+    the shards are searched in parallel and their hits are merged into global dense and sparse
+    rankings of the usual depth, which are fused as for a single index. Sources of the retrieved
+    documents are qualified by the shard name (`<shard>/<path>`).
+    """
+
+    shards: dict[str, HybridRetriever]
+
+    # Shared by the synchronous and batched searches, FAISS releases the GIL while searching
+    _executor: ThreadPoolExecutor = PrivateAttr(
+        default_factory=lambda: ThreadPoolExecutor(config.search_threads, thread_name_prefix="shard")
+    )
+
+    @property
+    def embeddings(self) -> Embeddings:
+        # All shards are embedded with the same model
+        return next(iter(self.shards.values())).dense.embeddings
+
+    def _fan_out(self, search: Callable[[HybridRetriever], T], shards: list[HybridRetriever]) -> list[T]:
+        # Executor threads do not inherit the context, the searches run in copies of the caller's one (for tracing)
+        contexts = [copy_context() for _ in shards]
+        return list(self._executor.map(lambda c, s: c.run(search, s), contexts, shards))
+
+    def _cache_key(self, query: str, shards: list[str] | None = None) -> tuple[str, tuple[str, ...], str]:
+        return self.index_version, tuple(sorted(shards or ())), " ".join(query.split())
+
+    def _select(self, shards: list[str] | None) -> list[tuple[str, HybridRetriever]]:
+        """
+        Resolves the shards to be searched.
+
+        Args:
+            shards (list[str] | None): Names of the shards (all shards, if None).
+
+        Returns:
+            list[tuple[str, HybridRetriever]]: The selected shards with their names.
+        """
+
+        if not shards:
+            return list(self.shards.items())
+
+        if unknown := set(shards) - self.shards.keys():
+            raise ValueError(f"Unknown shards: {', '.join(sorted(unknown))}")
+
+        return [(name, self.shards[name]) for name in shards]
+
+    @staticmethod
+    def _qualify(name: str, document: Document) -> Document:
+        return Document(
+            id=document.id,
+            page_content=document.page_content,
+            metadata=document.metadata | {"source": f"{name}/{document.metadata['source']}", "shard": name},
+        )
+
+    @staticmethod
+    def _merge(rankings: list[tuple[str, Ranking]], k: int) -> Ranking:
+        """
+        Merges the rankings of the shards into the global top `k`.
+
+        Args:
+            rankings (list[tuple[str, Ranking]]): Rankings of the shards with their names.
+            k (int): Depth of the merged ranking.
+
+        Returns:
+            Ranking: The merged ranking, with the sources qualified by the shard names.
+        """
+
+        # NOTE: L2 distances are comparable across the shards, BM25 scores only approximately (per-shard IDF)
+        documents = [ShardedRetriever._qualify(name, d) for name, (docs, _) in rankings for d in docs]
+        if not documents:
+            return [], np.empty(0, dtype=np.float32)
+
+        scores = np.concatenate([scores for _, (_, scores) in rankings]).astype(np.float32)
+        top = np.argsort(-scores, kind="stable")[:k]
+
+        return [documents[i] for i in top], scores[top]
+
+    def lookup_symbols(self, names: list[str], shards: list[str] | None = None) -> list[SymbolHit]:
+        """
+        Looks up the definitions and references of identifiers in the symbol indexes of the shards.
+
+        Args:
+            names (list[str]): The identifiers.
+            shards (list[str] | None): Names of the searched shards (all shards, if None).
+
+        Returns:
+            list[SymbolHit]: Hits of all identifiers, with the sources qualified by the shard names.
+        """
+
+        return [
+            hit._replace(source=f"{name}/{hit.source}")
+            for name, shard in self._select(shards) for hit in shard.lookup_symbols(names)
+        ]
+
+    def _rankings(
+        self,
+        dense: list[tuple[str, list[tuple[Document, float]]]],
+        sparse: list[tuple[str, Ranking]],
+    ) -> list[tuple[Ranking, float]]:
+        rankings = [(self._merge([(name, self._dense_ranking(hits)) for name, hits in dense], self.dense_k), self.dense_weight)]
+        if sparse:
+            rankings.append((self._merge(sparse, self.sparse_k), self.sparse_weight))
+
+        return rankings
+
+    def _searches_sparse(self, shard: HybridRetriever) -> bool:
+        return shard.sparse is not None and self.sparse_weight > 0
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, shards: list[str] | None = None
+    ) -> list[Document]:
+        key = self._cache_key(query, shards)
+        if self.cache is not None and (cached := self.cache.get(key)) is not None:
+            return list(cached)
+
+        selected = self._select(shards)
+        vector = self.embeddings.embed_query(query)
+
+        with span("shard_search", shards=len(selected)):
+            sparse_shards = [(name, shard) for name, shard in selected if self._searches_sparse(shard)]
+            dense = self._fan_out(lambda s: s._dense_search(vector), [shard for _, shard in selected])
+            sparse = self._fan_out(lambda s: s._sparse_search(query), [shard for _, shard in sparse_shards])
+
+        documents = self._fuse(self._rankings(
+            [(name, hits) for (name, _), hits in zip(selected, dense)],
+            [(name, ranking) for (name, _), ranking in zip(sparse_shards, sparse)],
+        ))
+
+        if self.cache is not None:
+            self.cache.put(key, documents)
+
+        return list(documents)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun, shards: list[str] | None = None
+    ) -> list[Document]:
+        key = self._cache_key(query, shards)
+        if self.cache is not None and (cached := self.cache.get(key)) is not None:
+            return list(cached)
+
+        selected = self._select(shards)
+        sparse_shards = [(name, shard) for name, shard in selected if self._searches_sparse(shard)]
+
+        async def dense_search() -> list[list[tuple[Document, float]]]:
+            vector = await self.embeddings.aembed_query(query)
+            return await asyncio.gather(*[asyncio.to_thread(shard._dense_search, vector) for _, shard in selected])
+
+        # The sparse searches do not wait for the query embedding
+        with span("shard_search", shards=len(selected)):
+            dense, sparse = await asyncio.gather(
+                dense_search(),
+                asyncio.gather(*[asyncio.to_thread(shard._sparse_search, query) for _, shard in sparse_shards]),
+            )
+
+        documents = self._fuse(self._rankings(
+            [(name, hits) for (name, _), hits in zip(selected, dense)],
+            [(name, ranking) for (name, _), ranking in zip(sparse_shards, sparse)],
+        ))
+        if self.cache is not None:
+            self.cache.put(key, documents)
+
+        return list(documents)
+
+    def batch_search(self, queries: list[str], shards: list[str] | None = None) -> list[list[Document]]:
+        """
+        Searches a batch of queries at once. The queries missing in the result cache are embedded
+        with a single call, every shard searches all of them with a single matrix search.
+
+        Args:
+            queries (list[str]): The input query strings.
+            shards (list[str] | None): Names of the searched shards (all shards, if None).
+
+        Returns:
+            list[list[Document]]: Top documents of every query, in the order of the queries.
+        """
+
+        results = [self.cache.get(self._cache_key(q, shards)) if self.cache is not None else None for q in queries]
+        missing = [i for i, documents in enumerate(results) if documents is None]
+        if not missing:
+            return [list(documents) for documents in results]
+
+        selected = self._select(shards)
+        texts = [queries[i] for i in missing]
+        vectors = selected[0][1]._embed_queries(texts)
+
+        with span("shard_search", shards=len(selected), queries=len(texts)):
+            dense = self._fan_out(lambda s: s._dense_batch_search(vectors), [shard for _, shard in selected])
+
+        sparse_shards = [(j, name, shard) for j, (name, shard) in enumerate(selected) if self._searches_sparse(shard)]
+        for row, (i, text) in enumerate(zip(missing, texts)):
+            results[i] = self._fuse(self._rankings(
+                [(name, dense[j][row]) for j, (name, _) in enumerate(selected)],
+                [(name, shard._sparse_search(text)) for _, name, shard in sparse_shards],
+            ))
+            if self.cache is not None:
+                self.cache.put(self._cache_key(text, shards), results[i])
+
+        return [list(documents) for documents in results]
+
+    async def abatch_search(self, queries: list[str], shards: list[str] | None = None) -> list[list[Document]]:
+        return await asyncio.to_thread(self.batch_search, queries, shards)
@@ -0,0 +1,218 @@
+import json
+import mmap
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+from langchain_core.documents import Document
+
+from utils.text import tokenize
+
+
+class SparseIndex:
+    """
+    SparseIndex is a BM25 inverted index stored as CSR arrays (one row of postings per term).
+    The BM25 weights of the postings are precomputed, so scoring a query only sums the rows of its terms.
+    All arrays are memory-mapped from disk, the documents are decoded lazily per hit.
+    """
+
+    DIR_NAME = "sparse"
+
+    def __init__(self, root: Path):
+        """
+        Loads the index from the cache directory.
+
+        Args:
+            root (Path): Directory containing the FAISS index cache.
+        """
+
+        root = root / self.DIR_NAME
+
+        self._terms = np.load(root / "terms.npy", mmap_mode="r")
+        self._indptr = np.load(root / "indptr.npy", mmap_mode="r")
+        self._indices = np.load(root / "indices.npy", mmap_mode="r")
+        self._data = np.load(root / "data.npy", mmap_mode="r")
+        self._offsets = np.load(root / "offsets.npy", mmap_mode="r")
+
+        with open(root / "documents.jsonl", "rb") as f:
+            self._documents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else b""
+
+    @classmethod
+    def exists(cls, root: Path) -> bool:
+        return (root / cls.DIR_NAME / "documents.jsonl").exists()
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def document(self, i: int) -> Document:
+        """
+        Decodes a single indexed document.
+
+        Args:
+            i (int): Position of the document in the index.
+
+        Returns:
+            Document: The indexed document.
+        """
+        return Document(**json.loads(self._documents[self._offsets[i]:self._offsets[i + 1]]))
+
+    def search(self, query: str, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Scores the indexed documents against the query with BM25.
+
+        Args:
+            query (str): The input query string.
+            k (int): Number of top documents to return.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Positions of the top documents and their scores,
+                ordered by descending score.
+        """
+
+        width = self._terms.dtype.itemsize
+        keys = [t.encode() for t in tokenize(query)]
+        keys = np.array([key for key in keys if len(key) <= width], dtype=self._terms.dtype)
+        if not len(keys) or not len(self._terms):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        pos = np.searchsorted(self._terms, keys)
+        found = pos < len(self._terms)
+        found[found] = self._terms[pos[found]] == keys[found]
+
+        term_ids = pos[found]
+        if not len(term_ids):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        starts, ends = self._indptr[term_ids], self._indptr[term_ids + 1]
+        docs = np.concatenate([self._indices[s:e] for s, e in zip(starts, ends)])
+        weights = np.concatenate([self._data[s:e] for s, e in zip(starts, ends)])
+
+        # Accumulate only over the matched postings, not over the whole collection
+        candidates, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32)
+
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return candidates[top].astype(np.int64), scores[top]
+
+
+class SparseIndexBuilder:
+    """
+    SparseIndexBuilder collects the term statistics of a stream of documents and writes a `SparseIndex`.
+    The documents are written to disk as they arrive, only the term ids are kept in memory.
+    """
+
+    def __init__(self, root: Path, k1: float = 1.2, b: float = 0.75):
+        """
+        Initializes the builder.
+
+        Args:
+            root (Path): Directory containing the FAISS index cache.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 document length normalization.
+        """
+
+        self._root = root / SparseIndex.DIR_NAME
+        self._root.mkdir(parents=True, exist_ok=True)
+
+        self._k1, self._b = k1, b
+        self._vocab: dict[str, int] = {}
+        self._term_ids: list[np.ndarray] = []
+        self._counts: list[np.ndarray] = []
+        self._lengths: list[int] = []
+        self._offsets: list[int] = [0]
+
+        self._documents = None
+        self.exhausted = False
+
+    def add(self, doc: Document):
+        """
+        Adds a document to the index.
+
+        Args:
+            doc (Document): The document to be indexed.
+        """
+
+        tokens = tokenize(doc.page_content)
+        ids = np.fromiter(
+            (self._vocab.setdefault(t, len(self._vocab)) for t in tokens),
+            dtype=np.int32,
+            count=len(tokens),
+        )
+        ids, counts = np.unique(ids, return_counts=True)
+
+        self._term_ids.append(ids)
+        self._counts.append(counts.astype(np.float32))
+        self._lengths.append(len(tokens))
+
+        if self._documents is None:
+            self._documents = open(self._root / "documents.jsonl.tmp", "wb")
+
+        blob = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}).encode() + b"\n"
+        self._documents.write(blob)
+        self._offsets.append(self._offsets[-1] + len(blob))
+
+    def consume(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        Indexes the documents of a stream, while passing them through.
+
+        Args:
+            documents (Iterable[Document]): Stream of documents.
+
+        Yields:
+            Document: The same documents.
+        """
+
+        for doc in documents:
+            self.add(doc)
+            yield doc
+
+        self.exhausted = True
+
+    def build(self) -> SparseIndex:
+        """
+        Computes the BM25 weights and writes the index to disk.
+
+        Returns:
+            SparseIndex: The built (memory-mapped) index.
+        """
+
+        # SciPy is only needed to build the index, not to search it
+        from scipy.sparse import csr_matrix
+
+        n_docs, n_terms = len(self._lengths), len(self._vocab)
+        lengths = np.asarray(self._lengths, dtype=np.float32)
+        avg_length = max(lengths.mean(), 1.0) if n_docs else 1.0
+
+        rows = np.concatenate(self._term_ids) if n_docs else np.empty(0, dtype=np.int32)
+        cols = np.repeat(np.arange(n_docs, dtype=np.int32), [len(ids) for ids in self._term_ids])
+        tf = np.concatenate(self._counts) if n_docs else np.empty(0, dtype=np.float32)
+
+        df = np.bincount(rows, minlength=n_terms)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = self._k1 * (1 - self._b + self._b * lengths[cols] / avg_length)
+        weights = idf[rows] * tf * (self._k1 + 1) / (tf + norm)
+
+        # Rows are ordered by term, so terms can be looked up by binary search
+        terms = sorted(self._vocab)
+        order = np.empty(n_terms, dtype=np.int32)
+        order[[self._vocab[t] for t in terms]] = np.arange(n_terms, dtype=np.int32)
+
+        matrix = csr_matrix((weights, (order[rows], cols)), shape=(n_terms, n_docs), dtype=np.float32)
+        matrix.sort_indices()
+
+        np.save(self._root / "terms.npy", np.array([t.encode() for t in terms], dtype=bytes))
+        np.save(self._root / "indptr.npy", matrix.indptr.astype(np.int64))
+        np.save(self._root / "indices.npy", matrix.indices.astype(np.int32))
+        np.save(self._root / "data.npy", matrix.data.astype(np.float32))
+        np.save(self._root / "offsets.npy", np.asarray(self._offsets, dtype=np.int64))
+
+        if self._documents is None:
+            self._documents = open(self._root / "documents.jsonl.tmp", "wb")
+
+        self._documents.close()
+        (self._root / "documents.jsonl.tmp").replace(self._root / "documents.jsonl")
+
+        return SparseIndex(self._root.parent)
+
@@ -0,0 +1,202 @@
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+from collections import defaultdict
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+# Metadata key, under which the ingestion hands the symbols of a file to the index builder
+SYMBOLS_KEY = "symbols"
+
+
+class SymbolHit(NamedTuple):
+    source: str
+    definition: bool
+    start_line: int
+    end_line: int
+
+
+class SymbolIndex:
+    """
+    SymbolIndex maps the identifiers of the repository to their definitions and references
+    (file and line range). Names are stored sorted, so a name is looked up by binary search,
+    its postings are a contiguous row of CSR arrays (definitions first). All arrays are memory-mapped.
+    """
+
+    DIR_NAME = "symbols"
+
+    def __init__(self, root: Path):
+        """
+        Loads the index from the cache directory.
+
+        Args:
+            root (Path): Directory containing the FAISS index cache.
+        """
+
+        root = root / self.DIR_NAME
+
+        self._names = np.load(root / "names.npy", mmap_mode="r")
+        self._sources = np.load(root / "sources.npy", mmap_mode="r")
+        self._files = np.load(root / "files.npy", mmap_mode="r")
+        self._definitions = np.load(root / "definitions.npy", mmap_mode="r")
+        self._lines = np.load(root / "lines.npy", mmap_mode="r")
+        self._indptr = np.load(root / "indptr.npy", mmap_mode="r")
+
+    @classmethod
+    def exists(cls, root: Path) -> bool:
+        return (root / cls.DIR_NAME / "indptr.npy").exists()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def lookup(self, name: str) -> list[SymbolHit]:
+        """
+        Looks up the definitions and references of an identifier (case-sensitive).
+
+        Args:
+            name (str): The identifier.
+
+        Returns:
+            list[SymbolHit]: Definitions followed by references, each group ordered by file and line.
+        """
+
+        key = name.encode()
+        if not len(self._names) or len(key) > self._names.dtype.itemsize:
+            return []
+
+        i = int(np.searchsorted(self._names, key))
+        if i == len(self._names) or self._names[i] != key:
+            return []
+
+        start, end = self._indptr[i], self._indptr[i + 1]
+        return [
+            SymbolHit(self._sources[file].decode(), bool(definition), int(lines[0]), int(lines[1]))
+            for file, definition, lines in zip(self._files[start:end], self._definitions[start:end], self._lines[start:end])
+        ]
+
+
+class SymbolIndexBuilder:
+    """
+    SymbolIndexBuilder collects the symbols extracted during the ingestion from a stream of documents
+    and writes a `SymbolIndex`. The symbols are removed from the documents' metadata, so they are not
+    stored with the documents.
+    """
+
+    def __init__(self, root: Path):
+        """
+        Initializes the builder.
+
+        Args:
+            root (Path): Directory containing the FAISS index cache.
+        """
+
+        self._root = root / SymbolIndex.DIR_NAME
+        self._root.mkdir(parents=True, exist_ok=True)
+
+        self._vocab: dict[str, int] = {}
+        self._sources: list[str] = []
+        self._postings: list[np.ndarray] = []
+
+        self.exhausted = False
+
+    def add(self, source: str, symbols: list[tuple[str, bool, int, int]]):
+        """
+        Adds the symbols of a file to the index.
+
+        Args:
+            source (str): Path of the source file.
+            symbols (list[tuple[str, bool, int, int]]): Name, definition flag and line range of every symbol.
+        """
+
+        file = len(self._sources)
+        self._sources.append(source)
+
+        # Rows of (name id, file, definition, start line, end line)
+        self._postings.append(np.array(
+            [(self._vocab.setdefault(name, len(self._vocab)), file, definition, start, end) for name, definition, start, end in symbols],
+            dtype=np.int32,
+        ).reshape(-1, 5))
+
+    def consume(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        Indexes the symbols attached to the documents of a stream, while passing the documents through.
+
+        Args:
+            documents (Iterable[Document]): Stream of documents.
+
+        Yields:
+            Document: The same documents, without the symbols.
+        """
+
+        for doc in documents:
+            symbols = doc.metadata.pop(SYMBOLS_KEY, None)
+            if symbols is not None:
+                self.add(doc.metadata["source"], symbols)
+            yield doc
+
+        self.exhausted = True
+
+    def build(self) -> SymbolIndex:
+        """
+        Sorts the postings by name and writes the index to disk. The files are replaced atomically,
+        so processes that have the previous index mapped keep working.
+
+        Returns:
+            SymbolIndex: The built (memory-mapped) index.
+        """
+
+        rows = np.concatenate(self._postings) if self._postings else np.empty((0, 5), dtype=np.int32)
+
+        # Rows are ordered by name, so names can be looked up by binary search
+        names = sorted(self._vocab)
+        order = np.empty(len(names), dtype=np.int32)
+        order[[self._vocab[name] for name in names]] = np.arange(len(names), dtype=np.int32)
+
+        name_ids = order[rows[:, 0]]
+        rows = rows[np.lexsort((rows[:, 3], rows[:, 1], -rows[:, 2], name_ids))]
+
+        arrays = {
+            "names": np.array([name.encode() for name in names], dtype=bytes),
+            "sources": np.array([source.encode() for source in self._sources], dtype=bytes),
+            "files": rows[:, 1].copy(),
+            "definitions": rows[:, 2].astype(np.bool_),
+            "lines": rows[:, 3:5].copy(),
+            "indptr": np.concatenate([[0], np.cumsum(np.bincount(name_ids, minlength=len(names)))]).astype(np.int64),
+        }
+
+        for name, array in arrays.items():
+            with open(self._root / f"{name}.npy.tmp", "wb") as f:
+                np.save(f, array)
+
+        # The row pointers are the marker of a complete index (see `SymbolIndex.exists`), they are moved last
+        for name in arrays:
+            (self._root / f"{name}.npy.tmp").replace(self._root / f"{name}.npy")
+
+        return SymbolIndex(self._root.parent)
+
+
+def rank_symbol_files(hits: Iterable[SymbolHit], k: int, max_definitions: int) -> tuple[list[str], bool]:
+    """
+    Ranks the files of the symbol hits: files defining the symbols first, then by the number of references.
+
+    Args:
+        hits (Iterable[SymbolHit]): Hits of the looked up identifiers.
+        k (int): Number of files to return.
+        max_definitions (int): Largest number of defining files, for which the ranking is trusted.
+
+    Returns:
+        tuple[list[str], bool]: Top `k` files and whether the symbols are defined unambiguously
+            (in at least one and at most `max_definitions` files).
+    """
+
+    definitions, references = defaultdict(int), defaultdict(int)
+    for hit in hits:
+        (definitions if hit.definition else references)[hit.source] += 1
+
+    ranked = sorted(
+        definitions.keys() | references.keys(),
+        key=lambda source: (-definitions.get(source, 0), -references.get(source, 0), source),
+    )
+
+    return ranked[:k], 0 < len(definitions) <= max_definitions
@@ -0,0 +1,174 @@
+import time
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterable, Iterator, NamedTuple
+from collections import defaultdict
+
+import numpy as np
+from langchain_core.outputs import LLMResult
+from langchain_core.callbacks import BaseCallbackHandler
+
+from scheme.graph import RAGState
+
+
+class Span(NamedTuple):
+    name: str
+    parent: str | None
+    start: float
+    duration: float
+    attributes: dict[str, Any]
+
+
+# Spans of the currently traced invocation (None, if nothing is traced)
+_trace: ContextVar[list[Span] | None] = ContextVar("trace", default=None)
+
+# Name and attributes of the innermost open span
+_current: ContextVar[tuple[str, dict[str, Any]] | None] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def collect() -> Iterator[list[Span]]:
+    """
+    Traces the enclosed code (including the tasks and executor calls it spawns).
+
+    Yields:
+        list[Span]: The list the finished spans are appended to.
+    """
+
+    spans = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[dict[str, Any]]:
+    """
+    Times the enclosed code as a span of the current trace. Outside of a trace it is a no-op.
+
+    Args:
+        name (str): Name of the stage.
+        **attributes (Any): Initial attributes of the span, e.g. byte sizes.
+
+    Yields:
+        dict[str, Any]: Attributes of the span, which can be extended by the enclosed code.
+    """
+
+    spans = _trace.get()
+    if spans is None:
+        yield attributes
+        return
+
+    parent = _current.get()
+    token = _current.set((name, attributes))
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        duration = time.perf_counter() - start
+        _current.reset(token)
+        spans.append(Span(name, parent[0] if parent else None, start, duration, attributes))
+
+
+def record(name: str, start: float, **attributes: Any):
+    """
+    Records a span, which started at the given time and ends now, under the innermost open span.
+    Used for milestones that are not enclosed in a single block, e.g. the time to the first token.
+
+    Args:
+        name (str): Name of the stage.
+        start (float): Start of the span (`time.perf_counter`).
+        **attributes (Any): Attributes of the span.
+    """
+
+    spans = _trace.get()
+    if spans is not None:
+        parent = _current.get()
+        spans.append(Span(name, parent[0] if parent else None, start, time.perf_counter() - start, attributes))
+
+
+def traced(name: str, node: Callable[[RAGState], Awaitable[RAGState]]) -> Callable[[RAGState], Awaitable[RAGState]]:
+    """
+    Wraps a graph node in a span, recording the sizes of the question and the produced answer.
+
+    Args:
+        name (str): Name of the node.
+        node (Callable[[RAGState], Awaitable[RAGState]]): The graph node.
+
+    Returns:
+        Callable[[RAGState], Awaitable[RAGState]]: The traced graph node.
+    """
+
+    async def helper(state: RAGState) -> RAGState:
+        with span(name, question_bytes=len(state["question"].encode())) as attributes:
+            result = await node(state)
+            if result.get("answer"):
+                attributes["answer_bytes"] = len(result["answer"].encode())
+            if result.get("retrieved") is not None:
+                attributes["retrieved"] = len(result["retrieved"])
+
+        return result
+
+    return helper
+
+
+class UsageRecorder(BaseCallbackHandler):
+    """
+    Adds the token usage reported by the LLM to the innermost open span.
+    """
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any):
+        current = _current.get()
+        if current is None:
+            return
+
+        attributes = current[1]
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                attributes["input_tokens"] = attributes.get("input_tokens", 0) + usage.get("input_tokens", 0)
+                attributes["output_tokens"] = attributes.get("output_tokens", 0) + usage.get("output_tokens", 0)
+
+
+def format_report(traces: Iterable[list[Span]]) -> str:
+    """
+    Summarizes the traces into a per-stage breakdown.
+
+    Args:
+        traces (Iterable[list[Span]]): Spans of the traced invocations.
+
+    Returns:
+        str: Table with the number of calls, total/mean/p95 time, share of the total time
+            and the summed numeric attributes of every stage.
+    """
+
+    durations, attributes, order = defaultdict(list), defaultdict(lambda: defaultdict(float)), {}
+    for spans in traces:
+        # Spans are finished innermost first, order the stages by their start
+        for s in sorted(spans, key=lambda s: s.start):
+            key = (s.parent, s.name)
+            order.setdefault(key, len(order))
+            durations[key].append(s.duration)
+            for name, value in s.attributes.items():
+                if isinstance(value, (int, float)):
+                    attributes[key][name] += value
+
+    total = 1000 * sum(sum(d) for (parent, _), d in durations.items() if parent is None) or 1.0
+
+    lines = [f"{'stage':<28}{'calls':>7}{'total (ms)':>12}{'mean (ms)':>11}{'p95 (ms)':>10}{'share':>8}  attributes"]
+    depth = {}
+    for key in sorted(order, key=order.get):
+        parent, name = key
+        depth[name] = depth.get(parent, -1) + 1
+
+        d = np.asarray(durations[key]) * 1000
+        label = "  " * depth[name] + name
+        extra = ", ".join(f"{k}={v:g}" for k, v in attributes[key].items())
+        lines.append(
+            f"{label:<28}{len(d):>7}{d.sum():>12.1f}{d.mean():>11.2f}"
+            f"{np.percentile(d, 95):>10.2f}{100 * d.sum() / total:>7.1f}%  {extra}"
+        )
+
+    return "\n".join(lines)
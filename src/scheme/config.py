@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal
 
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -7,13 +8,86 @@ from pydantic_settings import BaseSettings
 class RAGConfig(BaseSettings):
     api_key: str        = Field("", alias="OPENROUTER_API_KEY")
     target_repo: str    = Field("", alias="GIT_REPO")
+    target_repos: list[str] = Field([], alias="GIT_REPOS")
     encoder: str        = Field("", alias="ENCODER_MODEL")
     llm_slug: str       = Field("", alias="LLM")
+    llm_base_url: str   = Field("https://openrouter.ai/api/v1", alias="LLM_BASE_URL")
+
+    embedding_cache_size: int = Field(1_000_000, alias="EMBEDDING_CACHE_SIZE")
+    encoder_batch_size: int   = Field(32, alias="ENCODER_BATCH_SIZE")
+    index_batch_size: int     = Field(512, alias="INDEX_BATCH_SIZE")
+
+    embedding_model: str        = Field("models/text-embedding-004", alias="EMBEDDING_MODEL")
+    embedding_base_url: str     = Field("", alias="EMBEDDING_BASE_URL")
+    embed_batch_size: int       = Field(100, alias="EMBED_BATCH_SIZE")
+    embed_max_in_flight: int    = Field(4, alias="EMBED_MAX_IN_FLIGHT")
+    embed_rate: float           = Field(10.0, alias="EMBED_RATE")
+    embed_burst: int            = Field(10, alias="EMBED_BURST")
+    embed_max_retries: int      = Field(6, alias="EMBED_MAX_RETRIES")
+    embed_backoff: float        = Field(0.5, alias="EMBED_BACKOFF")
+    index_checkpoint_interval: float = Field(60, alias="INDEX_CHECKPOINT_INTERVAL")
+
+    top_k: int          = Field(10, alias="TOP_K")
+    dense_k: int        = Field(10, alias="DENSE_K")
+    sparse_k: int       = Field(10, alias="SPARSE_K")
+    dense_weight: float = Field(1.0, alias="DENSE_WEIGHT")
+    sparse_weight: float = Field(0.0, alias="SPARSE_WEIGHT")
+    fusion: Literal["rrf", "score"] = Field("rrf", alias="FUSION")
+
+    index_type: Literal["flat", "hnsw", "hnsw_sq8", "hnsw_pq", "ivf_flat", "ivf_pq"] = Field("hnsw", alias="INDEX_TYPE")
+    hnsw_m: int                 = Field(32, alias="HNSW_M")
+    hnsw_ef_construction: int   = Field(40, alias="HNSW_EF_CONSTRUCTION")
+    hnsw_ef_search: int         = Field(16, alias="HNSW_EF_SEARCH")
+    ivf_nlist: int              = Field(1024, alias="IVF_NLIST")
+    ivf_nprobe: int             = Field(16, alias="IVF_NPROBE")
+    pq_m: int                   = Field(16, alias="PQ_M")
+    index_train_size: int       = Field(50_000, alias="INDEX_TRAIN_SIZE")
+
+    hierarchical: bool  = Field(False, alias="HIERARCHICAL")
+    file_k: int         = Field(32, alias="FILE_K")
+
+    symbol_routing: bool        = Field(False, alias="SYMBOL_ROUTING")
+    symbol_max_definitions: int = Field(3, alias="SYMBOL_MAX_DEFINITIONS")
+
+    rerank: bool                = Field(False, alias="RERANK")
+    rerank_model: str           = Field("cross-encoder/ms-marco-MiniLM-L-6-v2", alias="RERANK_MODEL")
+    rerank_candidates: int      = Field(30, alias="RERANK_CANDIDATES")
+    rerank_top: int             = Field(3, alias="RERANK_TOP")
+    rerank_batch_size: int      = Field(8, alias="RERANK_BATCH_SIZE")
+    rerank_budget: float        = Field(0.2, alias="RERANK_BUDGET")
+
+    expand_timeout: float   = Field(5.0, alias="EXPAND_TIMEOUT")
+
+    query_cache_size: int   = Field(1024, alias="QUERY_CACHE_SIZE")
+    query_cache_ttl: float  = Field(3600, alias="QUERY_CACHE_TTL")
+    llm_cache_size: int     = Field(100_000, alias="LLM_CACHE_SIZE")
+    llm_cache_ttl: float    = Field(7 * 24 * 3600, alias="LLM_CACHE_TTL")
+
+    context_token_budget: int       = Field(8000, alias="CONTEXT_TOKEN_BUDGET")
+    context_region_lines: int       = Field(40, alias="CONTEXT_REGION_LINES")
+    context_file_cache_size: int    = Field(256, alias="CONTEXT_FILE_CACHE_SIZE")
+
+    serve_max_in_flight: int    = Field(16, alias="SERVE_MAX_IN_FLIGHT")
+    serve_max_queue: int        = Field(64, alias="SERVE_MAX_QUEUE")
+    search_threads: int         = Field(4, alias="SEARCH_THREADS")
+
+    exclude: list[str]  = Field([".git", "node_modules", "vendor", "dist", "*.min.js", "*.lock"], alias="EXCLUDE")
+    max_file_size: int  = Field(1_000_000, alias="MAX_FILE_SIZE")
+
+    @property
+    def candidate_k(self) -> int:
+        # With reranking, the retrieval returns a wider set of candidates than is answered from
+        return max(self.top_k, self.rerank_candidates) if self.rerank else self.top_k
+
+    @property
+    def shards(self) -> dict[str, str]:
+        # Every repository is indexed as a shard named after it (`.../org/name.git` -> `name`)
+        return {url.rstrip("/").removesuffix(".git").rsplit("/", 1)[-1]: url for url in self.target_repos}
 
 
 _DATA_ROOT = Path("./data")
 class PathConfig(BaseSettings):
-    logs_path: Path         = _DATA_ROOT / "runs.log"
+    logs_path: Path         = _DATA_ROOT / "runs.jsonl"
     plot_path: Path         = _DATA_ROOT / "eval/tradeoff.png"
     eval_set_path: Path     = _DATA_ROOT / "eval/test.json"
     lang_map_path: Path     = _DATA_ROOT / "resources/langchain_ext_map.json"
@@ -21,10 +95,25 @@ class PathConfig(BaseSettings):
     code_repo_root: Path    = _DATA_ROOT / "fetched"
     cache_root: Path        = _DATA_ROOT / "cache"
     prompts_root: Path      = _DATA_ROOT / "prompts"
+    embeddings_root: Path   = _DATA_ROOT / "embeddings"
+    llm_cache_path: Path    = _DATA_ROOT / "llm_cache.sqlite"
 
-    def __init__(self):
-        super().__init__()
-
+    def prepare(self) -> "PathConfig":
+        # Directories are created on use, not on construction, so importing a module has no side effects
+        self.logs_path.parent.mkdir(parents=True, exist_ok=True)
         self.logs_path.touch(exist_ok=True)
         self.cache_root.mkdir(parents=True, exist_ok=True)
+        self.embeddings_root.mkdir(parents=True, exist_ok=True)
         self.code_repo_root.parent.mkdir(parents=True, exist_ok=True)
+
+        return self
+
+    def shard(self, name: str) -> "PathConfig":
+        # Shards have their own repository clone and index cache, the embeddings cache is shared
+        shard = self.model_copy(update={
+            "code_repo_root": self.code_repo_root / name,
+            "cache_root": self.cache_root / name,
+        })
+        shard.cache_root.mkdir(parents=True, exist_ok=True)
+
+        return shard
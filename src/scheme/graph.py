@@ -6,8 +6,12 @@ TaskConfig = NamedTuple(
     [
         ("summarize", bool),
         ("expand_query", bool),
+        ("speculative_expansion", bool),
         ("verbose", bool),
         ("build_index", bool),
+        ("update_index", bool),
+        ("profile", bool),
+        ("shards", list[str] | None),
     ],
 )
 
@@ -15,5 +19,6 @@ TaskConfig = NamedTuple(
 class RAGState(TypedDict):
     question: str
     retrieved: list[str]
+    seeds: list[str]
     task_config: TaskConfig
     answer: str | None
@@ -0,0 +1,156 @@
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from rag import RAGExtractor
+from rag.shards import ShardedRetriever
+from scheme.config import RAGConfig
+from scheme.graph import TaskConfig
+
+
+# Load global configuration for the RAG system
+config = RAGConfig()
+
+
+class RAGServer:
+    """
+    RAGServer exposes retrieval and question answering of a loaded RAGExtractor over HTTP.
+    At most `max_in_flight` queries are processed at once, up to `max_queue` more wait for a slot
+    and further requests are rejected. Identical queries in flight are answered by a single invocation.
+    """
+
+    def __init__(self, rag: RAGExtractor, task_config: TaskConfig, max_in_flight: int, max_queue: int):
+        """
+        Initializes the server.
+
+        Args:
+            rag (RAGExtractor): The loaded RAG system.
+            task_config (TaskConfig): Configuration for retrieval tasks.
+            max_in_flight (int): Maximum number of concurrently processed queries.
+            max_queue (int): Maximum number of queries waiting for processing.
+        """
+
+        self._rag = rag
+        # Names of the configured shards (None for a single, unsharded index)
+        self._shards = set(rag.retriever.shards) if isinstance(rag.retriever, ShardedRetriever) else None
+        self._task_configs = {
+            "retrieve": task_config._replace(summarize=False),
+            "qa": task_config._replace(summarize=True),
+        }
+
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._capacity = max_in_flight + max_queue
+        self._pending = 0
+
+        # Shared invocations of the queries in flight, keyed by the endpoint, shards and normalised query
+        self._in_flight: dict[tuple, asyncio.Task] = {}
+        self.stats = Counter()
+
+    async def _invoke(self, endpoint: str, question: str, shards: list[str] | None) -> dict:
+        task_config = self._task_configs[endpoint]
+        if shards:
+            task_config = task_config._replace(shards=shards)
+
+        async with self._slots:
+            answer, retrieved = await self._rag.ainvoke(question, task_config)
+
+        return {"answer": answer, "retrieved": retrieved}
+
+    def _release(self, key: tuple):
+        self._in_flight.pop(key, None)
+        self._pending -= 1
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        endpoint = request.match_info["endpoint"]
+        if endpoint not in self._task_configs:
+            raise web.HTTPNotFound()
+
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+
+        question = body.get("question") if isinstance(body, dict) else None
+        shards = body.get("shards") if isinstance(body, dict) else None
+        if not (isinstance(question, str) and question.strip()) \
+                or not (shards is None or isinstance(shards, list) and all(isinstance(s, str) for s in shards)):
+            return web.json_response(
+                {"error": "expected a JSON body with a non-empty 'question' and optional 'shards' list"},
+                status=400,
+            )
+
+        if shards and self._shards is None:
+            return web.json_response({"error": "'shards' given, but the index is not sharded"}, status=400)
+        if shards and (unknown := set(shards) - self._shards):
+            return web.json_response({"error": f"unknown shards: {', '.join(sorted(unknown))}"}, status=400)
+
+        self.stats["requests"] += 1
+        key = (endpoint, tuple(sorted(shards or ())), " ".join(question.split()))
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        elif self._pending >= self._capacity:
+            self.stats["rejected"] += 1
+            return web.json_response({"error": "overloaded"}, status=503, headers={"Retry-After": "1"})
+        else:
+            self._pending += 1
+            task = asyncio.create_task(self._invoke(endpoint, question, shards))
+            task.add_done_callback(lambda _: self._release(key))
+            self._in_flight[key] = task
+
+        try:
+            # A disconnecting client must not cancel the invocation shared with the others
+            result = await asyncio.shield(task)
+        except Exception as e:
+            self.stats["failed"] += 1
+            return web.json_response({"error": str(e)}, status=500)
+
+        return web.json_response(result)
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats) | {"pending": self._pending})
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.get("/stats", self._stats),
+            web.post("/{endpoint}", self._handle),
+        ])
+
+        return app
+
+
+async def serve(rag: RAGExtractor, task_config: TaskConfig, host: str = "127.0.0.1", port: int = 8080):
+    """
+    Serves the RAG system until the process is interrupted.
+    Endpoints: `POST /retrieve` and `POST /qa` with a `{"question": ...}` body
+    (optionally restricted to a subset of the repositories by `"shards": [...]`), `GET /stats`.
+
+    Args:
+        rag (RAGExtractor): The loaded RAG system.
+        task_config (TaskConfig): Configuration for retrieval tasks.
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+    """
+
+    # FAISS and BM25 searches (and the other blocking calls) run on the default executor
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(config.search_threads, thread_name_prefix="search"))
+
+    server = RAGServer(rag, task_config, config.serve_max_in_flight, config.serve_max_queue)
+    runner = web.AppRunner(server.make_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    print(f"Serving on http://{host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    pass
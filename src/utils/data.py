@@ -1,45 +1,251 @@
-from itertools import chain
+import os
+import codecs
+from pathlib import Path
+from typing import Iterator
+from fnmatch import fnmatch
 
-from scheme.config import PathConfig
+from scheme.config import PathConfig, RAGConfig
 from langchain_core.documents import Document
 
 
-# Load global path configuration
-config = PathConfig()
+# Load global configurations for paths and RAG settings
+config, rag_config = PathConfig(), RAGConfig()
 
+# Size of the file header inspected to detect binary files
+SNIFF_SIZE = 8192
 
-def load_docs(path_config: PathConfig, verbose: bool = False) -> list[Document]:
+
+def _is_excluded(rel_path: str, exclude: list[str]) -> bool:
     """
-    Loads documents from the code repository.
+    Checks the path (and each of its components) against the exclude patterns.
+
+    Args:
+        rel_path (str): Path relative to the repository root.
+        exclude (list[str]): Glob patterns, e.g. "node_modules" or "*.min.js".
+
+    Returns:
+        bool: True, if the path is excluded.
+    """
+
+    parts = rel_path.split("/")
+    return any(
+        fnmatch(rel_path, pattern) or any(fnmatch(part, pattern) for part in parts)
+        for pattern in exclude
+    )
+
+
+# A `.gitignore` rule: its directory, the pattern, whether it is anchored to the directory,
+# applies to directories only and re-includes the matched paths (`!`)
+_IgnoreRule = tuple[Path, str, bool, bool, bool]
+
+
+def _read_gitignore(directory: Path) -> list[_IgnoreRule]:
+    """
+    Parses the `.gitignore` of a directory (a subset of the git syntax: comments, negation,
+    trailing `/` for directories, leading or inner `/` anchoring the pattern to the directory).
+
+    Args:
+        directory (Path): Directory of the `.gitignore` file.
+
+    Returns:
+        list[_IgnoreRule]: Rules of the file in their order (none, if the file does not exist).
+    """
+
+    try:
+        lines = (directory / ".gitignore").read_text(encoding="utf-8", errors="replace").splitlines()
+    except OSError:
+        return []
+
+    rules = []
+    for line in lines:
+        pattern = line.rstrip()
+        if not pattern or pattern.startswith("#"):
+            continue
+
+        negated = pattern.startswith("!")
+        pattern = pattern.removeprefix("!").removeprefix("**/")
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        if pattern:
+            rules.append((directory, pattern.lstrip("/"), anchored, dir_only, negated))
+
+    return rules
+
+
+def _is_ignored(path: Path, is_dir: bool, rules: list[_IgnoreRule]) -> bool:
+    # The last matching rule decides, as in git
+    ignored = False
+    for directory, pattern, anchored, dir_only, negated in rules:
+        if dir_only and not is_dir:
+            continue
+        if fnmatch(path.relative_to(directory).as_posix() if anchored else path.name, pattern):
+            ignored = not negated
+
+    return ignored
+
+
+def _list_files(repo_root: Path, exclude: list[str]) -> Iterator[str]:
+    """
+    Lists the repository files, respecting `.gitignore`. Repositories under git are listed by git,
+    other directories are walked with the `.gitignore` files parsed on the way.
+
+    Args:
+        repo_root (Path): Root of the code repository.
+        exclude (list[str]): Glob patterns of the excluded directories (pruned from the walk).
+
+    Yields:
+        str: Paths relative to the repository root, in sorted order.
+    """
+
+    # GitPython is slow to import and only needed for reading the repository
+    from git import Repo, InvalidGitRepositoryError
+
+    try:
+        output = Repo(repo_root).git.ls_files("--cached", "--others", "--exclude-standard", "-z")
+        yield from sorted(set(filter(None, output.split("\0"))))
+        return
+    except InvalidGitRepositoryError:
+        pass
+
+    # Rules of the `.gitignore` files of the directory and its parents
+    rules = {repo_root: []}
+    for root, dirs, files in os.walk(repo_root):
+        root = Path(root)
+        active = rules.pop(root) + _read_gitignore(root)
+        dirs[:] = sorted(
+            d for d in dirs
+            if d != ".git" and not _is_excluded(d, exclude) and not _is_ignored(root / d, True, active)
+        )
+        rules.update((root / d, active) for d in dirs)
+
+        for f in sorted(files):
+            if not _is_ignored(root / f, False, active):
+                yield (root / f).relative_to(repo_root).as_posix()
+
+
+def _is_text(head: bytes) -> bool:
+    """
+    Cheaply sniffs the file header for binary content.
+
+    Args:
+        head (bytes): The first bytes of the file.
+
+    Returns:
+        bool: True, if the header looks like UTF-8 text.
+    """
+
+    if b"\0" in head:
+        return False
+
+    try:
+        # Incremental decoding tolerates a multi-byte character cut at the header end
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        return False
+
+    return True
+
+
+def iter_files(
+    path_config: PathConfig,
+    exclude: list[str] = rag_config.exclude,
+    max_file_size: int = rag_config.max_file_size,
+) -> Iterator[Path]:
+    """
+    Walks the code repository in a deterministic (sorted) order. Files ignored by git,
+    matching the exclude patterns or exceeding the size cap are skipped.
 
     Args:
         path_config (PathConfig): Configuration object containing repository paths.
+        exclude (list[str]): Glob patterns of the excluded files and directories.
+        max_file_size (int): Maximum file size in bytes.
+
+    Yields:
+        Path: Paths of the repository files.
+    """
+
+    repo_root = path_config.code_repo_root
+    for rel_path in _list_files(repo_root, exclude):
+        if _is_excluded(rel_path, exclude):
+            continue
+
+        f_path = repo_root / rel_path
+        try:
+            stat = f_path.stat()
+        except FileNotFoundError:  # Deleted, but not yet committed
+            continue
+
+        if f_path.is_file() and stat.st_size <= max_file_size:
+            yield f_path
+
+
+def read_doc(f_path: Path, repo_root: Path, verbose: bool = False) -> Document | None:
+    """
+    Reads a single repository file into a document. Binary files are detected
+    from the file header, before the whole file is read.
+
+    Args:
+        f_path (Path): Path of the file.
+        repo_root (Path): Root of the code repository, sources are relative to it.
         verbose (bool): If True, logs skipped files.
 
     Returns:
-        list[Document]: List of documents loaded from the repository.
+        Document | None: The loaded document or None, if the file is not a text file.
+    """
+
+    with open(f_path, "rb") as f:
+        is_text = _is_text(f.read(SNIFF_SIZE))
+
+    try:
+        if is_text:
+            with open(f_path, "r", encoding="utf-8") as f:
+                content = f.read()
+    except UnicodeDecodeError:
+        is_text = False
+
+    if not is_text:
+        if verbose: print("Skipping", f_path)
+        return None
+
+    return Document(
+        page_content=content,
+        metadata={
+            "source": f_path.relative_to(repo_root).as_posix()
+        }
+    )
+
+
+def iter_docs(path_config: PathConfig, verbose: bool = False) -> Iterator[Document]:
     """
+    Lazily loads documents from the code repository.
 
-    docs = []
+    Args:
+        path_config (PathConfig): Configuration object containing repository paths.
+        verbose (bool): If True, logs skipped files.
 
-    files = [
-        [root / f for f in files]
-        for root, _, files in path_config.code_repo_root.walk()
-    ]
+    Yields:
+        Document: Documents loaded from the repository.
+    """
 
-    for f_path in chain(*files):
-        with open(f_path, "r") as f:
-            try:
-                docs.append(Document(
-                    page_content=f.read(),
-                    metadata={
-                        "source": f_path.relative_to(path_config.code_repo_root).as_posix()
-                    }
-                ))
-            except UnicodeDecodeError:
-                if verbose: print("Skipping", f_path)
+    for f_path in iter_files(path_config):
+        doc = read_doc(f_path, path_config.code_repo_root, verbose)
+        if doc is not None:
+            yield doc
 
-    return docs
+
+def load_docs(path_config: PathConfig, verbose: bool = False) -> list[Document]:
+    """
+    Loads documents from the code repository.
+
+    Args:
+        path_config (PathConfig): Configuration object containing repository paths.
+        verbose (bool): If True, logs skipped files.
+
+    Returns:
+        list[Document]: List of documents loaded from the repository.
+    """
+    return list(iter_docs(path_config, verbose))
 
 
 if __name__ == "__main__":
@@ -1,29 +1,181 @@
-from scheme.config import PathConfig
+import asyncio
+from pathlib import Path
+from typing import NamedTuple
+from functools import lru_cache
 
+from scheme.config import PathConfig, RAGConfig
+from utils.text import tokenize, count_tokens
 
-# Load global path configuration
-path_config = PathConfig()
 
+# Load global configurations for paths and RAG settings
+path_config, rag_config = PathConfig(), RAGConfig()
 
-def make_context_prompt(files: list[str]) -> str:
+
+class Region(NamedTuple):
+    start: int
+    end: int
+    text: str
+    terms: frozenset[str]
+
+
+# The modification time and size are part of the key, so changed files are read again
+@lru_cache(maxsize=rag_config.context_file_cache_size)
+def _split_regions(f_path: Path, mtime_ns: int, size: int, region_lines: int) -> tuple[Region, ...]:
+    """
+    Reads the file and splits it into regions of consecutive lines.
+
+    Args:
+        f_path (Path): Path of the file.
+        mtime_ns (int): Modification time of the file.
+        size (int): Size of the file.
+        region_lines (int): Number of lines per region.
+
+    Returns:
+        tuple[Region, ...]: Regions of the file with their terms.
+    """
+
+    with open(f_path, "r", encoding="utf-8", errors="replace") as f:
+        lines = f.read().splitlines(keepends=True)
+
+    return tuple(
+        Region(
+            start,
+            min(start + region_lines, len(lines)),
+            text := "".join(lines[start:start + region_lines]),
+            frozenset(tokenize(text)),
+        )
+        for start in range(0, len(lines), region_lines)
+    )
+
+
+def _read_regions(f_path: Path, region_lines: int) -> tuple[Region, ...]:
+    try:
+        stat = f_path.stat()
+    except FileNotFoundError:  # Deleted since indexing
+        return ()
+
+    return _split_regions(f_path, stat.st_mtime_ns, stat.st_size, region_lines)
+
+
+def clear_region_cache():
+    # Drops the read files, e.g. before latency measurements
+    _split_regions.cache_clear()
+
+
+def best_region(
+    f_path: Path,
+    terms: set[str],
+    region_lines: int = rag_config.context_region_lines,
+) -> tuple[int, Region] | None:
     """
-    Generates a context prompt by reading the contents of the specified files.
+    Finds the region of a file sharing the most terms with a question (the first one on ties).
 
     Args:
-        files (list[str]): List of file paths relative to the code repository root.
+        f_path (Path): Path of the file.
+        terms (set[str]): Terms of the question.
+        region_lines (int): Number of lines per region.
 
     Returns:
-        str: A string containing the contents of the specified files, formatted as a prompt.
+        tuple[int, Region] | None: Position and the region or None, if the file is empty or missing.
     """
 
-    result = ""
+    regions = _read_regions(f_path, region_lines)
+    if not regions:
+        return None
+
+    i = max(range(len(regions)), key=lambda i: len(terms & regions[i].terms))
+    return i, regions[i]
+
+
+def _render(f_path: str, regions: list[Region], complete: bool) -> str:
+    """
+    Formats the selected regions of a file, merging the adjacent ones.
+
+    Args:
+        f_path (str): Path of the file relative to the code repository root.
+        regions (list[Region]): Selected regions, ordered by their position.
+        complete (bool): True, if all regions of the file were selected.
+
+    Returns:
+        str: The file section of the prompt.
+    """
+
+    if complete:
+        return f"Contents of {f_path}:\n{''.join(r.text for r in regions)}\n\n"
+
+    runs = []
+    for region in regions:
+        if runs and runs[-1][1] == region.start:
+            runs[-1] = (runs[-1][0], region.end, runs[-1][2] + [region.text])
+        else:
+            runs.append((region.start, region.end, [region.text]))
+
+    parts = [f"Excerpts of {f_path}:\n"]
+    for start, end, texts in runs:
+        parts.append(f"[lines {start + 1}-{end}]\n")
+        parts.extend(texts)
+        if not texts[-1].endswith("\n"):
+            parts.append("\n")
+
+    parts.append("\n")
+    return "".join(parts)
+
+
+async def make_context_prompt(
+    files: list[str],
+    question: str = "",
+    token_budget: int = rag_config.context_token_budget,
+    region_lines: int = rag_config.context_region_lines,
+) -> str:
+    """
+    Generates a context prompt from the contents of the specified files. The files are read
+    concurrently (off the event loop) and split into regions of lines; the regions sharing the
+    most terms with the question (ties broken by the file rank) are packed into the token budget.
+
+    Args:
+        files (list[str]): List of file paths relative to the code repository root, best ranked first.
+        question (str): The question the context is assembled for.
+        token_budget (int): Maximum (approximate) number of tokens of the prompt.
+        region_lines (int): Number of lines per region.
+
+    Returns:
+        str: A string containing the selected contents of the specified files, formatted as a prompt.
+    """
+
+    file_regions = await asyncio.gather(*[
+        asyncio.to_thread(_read_regions, path_config.code_repo_root / f_path, region_lines)
+        for f_path in files
+    ])
+
+    query_terms = set(tokenize(question))
+    candidates = sorted(
+        (-len(query_terms & region.terms), rank, i)
+        for rank, regions in enumerate(file_regions)
+        for i, region in enumerate(regions)
+    )
+
+    # Besides its regions, every included file costs its header
+    chosen: dict[int, list[int]] = {}
+    used = 0
+    for _, rank, i in candidates:
+        cost = count_tokens(file_regions[rank][i].text)
+        if rank not in chosen:
+            cost += count_tokens(files[rank]) + 8
+
+        if used + cost > token_budget:
+            continue
 
-    for f_path in files:
-        with open(path_config.code_repo_root / f_path, "r") as f:
-            content = f.read()
-            result += f"""Contents of {f_path}:\n{content}\n\n"""
+        chosen.setdefault(rank, []).append(i)
+        used += cost
 
-    return result
+    return "".join(
+        _render(
+            files[rank],
+            [file_regions[rank][i] for i in sorted(chosen[rank])],
+            complete=len(chosen[rank]) == len(file_regions[rank]),
+        )
+        for rank in sorted(chosen)
+    )
 
 
 if __name__ == "__main__":
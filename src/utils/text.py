@@ -0,0 +1,78 @@
+import re
+
+
+# Identifiers, split further on snake_case and camelCase boundaries
+_WORD = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*|\d+")
+_SUBWORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+MAX_TERM_LENGTH = 64
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Code-aware tokenizer. Identifiers are kept as a whole and additionally split into
+    their snake_case / camelCase parts, so `parseConfig` matches `parse_config` and `config`.
+    Punctuation and operators are dropped.
+
+    Args:
+        text (str): Text to tokenize.
+
+    Returns:
+        list[str]: Lowercased tokens.
+    """
+
+    tokens = []
+    for word in _WORD.findall(text):
+        parts = _SUBWORD.findall(word)
+        if len(parts) > 1:
+            tokens.append(word.lower())
+
+        tokens.extend(part.lower() for part in parts)
+
+    return [t for t in tokens if 1 < len(t) <= MAX_TERM_LENGTH]
+
+
+# Rough number of characters per LLM token in source code
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimates the number of LLM tokens of the text (without running a tokenizer).
+
+    Args:
+        text (str): Text to be measured.
+
+    Returns:
+        int: Approximate number of tokens.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# Code spans of a question and case changes, which only occur in identifiers (`parseConfig`, `HTTPServer`)
+_CODE_SPAN = re.compile(r"`([^`]+)`")
+_CAMEL_CASE = re.compile(r"[a-z0-9][A-Z]|[A-Z][A-Z][a-z]{2}")
+
+
+def identifiers(text: str) -> list[str]:
+    """
+    Finds identifier-like tokens of a (natural language) question: all identifiers of code spans
+    (`...`) and the words, which are written the way only identifiers are (snake_case, camelCase,
+    `call()`). Plain words are not reported, as they are ambiguous.
+
+    Args:
+        text (str): Text to search.
+
+    Returns:
+        list[str]: Unique identifiers (case preserved), in the order of their first occurrence.
+    """
+
+    found = [word for span in _CODE_SPAN.findall(text) for word in _WORD.findall(span)]
+
+    prose = _CODE_SPAN.sub(" ", text)
+    for match in _WORD.finditer(prose):
+        word = match.group()
+        if "_" in word or _CAMEL_CASE.search(word) or prose.startswith("(", match.end()):
+            found.append(word)
+
+    return [w for w in dict.fromkeys(found) if not w.isdigit() and 1 < len(w.strip("_$")) and len(w) <= MAX_TERM_LENGTH]